@@ -0,0 +1,3 @@
+SEQUENCE = [
+    'profile_inbox_built',
+]
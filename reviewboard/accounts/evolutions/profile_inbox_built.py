@@ -0,0 +1,8 @@
+from django.db import models
+
+from django_evolution.mutations import AddField
+
+
+MUTATIONS = [
+    AddField('Profile', 'inbox_built', models.BooleanField, initial=False),
+]
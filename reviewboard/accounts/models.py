@@ -8,6 +8,7 @@ from django.utils.translation import ugettext_lazy as _
 from djblets.util.db import ConcurrencyManager
 from djblets.util.fields import CounterField
 
+from reviewboard.reviews import inbox
 from reviewboard.reviews.models import Group, ReviewRequest
 from reviewboard.site.models import LocalSite
 
@@ -74,6 +75,10 @@ class Profile(models.Model):
     submitter_columns = models.CharField(max_length=256, blank=True)
     group_columns = models.CharField(max_length=256, blank=True)
 
+    # Indicates whether the user's inbox of review requests has been built.
+    # It's built the first time it's needed, and kept up to date after that.
+    inbox_built = models.BooleanField(default=False)
+
     # A list of starred review requests. This allows users to monitor a
     # review request and receive e-mails on updates without actually being
     # on the reviewer list or commenting on the review. This is similar to
@@ -196,3 +201,6 @@ class LocalSiteProfile(models.Model):
 
     def __unicode__(self):
         return '%s (%s)' % (self.user.username, self.local_site)
+
+
+inbox.connect_account_signals()
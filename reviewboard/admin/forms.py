@@ -89,6 +89,26 @@ class GeneralSettingsForm(SiteSettingsForm):
         required=False,
         widget=forms.TextInput(attrs={'size': '50'}))
 
+    scmtools_mirrors_dir = forms.CharField(
+        label=_("Local mirrors directory"),
+        help_text=_("A directory to keep local mirrors of remote Git and "
+                    "Mercurial repositories in. Files are read from the "
+                    "mirrors instead of being fetched over the network. "
+                    "Run 'rb-site manage /path/to/site updatemirrors' "
+                    "periodically to keep them up to date. Leave blank to "
+                    "disable mirrors."),
+        required=False,
+        widget=forms.TextInput(attrs={'size': '50'}))
+
+    updates_long_polling = forms.BooleanField(
+        label=_("Push updates to open pages"),
+        help_text=_("Open review request pages wait on the server for new "
+                    "reviews and updates, instead of checking for them "
+                    "every few minutes. Each open page keeps a request "
+                    "waiting on the server, so only enable this if the web "
+                    "server can handle many long-running requests at once."),
+        required=False)
+
     def load(self):
         # First set some sane defaults.
         domain_method = self.siteconfig.get("site_domain_method")
@@ -105,6 +125,20 @@ class GeneralSettingsForm(SiteSettingsForm):
         super(GeneralSettingsForm, self).load()
 
 
+    def clean_scmtools_mirrors_dir(self):
+        """Validates that the scmtools_mirrors_dir path is valid."""
+        mirrors_dir = self.cleaned_data['scmtools_mirrors_dir']
+
+        if mirrors_dir:
+            if not os.path.isdir(mirrors_dir):
+                raise forms.ValidationError(_("This is not a directory."))
+
+            if not os.access(mirrors_dir, os.W_OK):
+                raise forms.ValidationError(
+                    _("This path is not writable by the web server."))
+
+        return mirrors_dir
+
     def save(self):
         server = self.cleaned_data['server']
 
@@ -150,6 +184,16 @@ class GeneralSettingsForm(SiteSettingsForm):
                 'title':   _("Search"),
                 'fields':  ('search_enable', 'search_index_file'),
             },
+            {
+                'classes': ('wide',),
+                'title':   _("Repositories"),
+                'fields':  ('scmtools_mirrors_dir',),
+            },
+            {
+                'classes': ('wide',),
+                'title':   _("Updates"),
+                'fields':  ('updates_long_polling',),
+            },
         )
 
 
@@ -572,12 +616,41 @@ class DiffSettingsForm(SiteSettingsForm):
                     "whitespace changes should be shown. "
                     "(e.g., \"*.py, *.txt\")"))
 
+    summary_only_patterns = forms.CharField(
+        label=_("Show only a summary for"),
+        required=False,
+        help_text=_("A comma-separated list of file patterns for generated "
+                    "files, which will be shown only as a summary unless "
+                    "the full diff is requested. "
+                    "(e.g., \"*.min.js, *.lock\")"))
+
+    diffviewer_max_diff_size = forms.IntegerField(
+        label=_("Maximum diff size"),
+        help_text=_("Files with diffs larger than this number of bytes will "
+                    "be shown only as a summary unless the full diff is "
+                    "requested. Enter 0 for no limit."),
+        initial=2 * 1024 * 1024)
+
+    diffviewer_max_diff_lines = forms.IntegerField(
+        label=_("Maximum diff lines"),
+        help_text=_("Files with diffs longer than this number of lines will "
+                    "be shown only as a summary unless the full diff is "
+                    "requested. Enter 0 for no limit."),
+        initial=20000)
+
     diffviewer_context_num_lines = forms.IntegerField(
         label=_("Lines of Context"),
         help_text=_("The number of unchanged lines shown above and below "
                     "changed lines."),
         initial=5)
 
+    diffviewer_max_diff_time = forms.IntegerField(
+        label=_("Maximum diff time"),
+        help_text=_("The number of seconds to spend computing the diff of a "
+                    "file before falling back on a faster, approximate "
+                    "diff. Enter 0 for no limit."),
+        initial=10)
+
     diffviewer_paginate_by = forms.IntegerField(
         label=_("Paginate by"),
         help_text=_("The number of files to display per page in the diff "
@@ -603,19 +676,25 @@ class DiffSettingsForm(SiteSettingsForm):
 
         self.fields['include_space_patterns'].initial = \
             ', '.join(self.siteconfig.get('diffviewer_include_space_patterns'))
+        self.fields['summary_only_patterns'].initial = \
+            ', '.join(self.siteconfig.get('diffviewer_summary_only_patterns'))
 
         super(DiffSettingsForm, self).load()
 
     def save(self):
         self.siteconfig.set('diffviewer_include_space_patterns',
             re.split(r",\s*", self.cleaned_data['include_space_patterns']))
+        self.siteconfig.set('diffviewer_summary_only_patterns',
+            [pattern for pattern in
+             re.split(r",\s*", self.cleaned_data['summary_only_patterns'])
+             if pattern])
 
         super(DiffSettingsForm, self).save()
 
 
     class Meta:
         title = _("Diff Viewer Settings")
-        save_blacklist = ('include_space_patterns',)
+        save_blacklist = ('include_space_patterns', 'summary_only_patterns')
         fieldsets = (
             {
                 'title': _("General"),
@@ -623,7 +702,10 @@ class DiffSettingsForm(SiteSettingsForm):
                 'fields': ('diffviewer_syntax_highlighting',
                            'diffviewer_syntax_highlighting_threshold',
                            'diffviewer_show_trailing_whitespace',
-                           'include_space_patterns'),
+                           'include_space_patterns',
+                           'summary_only_patterns',
+                           'diffviewer_max_diff_size',
+                           'diffviewer_max_diff_lines'),
             },
             {
                 'title': _("Advanced"),
@@ -634,6 +716,7 @@ class DiffSettingsForm(SiteSettingsForm):
                 ),
                 'classes': ('wide',),
                 'fields': ('diffviewer_context_num_lines',
+                           'diffviewer_max_diff_time',
                            'diffviewer_paginate_by',
                            'diffviewer_paginate_orphans')
             }
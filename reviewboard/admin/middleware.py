@@ -5,14 +5,68 @@ from django.conf import settings
 from django.contrib import auth
 from django.core.handlers.modpython import ModPythonRequest
 from django.core.handlers.wsgi import WSGIRequest
+from django.middleware import gzip, http
+from django.utils.http import http_date
 
 
 from reviewboard.admin.checks import check_updates_required
 from reviewboard.admin.siteconfig import auth_backend_map, load_site_config
 from reviewboard.admin.views import manual_updates_required
+from reviewboard.reviews import access
 from reviewboard.webapi.json import service_not_configured
 
 
+class GZipMiddleware(gzip.GZipMiddleware):
+    """
+    Middleware that compresses content if the browser allows it.
+
+    This works like Django's GZipMiddleware, but leaves streaming responses
+    alone. Compressing them would require reading the entire content into
+    memory. Views that stream content handle compression themselves.
+    """
+    def process_response(self, request, response):
+        if getattr(response, 'streaming', False):
+            return response
+
+        return super(GZipMiddleware, self).process_response(request,
+                                                            response)
+
+
+class ConditionalGetMiddleware(http.ConditionalGetMiddleware):
+    """
+    Middleware that handles conditional GET operations.
+
+    This works like Django's ConditionalGetMiddleware, but doesn't compute a
+    Content-Length for streaming responses, since that would require
+    reading the entire content into memory. Views that stream content must
+    check for conditional requests themselves.
+    """
+    def process_response(self, request, response):
+        if getattr(response, 'streaming', False):
+            response['Date'] = http_date()
+            return response
+
+        return super(ConditionalGetMiddleware, self).process_response(
+            request, response)
+
+
+class AccessCacheMiddleware(object):
+    """
+    Middleware that caches the review groups and repositories users have
+    access to for the duration of each request.
+
+    Many access checks may be made while handling a request, particularly
+    for lists of review requests and resources nested under a review
+    request. This lets them share the lookups.
+    """
+    def process_request(self, request):
+        access.start_request_cache()
+
+    def process_response(self, request, response):
+        access.end_request_cache()
+        return response
+
+
 class LoadSettingsMiddleware:
     """
     Middleware that loads the settings on each request.
@@ -125,14 +125,21 @@ defaults.update({
     'auth_x509_autocreate_users':          False,
     'diffviewer_context_num_lines':        5,
     'diffviewer_include_space_patterns':   [],
+    'diffviewer_max_diff_lines':           20000,
+    'diffviewer_max_diff_size':            2 * 1024 * 1024,
+    'diffviewer_max_diff_time':            10,
     'diffviewer_paginate_by':              20,
     'diffviewer_paginate_orphans':         10,
     'diffviewer_syntax_highlighting':      True,
     'diffviewer_syntax_highlighting_threshold': 0,
     'diffviewer_show_trailing_whitespace': True,
+    'diffviewer_summary_only_patterns':    ['*.min.js', '*.min.css',
+                                            '*.lock', 'package-lock.json'],
     'mail_send_review_mail':               False,
+    'scmtools_mirrors_dir':                '',
     'search_enable':                       False,
     'site_domain_method':                  'http',
+    'updates_long_polling':                False,
 
     # TODO: Allow relative paths for the index file later on.
     'search_index_file': os.path.join(settings.REVIEWBOARD_ROOT,
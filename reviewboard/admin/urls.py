@@ -36,6 +36,8 @@ NEWS_FEED = "http://www.reviewboard.org/news/feed/"
 urlpatterns = patterns('reviewboard.admin.views',
     (r'^$', 'dashboard'),
     (r'^cache/$', 'cache_stats'),
+    (r'^repositories/performance/$', 'scm_metrics'),
+    (r'^repositories/performance/json/$', 'scm_metrics_json'),
 
     # Settings
     url(r'^settings/general/$', 'site_settings',
@@ -2,16 +2,21 @@ from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.core.cache import cache
+from django.http import HttpResponse
 from django.shortcuts import render_to_response
 from django.template.context import RequestContext
 from django.template.loader import render_to_string
+from django.utils import simplejson
 from django.utils.translation import ugettext as _
 from djblets.siteconfig.views import site_settings as djblets_site_settings
 
 from reviewboard.admin.checks import check_updates_required
 from reviewboard.admin.cache_stats import get_cache_stats, get_has_cache_stats
 from reviewboard.reviews.models import Group, DefaultReviewer
-from reviewboard.scmtools.models import Repository
+from reviewboard.scmtools.metrics import LATENCY_BUCKETS, OPERATIONS, \
+                                         get_metrics, get_repository_scope, \
+                                         get_tool_scope
+from reviewboard.scmtools.models import Repository, Tool
 
 
 @staff_member_required
@@ -47,6 +52,76 @@ def cache_stats(request, template_name="admin/cache_stats.html"):
     }))
 
 
+def _get_scm_metrics():
+    """
+    Returns the repositories and tools, each with its SCMTool metrics.
+    """
+    repositories = list(Repository.objects.select_related('tool'))
+    tools = list(Tool.objects.all())
+    metrics = get_metrics(
+        [get_repository_scope(repository) for repository in repositories] +
+        [get_tool_scope(tool.name) for tool in tools])
+
+    return ([(repository, metrics[get_repository_scope(repository)])
+             for repository in repositories],
+            [(tool, metrics[get_tool_scope(tool.name)]) for tool in tools])
+
+
+@staff_member_required
+def scm_metrics(request, template_name="admin/scm_metrics.html"):
+    """
+    Displays the number of calls made to each repository, along with how
+    long they took and how many failed. This helps to find a repository
+    that's slowing down the diff viewer.
+    """
+    repositories, tools = _get_scm_metrics()
+
+    def get_rows(metrics):
+        return [dict(metrics[operation],
+                     operation=operation,
+                     error_percent=metrics[operation]['error_rate'] * 100)
+                for operation in OPERATIONS]
+
+    latency_labels = [u'\u2264 %ss' % bound for bound in LATENCY_BUCKETS] + \
+                     [u'> %ss' % LATENCY_BUCKETS[-1]]
+
+    return render_to_response(template_name, RequestContext(request, {
+        'repositories': [(repository.name, get_rows(metrics))
+                         for repository, metrics in repositories],
+        'tools': [(tool.name, get_rows(metrics)) for tool, metrics in tools],
+        'latency_labels': latency_labels,
+        'title': _("Repository Performance"),
+        'root_path': settings.SITE_ROOT + "admin/db/"
+    }))
+
+
+@staff_member_required
+def scm_metrics_json(request):
+    """
+    Returns the metrics shown by scm_metrics as JSON, for monitoring tools.
+    """
+    repositories, tools = _get_scm_metrics()
+
+    return HttpResponse(simplejson.dumps({
+        'repositories': [
+            {
+                'id': repository.pk,
+                'name': repository.name,
+                'tool': repository.tool.name,
+                'operations': metrics,
+            }
+            for repository, metrics in repositories
+        ],
+        'tools': [
+            {
+                'name': tool.name,
+                'operations': metrics,
+            }
+            for tool, metrics in tools
+        ],
+    }), mimetype='application/json')
+
+
 @staff_member_required
 def site_settings(request, form_class,
                   template_name="siteconfig/settings.html"):
@@ -1,10 +1,20 @@
 import fnmatch
+import logging
 import os
 import re
 import subprocess
+import sys
 import tempfile
+import threading
+import time
+from bisect import bisect_right
 from difflib import SequenceMatcher
 
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import sha as sha1
+
 try:
     import pygments
     from pygments.lexers import get_lexer_for_filename
@@ -13,6 +23,8 @@ try:
 except ImportError:
     pass
 
+from django.conf import settings
+from django.core.cache import cache
 from django.utils.html import escape
 from django.utils.http import urlquote
 from django.utils.safestring import mark_safe
@@ -20,13 +32,15 @@ from django.utils.translation import ugettext as _
 
 from djblets.log import log_timed
 from djblets.siteconfig.models import SiteConfiguration
-from djblets.util.misc import cache_memoize
+from djblets.util.misc import cache_memoize, make_cache_key
 
 from reviewboard.accounts.models import Profile
 from reviewboard.admin.checks import get_can_enable_syntax_highlighting
+from reviewboard.diffviewer.models import FileDiff
 from reviewboard.diffviewer.myersdiff import MyersDiffer
 from reviewboard.diffviewer.smdiff import SMDiffer
 from reviewboard.scmtools.core import PRE_CREATION, HEAD
+from reviewboard.scmtools.errors import SCMError, SCMTimeoutError
 
 
 DEFAULT_DIFF_COMPAT_VERSION = 1
@@ -133,6 +147,29 @@ HEADER_REGEX_ALIASES = {
 }
 
 
+# Original files being fetched in background threads, keyed by the cache
+# key for the file.
+_pending_fetches = {}
+_pending_fetches_lock = threading.Lock()
+
+# The number of background fetches running for each repository, keyed by
+# repository ID. This includes fetches that have been replaced.
+_repository_fetch_counts = {}
+
+# The number of seconds after which a background fetch is assumed to be
+# hung. Requests for the file then start a new fetch instead of waiting on
+# it. Command line tools are killed after the repository's timeout, so
+# this only matters for tools that fetch in-process.
+MAX_FETCH_AGE = 5 * 60
+
+# The maximum number of background fetches running at once for each
+# repository. This bounds the threads tied up by a repository that hangs.
+MAX_FETCHES_PER_REPOSITORY = 8
+
+# The time by which the current request must have fetched its files.
+_fetch_deadline = threading.local()
+
+
 class UserVisibleError(Exception):
     pass
 
@@ -157,16 +194,40 @@ class NoWrapperHtmlFormatter(HtmlFormatter):
                 yield tup
 
 
+def split_lines(data):
+    """
+    Returns a list of the lines in a version of a file, without their line
+    endings.
+
+    The old and new versions of a file being diffed are each split once,
+    and the lists are shared by the differ, whitespace and move detection,
+    and chunk generation. Identical lines share one string. The differ
+    still assigns the line codes.
+    """
+    lines = NEWLINES_RE.split(data)
+
+    # The last line is empty if the data ends with a newline.
+    if not lines[-1]:
+        del lines[-1]
+
+    unique_lines = {}
+
+    return [unique_lines.setdefault(line, line) for line in lines]
+
+
 def Differ(a, b, ignore_space=False,
-           compat_version=DEFAULT_DIFF_COMPAT_VERSION):
+           compat_version=DEFAULT_DIFF_COMPAT_VERSION, max_time=None):
     """
     Factory wrapper for returning a differ class based on the compat version
     and flags specified.
+
+    If ``max_time`` is specified, differs that support it will fall back on
+    a cheaper, approximate diff after that many seconds.
     """
     if compat_version == 0:
         return SMDiffer(a, b)
     elif compat_version == 1:
-        return MyersDiffer(a, b, ignore_space)
+        return MyersDiffer(a, b, ignore_space, max_time=max_time)
     else:
         raise DiffCompatError(
             "Invalid diff compatibility version (%s) passed to Differ" %
@@ -326,6 +387,59 @@ def convert_to_utf8(s, enc):
         raise TypeError("Value to convert is unexpected type %s", type(s))
 
 
+def decode_file_data(s, enc, encoding=None):
+    """
+    Returns the passed string decoded to unicode, along with the name of
+    the encoding that was used.
+
+    If ``encoding`` is provided, it's tried first. Otherwise, or if that
+    fails, UTF-8 is tried, followed by each encoding in the comma-separated
+    list of encodings in ``enc``, as with convert_to_utf8.
+    """
+    if isinstance(s, unicode):
+        return s, 'utf-8'
+    elif not isinstance(s, basestring):
+        raise TypeError("Value to convert is unexpected type %s", type(s))
+
+    encodings = ['utf-8'] + enc.split(',')
+
+    if encoding:
+        encodings.insert(0, encoding)
+
+    for e in encodings:
+        try:
+            return unicode(s, e), e
+        except UnicodeError:
+            pass
+
+    raise Exception(_("Diff content couldn't be converted to UTF-8 "
+                      "using the following encodings: %s") % enc)
+
+
+def get_original_file_cache_key(filediff):
+    """
+    Returns the cache key for the original version of a file in a FileDiff.
+    """
+    return "%s:%s:%s" % (filediff.diffset.repository.path,
+                         urlquote(filediff.source_file),
+                         filediff.source_revision)
+
+
+def get_original_file_encoding(filediff):
+    """
+    Returns the encoding of the original version of a file in a FileDiff.
+
+    The encoding is detected when the file is fetched from the repository,
+    and cached for its repository, path and revision. This is None if the
+    file is new, or if the encoding isn't in the cache.
+    """
+    if filediff.source_revision == PRE_CREATION:
+        return None
+
+    return cache.get(make_cache_key(
+        '%s:encoding' % get_original_file_cache_key(filediff)))
+
+
 def get_original_file(filediff):
     """
     Get a file either from the cache or the SCM, applying the parent diff if
@@ -342,6 +456,18 @@ def get_original_file(filediff):
             data = tool.get_file(file, revision)
             data = convert_line_endings(data)
             log_timer.done()
+
+            # Detect the file's encoding now, so that renders of the diff
+            # can decode it without trying each encoding in turn.
+            try:
+                encoding = decode_file_data(
+                    data, repository.encoding or 'iso-8859-15')[1]
+                cache_memoize('%s:encoding' % key, lambda: encoding,
+                              force_overwrite=True)
+            except Exception:
+                # The render will report that the file can't be decoded.
+                pass
+
             return data
 
         repository = filediff.diffset.repository
@@ -349,8 +475,7 @@ def get_original_file(filediff):
         file = filediff.source_file
         revision = filediff.source_revision
 
-        key = "%s:%s:%s" % (filediff.diffset.repository.path, urlquote(file),
-                            revision)
+        key = get_original_file_cache_key(filediff)
 
         # We wrap the result of get_file in a list and then return the first
         # element after getting the result from the cache. This prevents the
@@ -360,8 +485,17 @@ def get_original_file(filediff):
         #
         # Basically, this fixes the massive regressions introduced by the
         # Django unicode changes.
-        data = cache_memoize(key, lambda: [fetch_file(file, revision)],
-                             large_data=True)[0]
+        #
+        # The file is fetched in another thread, so that a slow repository
+        # can't hold up the request past its deadline. If it does time out,
+        # the fetch carries on and caches the file for the next request.
+        data = cache_memoize(
+            key,
+            lambda: [fetch_with_timeout(key,
+                                        lambda: fetch_file(file, revision),
+                                        get_fetch_timeout(repository),
+                                        file, revision, repository.pk)],
+            large_data=True)[0]
 
     # If there's a parent diff set, apply it to the buffer.
     if filediff.parent_diff:
@@ -370,6 +504,175 @@ def get_original_file(filediff):
     return data
 
 
+def set_fetch_deadline(deadline):
+    """
+    Sets the time, in seconds since the epoch, by which the current thread
+    must have fetched any original files it needs.
+
+    Views set this at the start of a request, so that a request fetching
+    several files from a slow repository gives up on all of them at once,
+    rather than waiting for each in turn. Passing None clears the deadline.
+    """
+    _fetch_deadline.deadline = deadline
+
+
+def get_fetch_timeout(repository):
+    """
+    Returns the number of seconds to wait for a file from a repository.
+
+    This is the repository's timeout, or the time left until the current
+    thread's deadline if that's sooner.
+    """
+    timeout = repository.get_timeout()
+    deadline = getattr(_fetch_deadline, 'deadline', None)
+
+    if deadline is not None:
+        timeout = max(min(timeout, deadline - time.time()), 0)
+
+    return timeout
+
+
+class _PendingFetch(threading.Thread):
+    """
+    Fetches an original file in the background.
+
+    If nothing is waiting for the file when it's fetched, it's stored in the
+    cache so that the next request for it doesn't need to fetch it again.
+    """
+    def __init__(self, key, fetch_func, repository_id=None):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self.key = key
+        self.fetch_func = fetch_func
+        self.repository_id = repository_id
+        self.finished = threading.Event()
+        self.started = time.time()
+        self.abandoned = False
+        self.data = None
+        self.exc_info = None
+
+    def run(self):
+        try:
+            self.data = self.fetch_func()
+        except Exception:
+            self.exc_info = sys.exc_info()
+
+        _pending_fetches_lock.acquire()
+
+        try:
+            # A newer fetch replaces this one if it took too long. That
+            # fetch then caches the file instead.
+            replaced = _pending_fetches.get(self.key) is not self
+
+            if not replaced:
+                del _pending_fetches[self.key]
+
+            if self.repository_id is not None:
+                count = _repository_fetch_counts[self.repository_id] - 1
+
+                if count:
+                    _repository_fetch_counts[self.repository_id] = count
+                else:
+                    del _repository_fetch_counts[self.repository_id]
+
+            self.finished.set()
+            abandoned = self.abandoned
+        finally:
+            _pending_fetches_lock.release()
+
+        if not abandoned or replaced:
+            return
+
+        if self.exc_info:
+            logging.error("Error fetching %s in the background: %s",
+                          self.key, self.exc_info[1],
+                          exc_info=self.exc_info)
+        else:
+            cache_memoize(self.key, lambda: [self.data], large_data=True,
+                          force_overwrite=True)
+
+
+def fetch_with_timeout(key, fetch_func, timeout, path, revision,
+                       repository_id=None):
+    """
+    Fetches a file, waiting at most ``timeout`` seconds for it.
+
+    ``fetch_func`` is called in a background thread. Only one fetch runs
+    for each cache key at a time, and later callers wait on the fetch
+    that's already running. A fetch running for longer than MAX_FETCH_AGE
+    seconds is assumed to be hung, and is replaced by a new one.
+
+    If ``repository_id`` is given, at most MAX_FETCHES_PER_REPOSITORY
+    fetches run at once for the repository. SCMError is raised if a new
+    fetch would go over that.
+
+    If the file takes too long, SCMTimeoutError is raised. The fetch is
+    left to finish in the background, and stores the file under ``key`` in
+    the cache, so that it's there when the user tries again.
+    """
+    _pending_fetches_lock.acquire()
+
+    try:
+        fetch = _pending_fetches.get(key)
+
+        if fetch is None or time.time() - fetch.started > MAX_FETCH_AGE:
+            if repository_id is not None:
+                count = _repository_fetch_counts.get(repository_id, 0)
+
+                if count >= MAX_FETCHES_PER_REPOSITORY:
+                    raise SCMError(_("Too many files are being fetched from "
+                                     "the repository. Reload the page to "
+                                     "try again."))
+
+                _repository_fetch_counts[repository_id] = count + 1
+
+            fetch = _PendingFetch(key, fetch_func, repository_id)
+            _pending_fetches[key] = fetch
+            fetch.start()
+    finally:
+        _pending_fetches_lock.release()
+
+    fetch.finished.wait(timeout)
+
+    _pending_fetches_lock.acquire()
+
+    try:
+        if not fetch.finished.isSet():
+            fetch.abandoned = True
+            raise SCMTimeoutError(path, revision, timeout)
+    finally:
+        _pending_fetches_lock.release()
+
+    if fetch.exc_info:
+        raise fetch.exc_info[0], fetch.exc_info[1], fetch.exc_info[2]
+
+    return fetch.data
+
+
+def prefetch_original_files(repository, filediffs):
+    """
+    Lets the repository's SCMTool prepare for fetching the original files
+    of the given FileDiffs.
+
+    This is done when a diff is first viewed, before the files are fetched
+    for each file's fragment. Failures are only logged, since the files
+    will still be fetched one at a time.
+    """
+    files = [(filediff.source_file, filediff.source_revision)
+             for filediff in filediffs
+             if (filediff.source_revision != PRE_CREATION and
+                 not filediff.binary and not filediff.deleted)]
+
+    if not files:
+        return
+
+    try:
+        repository.get_scmtool().prefetch_files(files)
+    except Exception, e:
+        logging.warning("Unable to prefetch files from repository %s: %s",
+                        repository, e)
+
+
 def get_patched_file(buffer, filediff):
     return patch(filediff.diff, buffer, filediff.dest_file)
 
@@ -397,6 +700,177 @@ def register_interesting_lines_for_filename(differ, filename):
         differ.add_interesting_line_regex('header', regex)
 
 
+def apply_pygments(data, filename):
+    # XXX Guessing is preferable but really slow, especially on XML
+    #     files.
+    #if filename.endswith(".xml"):
+    lexer = get_lexer_for_filename(filename, stripnl=False,
+                                   encoding='utf-8')
+    #else:
+    #    lexer = guess_lexer_for_filename(filename, data, stripnl=False)
+
+    try:
+        # This is only available in 0.7 and higher
+        lexer.add_filter('codetagify')
+    except AttributeError:
+        pass
+
+    return pygments.highlight(data, lexer, NoWrapperHtmlFormatter()).splitlines()
+
+
+def _load_file_lines(diffset, filediff, interfilediff, force_interdiff,
+                     enable_syntax_highlighting):
+    """
+    Loads the old and new versions of a file being diffed.
+
+    This returns a tuple of the lines of the old and new files and
+    lists of the rendered HTML for each of their lines. See get_chunks for
+    the meanings of the arguments.
+    """
+    old = get_original_file(filediff)
+    new = get_patched_file(old, filediff)
+
+    # The encoding detected for the original file is tried first for each
+    # version of it.
+    encoding = diffset.repository.encoding or 'iso-8859-15'
+    file_encoding = get_original_file_encoding(filediff)
+
+    if interfilediff:
+        old = decode_file_data(new, encoding, file_encoding)[0]
+        interdiff_orig = get_original_file(interfilediff)
+        new = decode_file_data(get_patched_file(interdiff_orig,
+                                                interfilediff),
+                               encoding,
+                               get_original_file_encoding(interfilediff))[0]
+    else:
+        old = decode_file_data(old, encoding, file_encoding)[0]
+        new = decode_file_data(new, encoding, file_encoding)[0]
+
+        if force_interdiff:
+            # Basically, revert the change.
+            old, new = new, old
+
+    # Normalize the input so that if there isn't a trailing newline, we add
+    # it.
+    if old and old[-1] != '\n':
+        old += '\n'
+
+    if new and new[-1] != '\n':
+        new += '\n'
+
+    a = split_lines(old or '')
+    b = split_lines(new or '')
+
+    markup_a = markup_b = None
+
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    threshold = siteconfig.get('diffviewer_syntax_highlighting_threshold')
+
+    if threshold and (len(a) > threshold or len(b) > threshold):
+        enable_syntax_highlighting = False
+
+    if enable_syntax_highlighting:
+        repository = filediff.diffset.repository
+        tool = repository.get_scmtool()
+        source_file = tool.normalize_path_for_display(filediff.source_file)
+        dest_file = tool.normalize_path_for_display(filediff.dest_file)
+        try:
+            # TODO: Try to figure out the right lexer for these files
+            #       once instead of twice.
+            markup_a = apply_pygments(old or '', source_file)
+            markup_b = apply_pygments(new or '', dest_file)
+        except ValueError:
+            pass
+
+    if not markup_a:
+        markup_a = [escape(line) for line in a]
+
+    if not markup_b:
+        markup_b = [escape(line) for line in b]
+
+    return a, b, markup_a[:len(a)], markup_b[:len(b)]
+
+
+def get_diff_file_key(filediff, interfilediff, force_interdiff):
+    """
+    Returns the part of a cache key identifying a file being diffed.
+    """
+    if not force_interdiff:
+        return str(filediff.id)
+    elif interfilediff:
+        return "interdiff-%s-%s" % (filediff.id, interfilediff.id)
+    else:
+        return "interdiff-%s-none" % filediff.id
+
+
+def get_file_lines_cache_key(filediff, interfilediff, force_interdiff,
+                             enable_syntax_highlighting):
+    """
+    Returns the cache key for the rendered lines of a file being diffed.
+    """
+    key = "diff-lines-"
+
+    if enable_syntax_highlighting:
+        key += "hl-"
+
+    return key + get_diff_file_key(filediff, interfilediff, force_interdiff)
+
+
+def get_file_lines(filediff, interfilediff, force_interdiff,
+                   enable_syntax_highlighting):
+    """
+    Returns the rendered lines of the old and new versions of a file.
+
+    The result is a list of two lists containing the HTML for each line
+    of the old and new files, indexed by line number minus one. These are
+    the same lines used to build the chunks, and are cached when the
+    chunks are generated, so more context around a chunk can be shown
+    without loading the chunks for the file.
+    """
+    return cache_memoize(
+        get_file_lines_cache_key(filediff, interfilediff, force_interdiff,
+                                 enable_syntax_highlighting),
+        lambda: list(_load_file_lines(filediff.diffset, filediff,
+                                      interfilediff, force_interdiff,
+                                      enable_syntax_highlighting)[2:]),
+        large_data=True)
+
+
+def get_file_lines_in_range(file_lines, first_line, old_first_line,
+                            new_first_line, num_lines):
+    """
+    Returns lines of unchanged context from the rendered lines of a file.
+
+    ``file_lines`` is the result of get_file_lines. The lines returned
+    start at ``old_first_line`` in the old file and ``new_first_line`` in
+    the new file (both 1-based), and are numbered in the diff starting at
+    ``first_line``. At most ``num_lines`` lines are returned, stopping at
+    the end of either file.
+
+    The lines are in the same form as the lines in a chunk.
+    """
+    markup_a, markup_b = file_lines
+
+    if old_first_line < 1 or new_first_line < 1 or num_lines < 0:
+        return []
+
+    num_lines = max(min(num_lines,
+                        len(markup_a) - old_first_line + 1,
+                        len(markup_b) - new_first_line + 1),
+                    0)
+
+    return [
+        [first_line + i,
+         old_first_line + i, mark_safe(markup_a[old_first_line + i - 1]),
+         [],
+         new_first_line + i, mark_safe(markup_b[new_first_line + i - 1]),
+         [],
+         False]
+        for i in xrange(num_lines)
+    ]
+
+
 def get_chunks(diffset, filediff, interfilediff, force_interdiff,
                enable_syntax_highlighting):
     def diff_line(vlinenum, oldlinenum, newlinenum, oldline, newline,
@@ -434,6 +908,11 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
         meta['left_headers'] = left_headers
         meta['right_headers'] = right_headers
 
+        if getattr(differ, 'approximate', False):
+            # The differ gave up on finding the best diff, so this chunk
+            # may show more changes than there really are.
+            meta['approximate'] = True
+
         if left_headers:
             last_header[0] = left_headers[-1][1]
 
@@ -491,24 +970,6 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
         else:
             last_header_index[0] = last_index
 
-    def apply_pygments(data, filename):
-        # XXX Guessing is preferable but really slow, especially on XML
-        #     files.
-        #if filename.endswith(".xml"):
-        lexer = get_lexer_for_filename(filename, stripnl=False,
-                                       encoding='utf-8')
-        #else:
-        #    lexer = guess_lexer_for_filename(filename, data, stripnl=False)
-
-        try:
-            # This is only available in 0.7 and higher
-            lexer.add_filter('codetagify')
-        except AttributeError:
-            pass
-
-        return pygments.highlight(data, lexer, NoWrapperHtmlFormatter()).splitlines()
-
-
     # There are three ways this function is called:
     #
     #     1) filediff, no interfilediff
@@ -545,68 +1006,27 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
 
     file = filediff.source_file
 
-    old = get_original_file(filediff)
-    new = get_patched_file(old, filediff)
+    a, b, markup_a, markup_b = _load_file_lines(diffset, filediff,
+                                                interfilediff,
+                                                force_interdiff,
+                                                enable_syntax_highlighting)
 
-    if interfilediff:
-        old = new
-        interdiff_orig = get_original_file(interfilediff)
-        new = get_patched_file(interdiff_orig, interfilediff)
-    elif force_interdiff:
-        # Basically, revert the change.
-        old, new = new, old
+    # Store the rendered lines, so that more context can later be shown
+    # from them without loading the chunks. See get_file_lines. They're
+    # only stored if they aren't cached already.
+    lines_key = get_file_lines_cache_key(filediff, interfilediff,
+                                         force_interdiff,
+                                         enable_syntax_highlighting)
 
-    encoding = diffset.repository.encoding or 'iso-8859-15'
-    old = convert_to_utf8(old, encoding)
-    new = convert_to_utf8(new, encoding)
-
-    # Normalize the input so that if there isn't a trailing newline, we add
-    # it.
-    if old and old[-1] != '\n':
-        old += '\n'
-
-    if new and new[-1] != '\n':
-        new += '\n'
-
-    a = NEWLINES_RE.split(old or '')
-    b = NEWLINES_RE.split(new or '')
-
-    # Remove the trailing newline, now that we've split this. This will
-    # prevent a duplicate line number at the end of the diff.
-    del(a[-1])
-    del(b[-1])
+    if not cache.has_key(make_cache_key(lines_key)):
+        cache_memoize(lines_key, lambda: [markup_a, markup_b],
+                      force_overwrite=True, large_data=True)
 
     a_num_lines = len(a)
     b_num_lines = len(b)
 
-    markup_a = markup_b = None
-
     siteconfig = SiteConfiguration.objects.get_current()
 
-    threshold = siteconfig.get('diffviewer_syntax_highlighting_threshold')
-
-    if threshold and (a_num_lines > threshold or b_num_lines > threshold):
-        enable_syntax_highlighting = False
-
-    if enable_syntax_highlighting:
-        repository = filediff.diffset.repository
-        tool = repository.get_scmtool()
-        source_file = tool.normalize_path_for_display(filediff.source_file)
-        dest_file = tool.normalize_path_for_display(filediff.dest_file)
-        try:
-            # TODO: Try to figure out the right lexer for these files
-            #       once instead of twice.
-            markup_a = apply_pygments(old or '', source_file)
-            markup_b = apply_pygments(new or '', dest_file)
-        except ValueError:
-            pass
-
-    if not markup_a:
-        markup_a = NEWLINES_RE.split(escape(old))
-
-    if not markup_b:
-        markup_b = NEWLINES_RE.split(escape(new))
-
     linenum = 1
     last_header = [None, None]
     last_header_index = [0, 0]
@@ -618,7 +1038,8 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
             break
 
     differ = Differ(a, b, ignore_space=ignore_space,
-                    compat_version=diffset.diffcompat)
+                    compat_version=diffset.diffcompat,
+                    max_time=siteconfig.get('diffviewer_max_diff_time') or None)
 
     # Register any regexes for interesting lines we may want to show.
     register_interesting_lines_for_filename(differ, file)
@@ -666,6 +1087,11 @@ def get_chunks(diffset, filediff, interfilediff, force_interdiff,
 
         linenum += numlines
 
+    if getattr(differ, 'approximate', False):
+        logging.warning("Diff for filediff id %s (%s) took too long to "
+                        "compute. An approximate diff was generated instead."
+                        % (filediff.id, filediff.source_file))
+
     log_timer.done()
 
 
@@ -912,9 +1338,71 @@ def get_revision_str(revision):
         return "Revision %s" % revision
 
 
+def get_diff_line_counts(diff):
+    """
+    Returns the number of inserted and deleted lines in a diff.
+
+    This is a cheap estimate based on the lines of the diff itself, used
+    for files that are only shown as a summary.
+    """
+    num_inserts = num_deletes = 0
+
+    for line in diff.splitlines():
+        if line.startswith('+'):
+            if not line.startswith('+++ '):
+                num_inserts += 1
+        elif line.startswith('-'):
+            if not line.startswith('--- '):
+                num_deletes += 1
+
+    return num_inserts, num_deletes
+
+
+def is_large_file(filediff):
+    """
+    Returns whether a FileDiff should only be shown as a summary.
+
+    This is the case if the diff is larger than the configured size or
+    number of lines, or if the file matches one of the configured patterns
+    for generated files (such as minified JavaScript or lockfiles). Such
+    files are expensive to fetch, diff and render, and are rarely worth
+    reviewing line by line.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    max_size = siteconfig.get('diffviewer_max_diff_size')
+
+    if max_size and len(filediff.diff) > max_size:
+        return True
+
+    max_lines = siteconfig.get('diffviewer_max_diff_lines')
+
+    if max_lines and filediff.diff.count('\n') > max_lines:
+        return True
+
+    for filename in (filediff.source_file, filediff.dest_file):
+        basename = os.path.basename(filename)
+
+        for pattern in siteconfig.get('diffviewer_summary_only_patterns'):
+            if (fnmatch.fnmatch(filename, pattern) or
+                fnmatch.fnmatch(basename, pattern)):
+                return True
+
+    return False
+
+
 def get_diff_files(diffset, filediff=None, interdiffset=None,
                    enable_syntax_highlighting=True,
-                   load_chunks=True):
+                   load_chunks=True, summarize_large_files=False):
+    """
+    Returns information on the files in a diffset or interdiff.
+
+    If ``summarize_large_files`` is True, files that are too large or are
+    generated (see is_large_file) will have ``summary_only`` set, and will
+    only include the number of inserted and deleted lines in
+    ``num_inserts`` and ``num_deletes``. Their chunks are not loaded, even
+    if ``load_chunks`` is True.
+    """
     if filediff:
         filediffs = [filediff]
 
@@ -947,11 +1435,6 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
                filediff.source_file == interfilediff.source_file:
                 interdiff_map[interfilediff.source_file] = interfilediff
 
-    key_prefix = "diff-sidebyside-"
-
-    if enable_syntax_highlighting:
-        key_prefix += "hl-"
-
 
     # In order to support interdiffs properly, we need to display diffs
     # on every file in the union of both diffsets. Iterating over one diffset
@@ -1039,44 +1522,21 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
             'deleted': filediff.deleted,
             'newfile': newfile,
             'index': len(files),
+            'summary_only': False,
         }
 
-        if load_chunks:
-            chunks = []
-
-            if not filediff.binary and not filediff.deleted:
-                key = key_prefix
-
-                if not force_interdiff:
-                    key += str(filediff.id)
-                elif interfilediff:
-                    key += "interdiff-%s-%s" % (filediff.id, interfilediff.id)
-                else:
-                    key += "interdiff-%s-none" % filediff.id
-
-                chunks = cache_memoize(
-                    key,
-                    lambda: list(get_chunks(filediff.diffset,
-                                            filediff, interfilediff,
-                                            force_interdiff,
-                                            enable_syntax_highlighting)),
-                    large_data=True)
-
-            file['chunks'] = chunks
-            file['changed_chunk_indexes'] = []
-            file['whitespace_only'] = True
-
-            for j, chunk in enumerate(file['chunks']):
-                chunk['index'] = j
+        if (summarize_large_files and
+            not filediff.binary and not filediff.deleted and
+            (is_large_file(filediff) or
+             (interfilediff and is_large_file(interfilediff)))):
+            file['summary_only'] = True
 
-                if chunk['change'] != 'equal':
-                    file['changed_chunk_indexes'].append(j)
-                    meta = chunk.get('meta', {})
+            if not force_interdiff:
+                file['num_inserts'], file['num_deletes'] = \
+                    get_diff_line_counts(filediff.diff)
 
-                    if not meta.get('whitespace_chunk', False):
-                        file['whitespace_only'] = False
-
-            file['num_changes'] = len(file['changed_chunk_indexes'])
+        if load_chunks:
+            populate_diff_chunks([file], enable_syntax_highlighting)
 
         files.append(file)
 
@@ -1101,6 +1561,146 @@ def get_diff_files(diffset, filediff=None, interdiffset=None,
     return files
 
 
+def populate_diff_chunks(files, enable_syntax_highlighting=True):
+    """
+    Loads the chunks for each of the given files.
+
+    The files are in the form returned by get_diff_files. This fills in
+    the chunks and the information on changed chunks for each file, as
+    get_diff_files does when ``load_chunks`` is True.
+    """
+    key_prefix = "diff-sidebyside-"
+
+    if enable_syntax_highlighting:
+        key_prefix += "hl-"
+
+    for file in files:
+        filediff = file['filediff']
+        interfilediff = file['interfilediff']
+        force_interdiff = file['force_interdiff']
+        chunks = []
+
+        if (not filediff.binary and not filediff.deleted and
+            not file['summary_only']):
+            key = key_prefix + get_diff_file_key(filediff, interfilediff,
+                                                 force_interdiff)
+
+            chunks = cache_memoize(
+                key,
+                lambda: list(get_chunks(filediff.diffset,
+                                        filediff, interfilediff,
+                                        force_interdiff,
+                                        enable_syntax_highlighting)),
+                large_data=True)
+
+        file['chunks'] = chunks
+        file['changed_chunk_indexes'] = []
+        file['whitespace_only'] = not file['summary_only']
+
+        for j, chunk in enumerate(file['chunks']):
+            chunk['index'] = j
+
+            if chunk['change'] != 'equal':
+                file['changed_chunk_indexes'].append(j)
+                meta = chunk.get('meta', {})
+
+                if not meta.get('whitespace_chunk', False):
+                    file['whitespace_only'] = False
+
+        file['num_changes'] = len(file['changed_chunk_indexes'])
+
+
+def get_diff_file_list(diffset, interdiffset=None,
+                       summarize_large_files=False):
+    """
+    Returns cached information on the files in a diffset or interdiff.
+
+    This is the list of files returned by get_diff_files without chunks,
+    except that the FileDiffs are replaced by their IDs in ``filediff_id``
+    and ``interfilediff_id``. The list only depends on the diffsets, which
+    don't change, and the settings for summarizing large files, so it's
+    computed once and cached. Callers can then
+    paginate or search it without loading any FileDiffs, and load just the
+    ones they need with load_diff_file_list.
+    """
+    def build_file_list():
+        files = get_diff_files(diffset, None, interdiffset,
+                               load_chunks=False,
+                               summarize_large_files=summarize_large_files)
+        prefetch_original_files(diffset.repository,
+                                [file['filediff'] for file in files] +
+                                [file['interfilediff'] for file in files
+                                 if file['interfilediff']])
+
+        file_list = []
+
+        for file in files:
+            filediff = file.pop('filediff')
+            interfilediff = file.pop('interfilediff')
+
+            file['filediff_id'] = filediff.id
+            file['interfilediff_id'] = interfilediff and interfilediff.id
+            file_list.append(file)
+
+        return file_list
+
+    if interdiffset:
+        key = 'diff-file-list-%s-%s' % (diffset.id, interdiffset.id)
+    else:
+        key = 'diff-file-list-%s' % diffset.id
+
+    if summarize_large_files:
+        # Which files are summarized depends on these settings, so a change
+        # to them must not reuse the old list.
+        siteconfig = SiteConfiguration.objects.get_current()
+        key += '-summary-%s' % sha1(repr([
+            siteconfig.get('diffviewer_max_diff_size'),
+            siteconfig.get('diffviewer_max_diff_lines'),
+            siteconfig.get('diffviewer_summary_only_patterns'),
+        ])).hexdigest()
+
+    key += '-%s' % settings.AJAX_SERIAL
+
+    return cache_memoize(key, build_file_list)
+
+
+def load_diff_file_list(file_list, diffset, interdiffset=None):
+    """
+    Returns files from get_diff_file_list in the form used by get_diff_files.
+
+    The FileDiffs for all the files are fetched in one query. The returned
+    files are copies, so the cached list isn't modified.
+    """
+    ids = set()
+
+    for file in file_list:
+        ids.add(file['filediff_id'])
+
+        if file['interfilediff_id']:
+            ids.add(file['interfilediff_id'])
+
+    filediffs = FileDiff.objects.in_bulk(list(ids))
+    diffsets = {diffset.id: diffset}
+
+    if interdiffset:
+        diffsets[interdiffset.id] = interdiffset
+
+    for filediff in filediffs.itervalues():
+        # Avoid a query for the diffset when it's accessed later.
+        if filediff.diffset_id in diffsets:
+            filediff.diffset = diffsets[filediff.diffset_id]
+
+    files = []
+
+    for file in file_list:
+        file = dict(file)
+        file['filediff'] = filediffs[file['filediff_id']]
+        file['interfilediff'] = filediffs.get(file['interfilediff_id'])
+        files.append(file)
+
+    return files
+
+
 def get_file_chunks_in_range(context, filediff, interfilediff,
                              first_line, num_lines):
     """
@@ -1139,11 +1739,6 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
       7        True if line consists of only whitespace changes
       ======== =============================================================
     """
-    def find_header(headers):
-        for header in reversed(headers):
-            if header[0] < first_line:
-                return header[1]
-
     interdiffset = None
 
     key = "_diff_files_%s_%s" % (filediff.diffset.id, filediff.id)
@@ -1164,13 +1759,66 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
         raise StopIteration
 
     assert len(files) == 1
+
+    for chunk in get_chunks_in_range(files[0]['chunks'],
+                                     first_line, num_lines):
+        yield chunk
+
+
+def get_chunk_range_index(chunks):
+    """Builds a lookup index for extracting line ranges from a file's chunks.
+
+    The index is built in a single pass over the chunks, and records the
+    first virtual line number of each chunk along with the last header
+    seen up to and including that chunk. It can be passed to
+    get_chunks_in_range to extract any number of line ranges from the
+    same list of chunks without rescanning it each time.
+    """
+    first_lines = []
+    last_headers = []
     last_header = (None, None)
 
-    for chunk in files[0]['chunks']:
-        if ('headers' in chunk['meta'] and
-            (chunk['meta']['headers'][0] or chunk['meta']['headers'][1])):
-            last_header = chunk['meta']['headers']
+    for chunk in chunks:
+        meta = chunk['meta']
+
+        if ('headers' in meta and
+            (meta['headers'][0] or meta['headers'][1])):
+            last_header = meta['headers']
+
+        first_lines.append(chunk['lines'][0][0])
+        last_headers.append(last_header)
+
+    return first_lines, last_headers
+
 
+def get_chunks_in_range(chunks, first_line, num_lines, range_index=None):
+    """
+    A generator that yields the parts of the given chunks that fall within
+    a range of lines.
+
+    The chunks are in the form returned by get_diff_files, and the
+    resulting chunks are in the form described in get_file_chunks_in_range.
+
+    If ``range_index`` is provided, it must have been built from the same
+    chunks using get_chunk_range_index. Callers extracting many ranges from
+    one file should build it once up-front.
+    """
+    def find_header(headers):
+        for header in reversed(headers):
+            if header[0] < first_line:
+                return header[1]
+
+    if not chunks:
+        raise StopIteration
+
+    if range_index is None:
+        range_index = get_chunk_range_index(chunks)
+
+    first_lines, last_headers = range_index
+
+    for i in xrange(max(bisect_right(first_lines, first_line) - 1, 0),
+                    len(chunks)):
+        chunk = chunks[i]
         lines = chunk['lines']
 
         if lines[-1][0] >= first_line >= lines[0][0]:
@@ -1181,25 +1829,27 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
             else:
                 last_index = len(lines)
 
+            # The chunks may be shared with other callers (or come straight
+            # from the cache), so work on a copy of the metadata.
+            meta = dict(chunk.get('meta', {}))
+
             new_chunk = {
-                'lines': chunk['lines'][start_index:last_index],
+                'lines': lines[start_index:last_index],
                 'numlines': last_index - start_index,
                 'change': chunk['change'],
-                'meta': chunk.get('meta', {}),
+                'meta': meta,
             }
 
-            if 'left_headers' in chunk['meta']:
-                left_header = find_header(chunk['meta']['left_headers'])
-                right_header = find_header(chunk['meta']['right_headers'])
-                del new_chunk['meta']['left_headers']
-                del new_chunk['meta']['right_headers']
+            if 'left_headers' in meta:
+                left_header = find_header(meta.pop('left_headers'))
+                right_header = find_header(meta.pop('right_headers'))
 
                 if left_header or right_header:
                     header = (left_header, right_header)
                 else:
-                    header = last_header
+                    header = last_headers[i]
 
-                new_chunk['meta']['headers'] = [
+                meta['headers'] = [
                     (header[0] or "").strip(),
                     (header[1] or "").strip(),
                 ]
@@ -1212,6 +1862,8 @@ def get_file_chunks_in_range(context, filediff, interfilediff,
             assert num_lines >= 0
             if num_lines == 0:
                 break
+        elif lines[0][0] > first_line:
+            break
 
 
 def get_enable_highlighting(user):
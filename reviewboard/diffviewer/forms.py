@@ -132,6 +132,7 @@ class UploadDiffForm(forms.Form):
 
     def _process_files(self, file, basedir, check_existance=False):
         tool = self.repository.get_scmtool()
+        files = []
 
         for f in tool.get_parser(file.read()).parse():
             f2, revision = tool.parse_diff_revision(f.origFile, f.origInfo)
@@ -140,19 +141,27 @@ class UploadDiffForm(forms.Form):
             else:
                 filename = os.path.join(basedir, f2).replace("\\", "/")
 
-            # FIXME: this would be a good place to find permissions errors
-            if (revision != PRE_CREATION and
-                revision != UNKNOWN and
-                not f.binary and
-                not f.deleted and
-                (check_existance and
-                 not tool.file_exists(filename, revision))):
-                raise FileNotFoundError(filename, revision)
-
             f.origFile = filename
             f.origInfo = revision
 
-            yield f
+            files.append(f)
+
+        if check_existance:
+            # FIXME: this would be a good place to find permissions errors
+            check_files = [f for f in files
+                           if (f.origInfo != PRE_CREATION and
+                               f.origInfo != UNKNOWN and
+                               not f.binary and
+                               not f.deleted)]
+
+            tool.prefetch_files([(f.origFile, f.origInfo)
+                                 for f in check_files])
+
+            for f in check_files:
+                if not tool.file_exists(f.origFile, f.origInfo):
+                    raise FileNotFoundError(f.origFile, f.origInfo)
+
+        return files
 
 
     def _compare_files(self, filename1, filename2):
@@ -1,3 +1,6 @@
+import time
+
+
 class MyersDiffer:
     """
     An implementation of Eugene Myers's O(ND) Diff algorithm based on GNU diff.
@@ -20,7 +23,8 @@ class MyersDiffer:
             self.undiscarded_lines = 0
             self.real_indexes = []
 
-    def __init__(self, a, b, ignore_space=False):
+    def __init__(self, a, b, ignore_space=False, max_cost=None,
+                 max_time=None):
         if type(a) != type(b):
             raise TypeError
 
@@ -35,6 +39,16 @@ class MyersDiffer:
         self.interesting_lines = [{}, {}]
         self.interesting_line_table = {}
 
+        # Budget state. Once the search for the shortest middle snake has
+        # gone through max_cost iterations in total, or max_time seconds
+        # have passed, the rest of the diff is computed with a much
+        # cheaper heuristic and the result is flagged as approximate.
+        self.max_cost = max_cost
+        self.max_time = max_time
+        self.total_cost = 0
+        self.deadline = None
+        self.approximate = False
+
         # SMS State
         self.max_lines = 0
         self.fdiag = None
@@ -174,6 +188,9 @@ class MyersDiffer:
         self.bdiag = [0] * vector_size
         self.downoff = self.upoff = self.b_data.undiscarded_lines + 1
 
+        if self.max_time is not None:
+            self.deadline = time.time() + self.max_time
+
         self._lcs(0, self.a_data.undiscarded_lines,
                   0, self.b_data.undiscarded_lines,
                   self.minimal_diff)
@@ -258,10 +275,10 @@ class MyersDiffer:
         up_min   = up_max   = up_k
 
         cost = 0
-        max_cost = max(256, self._very_approx_sqrt(self.max_lines * 4))
 
         while True:
             cost += 1
+            self.total_cost += 1
             big_snake = False
 
             if down_min > dmin:
@@ -345,6 +362,15 @@ class MyersDiffer:
 
                 up_vector[self.upoff + k] = x
 
+            # If the diff has gone over its budget, give up on finding the
+            # optimal path and use the best point reached so far. The rest
+            # of the diff will be computed by the cheap heuristic in _lcs.
+            if self._is_over_budget():
+                return self._find_halfway_point(a_lower, a_upper,
+                                                 b_lower, b_upper,
+                                                 down_min, down_max,
+                                                 up_min, up_max)
+
             if find_minimal:
                 continue
 
@@ -387,51 +413,76 @@ class MyersDiffer:
                 if best > 0:
                     return ret_x, ret_y, False, True
 
-            continue # XXX
-
-            # If we've reached or gone past the max cost, just give up now
-            # and report the halfway point between our best results.
-            if cost >= max_cost:
-                fx_best = bx_best = 0
-
-                # Find the forward diagonal that maximized x + y
-                fxy_best = -1
-                for d in xrange(down_max, down_min - 1, -2):
-                    x = min(down_vector[self.downoff + d], a_upper)
-                    y = x - d
-
-                    if b_upper < y:
-                        x = b_upper + d
-                        y = b_upper
-
-                    if fxy_best < x + y:
-                        fxy_best = x + y
-                        fx_best = x
-
-                # Find the backward diagonal that minimizes x + y
-                bxy_best = self.max_lines
-                for d in xrange(up_max, up_min - 1, -2):
-                    x = max(a_lower, up_vector[self.upoff + d])
-                    y = x - d
-
-                    if y < b_lower:
-                        x = b_lower + d
-                        y = b_lower
-
-                    if x + y < bxy_best:
-                        bxy_best = x + y
-                        bx_best = x
-
-                # Use the better of the two diagonals
-                if a_upper + b_upper - bxy_best < \
-                   fxy_best - (a_lower + b_lower):
-                    return fx_best, fxy_best - fx_best, True, False
-                else:
-                    return bx_best, bxy_best - bx_best, False, True
-
 
         raise Exception("The function should not have reached here.")
 
+    def _is_over_budget(self):
+        """
+        Returns whether the diff has gone over its budget.
+
+        Once the budget is exceeded, the diff is marked as approximate.
+        """
+        if self.approximate:
+            return True
+
+        if self.max_cost is not None and self.total_cost >= self.max_cost:
+            self.approximate = True
+        elif (self.deadline is not None and self.total_cost % 64 == 0 and
+              time.time() >= self.deadline):
+            # Checking the time is comparatively expensive, so only do
+            # it occasionally.
+            self.approximate = True
+
+        return self.approximate
+
+    def _find_halfway_point(self, a_lower, a_upper, b_lower, b_upper,
+                            down_min, down_max, up_min, up_max):
+        """
+        Returns the halfway point between the best forward and reverse
+        paths found so far in the search for the middle snake.
+
+        This is GNU diff's TOO_EXPENSIVE heuristic. The result is in the
+        form returned by _find_sms, and is used when the search for the
+        shortest middle snake is too expensive to finish.
+        """
+        down_vector = self.fdiag
+        up_vector = self.bdiag
+        fx_best = bx_best = 0
+
+        # Find the forward diagonal that maximized x + y
+        fxy_best = -1
+        for d in xrange(down_max, down_min - 1, -2):
+            x = min(down_vector[self.downoff + d], a_upper)
+            y = x - d
+
+            if b_upper < y:
+                x = b_upper + d
+                y = b_upper
+
+            if fxy_best < x + y:
+                fxy_best = x + y
+                fx_best = x
+
+        # Find the backward diagonal that minimizes x + y
+        bxy_best = self.max_lines
+        for d in xrange(up_max, up_min - 1, -2):
+            x = max(a_lower, up_vector[self.upoff + d])
+            y = x - d
+
+            if y < b_lower:
+                x = b_lower + d
+                y = b_lower
+
+            if x + y < bxy_best:
+                bxy_best = x + y
+                bx_best = x
+
+        # Use the better of the two diagonals
+        if a_upper + b_upper - bxy_best < fxy_best - (a_lower + b_lower):
+            return fx_best, fxy_best - fx_best, False, False
+        else:
+            return bx_best, bxy_best - bx_best, False, False
+
     def _find_diagonal(self, minimum, maximum, k, best, diagoff, vector,
                        vdiff_func, check_x_range, check_y_range,
                        discard_index, k_offset, cost):
@@ -485,6 +536,16 @@ class MyersDiffer:
             while a_lower < a_upper:
                 self.a_data.modified[self.a_data.real_indexes[a_lower]] = True
                 a_lower += 1
+        elif self.approximate:
+            # The diff has gone over its budget. Rather than searching for
+            # the best path, consider everything left in this range to be
+            # changed. The equal lines at the start and end of the range
+            # have already been skipped above.
+            for i in xrange(a_lower, a_upper):
+                self.a_data.modified[self.a_data.real_indexes[i]] = True
+
+            for i in xrange(b_lower, b_upper):
+                self.b_data.modified[self.b_data.real_indexes[i]] = True
         else:
             # Find the middle snake and length of an optimal path for A and B
             x, y, low_minimal, high_minimal = \
@@ -184,5 +184,15 @@ class DiffParser(object):
 
         The returned diff as composed of all FileDiffs in the provided diffset.
         """
-        return ''.join([filediff.diff for filediff in diffset.files.all()])
+        return ''.join(self.iter_raw_diff(diffset))
+
+    def iter_raw_diff(self, diffset):
+        """Returns an iterator over the raw diff of each FileDiff.
+
+        The FileDiffs are fetched with an iterator query, so only one
+        decoded diff needs to be held in memory at a time. This is used to
+        stream large diffsets to the client.
+        """
+        for filediff in diffset.files.all().iterator():
+            yield filediff.diff
 
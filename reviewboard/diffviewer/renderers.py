@@ -0,0 +1,196 @@
+from django.utils.html import escape
+from django.utils.translation import ugettext as _
+
+from reviewboard.diffviewer.templatetags.difftags import highlightregion, \
+                                                         showextrawhitespace
+
+
+def render_file_chunks(file, collapseall=False, base_url=''):
+    """
+    Renders the table bodies for the chunks of a file in the diff viewer.
+
+    This produces the same HTML as the chunk loop that used to live in
+    ``diffviewer/diff_file_fragment.html``, but builds it directly in Python
+    instead of going through the template engine. Large files can have tens
+    of thousands of rows, and interpreting the template's loops, filters
+    and variable lookups for every one of them was the bulk of the cost of
+    rendering an uncached fragment.
+
+    ``file`` is a file entry as returned by get_diff_files, with chunks
+    loaded. The result is a unicode string of ``<tbody>`` elements.
+    """
+    parts = []
+    file_index = escape(file['index'])
+    base_url = escape(base_url)
+
+    for i, chunk in enumerate(file['chunks']):
+        if chunk['collapsable'] and collapseall:
+            _render_collapsed_chunk(parts, file, file_index, base_url,
+                                    chunk, i)
+        else:
+            _render_chunk(parts, file_index, chunk)
+
+    return u''.join(parts)
+
+
+def render_context_lines(file_index, lines):
+    """
+    Renders lines of unchanged context in the diff viewer.
+
+    ``lines`` is a list of lines in the form found in chunks, as returned
+    by get_file_lines_in_range. The result is a unicode string containing
+    a ``<tbody>`` for the lines, or an empty string if there are no lines.
+    """
+    if not lines:
+        return u''
+
+    parts = []
+    _render_chunk(parts, escape(file_index), {
+        'change': 'equal',
+        'collapsable': False,
+        'index': u'context%s' % lines[0][0],
+        'lines': lines,
+        'meta': {},
+    })
+
+    return u''.join(parts)
+
+
+def _render_chunk(parts, file_index, chunk):
+    """Renders a visible chunk, appending the HTML to parts."""
+    change = chunk['change']
+    chunk_id = u'%s.%s' % (file_index, chunk['index'])
+    lines = chunk['lines']
+    last = len(lines) - 1
+
+    if change != 'equal':
+        if chunk['meta'].get('whitespace_chunk'):
+            css_class = u' class="%s whitespace-chunk"' % change
+        else:
+            css_class = u' class="%s"' % change
+    elif chunk['collapsable']:
+        css_class = u' class="collapsable"'
+    else:
+        css_class = u''
+
+    parts.append(u' <tbody id="chunk%s"%s>\n' % (chunk_id, css_class))
+
+    for i, line in enumerate(lines):
+        if change == 'equal':
+            parts.append(u'  <tr line="%s">\n' % line[0])
+        else:
+            classes = []
+
+            if i == 0:
+                classes.append(u'first')
+
+            if i == last:
+                classes.append(u'last')
+
+            if line[7]:
+                classes.append(u'whitespace-line')
+
+            if classes:
+                parts.append(u'  <tr line="%s" class="%s">\n' %
+                             (line[0], u' '.join(classes)))
+            else:
+                parts.append(u'  <tr line="%s">\n' % line[0])
+
+        if i == 0 and change != 'equal':
+            parts.append(u'   <th><a name="%s" class="chunk-anchor"></a>'
+                         u'%s</th>\n' % (chunk_id, line[1]))
+        else:
+            parts.append(u'   <th>%s</th>\n' % line[1])
+
+        if len(line) > 8:
+            moved = line[8]
+        else:
+            moved = None
+
+        if change == 'replace':
+            parts.append(
+                u'   <td><pre>%s</pre></td>\n'
+                u'   <th>%s</th>\n'
+                u'   <td><pre>%s</pre></td>\n'
+                % (showextrawhitespace(highlightregion(line[2], line[3])),
+                   line[4],
+                   showextrawhitespace(highlightregion(line[5], line[6]))))
+        else:
+            if change == 'insert' and moved:
+                moved_from = (
+                    u'\n    <a href="#" class="moved-from" line="%s" '
+                    u'target="%s">%s %s</a>\n   '
+                    % (moved, line[4], _("Moved from"), moved))
+            else:
+                moved_from = u''
+
+            if change == 'delete' and moved:
+                moved_to = (
+                    u'\n    <a href="#" class="moved-to" line="%s" '
+                    u'target="%s">%s %s</a>\n   '
+                    % (moved, line[1], _("Moved to"), moved))
+            else:
+                moved_to = u''
+
+            parts.append(
+                u'   <td>%s\n'
+                u'    <pre>%s</pre>\n'
+                u'   </td>\n'
+                u'   <th>%s</th>\n'
+                u'   <td>%s\n'
+                u'    <pre>%s</pre>\n'
+                u'   </td>\n'
+                % (moved_from, showextrawhitespace(line[2]), line[4],
+                   moved_to, showextrawhitespace(line[5])))
+
+        parts.append(u'  </tr>\n')
+
+    parts.append(u' </tbody>\n')
+
+
+def _render_collapsed_chunk(parts, file, file_index, base_url, chunk, i):
+    """Renders a collapsed chunk header, appending the HTML to parts."""
+    numlines = chunk['numlines']
+
+    if numlines == 1:
+        lines_str = u'%s line hidden' % numlines
+    else:
+        lines_str = u'%s lines hidden' % numlines
+
+    filediff = file['filediff']
+    first_line = chunk['lines'][0]
+
+    if file['interfilediff']:
+        interdiff_revision = u"'%s'" % file['interfilediff'].diffset.revision
+    else:
+        interdiff_revision = u'null'
+
+    parts.append(
+        u' <tbody class="diff-header" id="collapsed-chunk%s.%s">\n'
+        u'  <tr>\n'
+        u'   <th>...</th>\n'
+        u'   <td colspan="3">%s [<a href="#" onclick="javascript:expandChunk('
+        u"'%s', '%s', '%s', '%s', %s, %s, %s, %s, %s, this); "
+        u'return false;">%s</a>]\n'
+        u'   </td>\n'
+        u'  </tr>\n'
+        % (file_index, i, lines_str, base_url, file_index, filediff.id,
+           filediff.diffset.revision, interdiff_revision, first_line[0],
+           first_line[1], first_line[4], numlines, _("Expand")))
+
+    headers = chunk['meta'].get('headers')
+
+    if headers:
+        parts.append(u'  <tr>\n')
+
+        if headers[0] == headers[1]:
+            parts.append(u'   <td colspan="4"><pre>%s</pre></td>\n' %
+                         escape(headers[0]))
+        else:
+            parts.append(u'   <td colspan="2"><pre>%s</pre></td>\n'
+                         u'   <td colspan="2"><pre>%s</pre></td>\n' %
+                         (escape(headers[0]), escape(headers[1])))
+
+        parts.append(u'  </tr>\n')
+
+    parts.append(u' </tbody>\n')
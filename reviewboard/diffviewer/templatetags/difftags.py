@@ -5,6 +5,10 @@ from django import template
 register = template.Library()
 
 
+# Matches tags and entities in HTML markup.
+MARKUP_RE = re.compile(r'(<[^>]*>?|&[^;]*;?)')
+
+
 @register.filter
 def revision_link_list(history, current_pair):
     """
@@ -51,66 +55,88 @@ def highlightregion(value, regions):
     if not regions:
         return value
 
-    s = ""
-
     # We need to insert span tags into a string already consisting
     # of span tags. We have a list of ranges that our span tags should
     # go into, but those ranges are in the markup-less string.
     #
-    # We go through the string and keep track of the location in the
-    # markup and in the markup-less string. We make sure to insert our
-    # span tag any time that we're within the current region, so long
-    # as we haven't already created one. We close the span tag whenever
-    # we're done with the region or when we're about to enter a tag in
-    # the markup string.
+    # We split the markup into tags, entities and runs of plain text, and
+    # walk through them once, keeping track of the location in the
+    # markup-less string. Runs of text are copied over in slices, split
+    # only where a region begins or ends. Entities count as a single
+    # character and are never split. We close the span tag whenever we're
+    # done with the region or when we're about to enter a tag in the
+    # markup string, and reopen it on the next bit of text in the region.
     #
     # This code makes the assumption that the list of regions is sorted.
     # This is safe to assume in practice, but if we ever at some point
     # had reason to doubt it, we could always sort the regions up-front.
-    in_tag = in_entity = in_hl = False
-    i = j = r = 0
-    region = regions[r]
+    parts = []
+    in_hl = False
+    j = r = 0
+    num_regions = len(regions)
+    pieces = MARKUP_RE.split(value)
+
+    for i, piece in enumerate(pieces):
+        if not piece:
+            continue
 
-    for i in xrange(len(value)):
-        if value[i] == "<":
-            in_tag = True
+        if r == num_regions:
+            parts.extend(pieces[i:])
+            break
 
+        if piece[0] == '<':
             if in_hl:
-                s += "</span>"
+                parts.append('</span>')
                 in_hl = False
-        elif value[i] == ">":
-            in_tag = False
-        elif value[i] == ';' and in_entity:
-            in_entity = False
-            j += 1
-        elif not in_tag and not in_entity:
-            if not in_hl and region[0] <= j < region[1]:
-                s += '<span class="hl">'
-                in_hl = True
-
-            if value[i] == '&':
-                in_entity = True
+
+            parts.append(piece)
+            continue
+
+        if piece[0] == '&':
+            # An entity is treated as a single, unsplittable character.
+            piece_len = 1
+        else:
+            piece_len = len(piece)
+
+        pos = 0
+
+        while pos < piece_len and r < num_regions:
+            start, end = regions[r]
+
+            if j >= end:
+                # This region is empty or already behind us.
+                r += 1
+                continue
+
+            if j < start:
+                n = min(start - j, piece_len - pos)
             else:
-                j += 1
+                if not in_hl:
+                    parts.append('<span class="hl">')
+                    in_hl = True
 
-        s += value[i]
+                n = min(end - j, piece_len - pos)
 
-        if j == region[1]:
-            r += 1
+            if piece_len == 1:
+                parts.append(piece)
+            else:
+                parts.append(piece[pos:pos + n])
 
-            if in_hl:
-                s += '</span>'
-                in_hl = False
+            pos += n
+            j += n
 
-            if r == len(regions):
-                break
+            if in_hl and j == end:
+                parts.append('</span>')
+                in_hl = False
+                r += 1
 
-            region = regions[r]
+        if pos < piece_len:
+            parts.append(piece[pos:])
 
-    if i + 1 < len(value):
-        s += value[i + 1:]
+    if in_hl:
+        parts.append('</span>')
 
-    return s
+    return ''.join(parts)
 highlightregion.is_safe = True
 
 
@@ -1,13 +1,24 @@
 import os
+import threading
 import unittest
+from cStringIO import StringIO
+from gzip import GzipFile
 
+from django.http import HttpRequest
 from django.test import TestCase
 from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.misc import cache_memoize
 
 from reviewboard.diffviewer.models import DiffSet, FileDiff
+from reviewboard.diffviewer.renderers import render_context_lines, \
+                                             render_file_chunks
 from reviewboard.diffviewer.templatetags.difftags import highlightregion
+from reviewboard.diffviewer.views import StreamingHttpResponse, \
+                                        accepts_gzip, compress_iter
 import reviewboard.diffviewer.diffutils as diffutils
 import reviewboard.diffviewer.parser as diffparser
+from reviewboard.scmtools.errors import FileNotFoundError, SCMError, \
+                                      SCMTimeoutError
 from reviewboard.scmtools.models import Repository
 
 
@@ -34,12 +45,83 @@ class MyersDifferTest(TestCase):
                           ("insert",  5, 5, 5, 9),
                           ("equal",   5, 8, 9, 12)])
 
+    def testDiffOverBudget(self):
+        """Testing myers differ with a cost budget"""
+        a = ['%s' % (i * 7 % 13) for i in xrange(100)] + ['end']
+        b = ['%s' % (i * 5 % 11) for i in xrange(100)] + ['end']
+
+        differ = diffutils.MyersDiffer(a, b)
+        list(differ.get_opcodes())
+        self.assertFalse(differ.approximate)
+
+        differ = diffutils.MyersDiffer(a, b, max_cost=2)
+        opcodes = list(differ.get_opcodes())
+        self.assertTrue(differ.approximate)
+
+        # The diff must still be valid, even if it's not the best one.
+        self.assertEqual(opcodes[-1], ('equal', 100, 101, 100, 101))
+
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'equal':
+                self.assertEqual(a[i1:i2], b[j1:j2])
+
 
     def __test_diff(self, a, b, expected):
         opcodes = list(diffutils.MyersDiffer(a, b).get_opcodes())
         self.assertEquals(opcodes, expected)
 
 
+class SplitLinesTest(unittest.TestCase):
+    def testSplitLines(self):
+        """Testing split_lines"""
+        self.assertEqual(diffutils.split_lines('abc\r\n\ndef\rghi\n'),
+                         ['abc', '', 'def\rghi'])
+
+    def testNoTrailingNewline(self):
+        """Testing split_lines without a trailing newline"""
+        self.assertEqual(diffutils.split_lines('abc\ndef'), ['abc', 'def'])
+        self.assertEqual(diffutils.split_lines(''), [])
+
+    def testSharedLines(self):
+        """Testing split_lines sharing the strings of identical lines"""
+        lines = diffutils.split_lines(u'abc\ndef\nabc\n')
+
+        self.assert_(lines[0] is lines[2])
+
+
+class DecodeFileDataTest(unittest.TestCase):
+    def testDecodeUTF8(self):
+        """Testing decode_file_data with UTF-8 data"""
+        self.assertEqual(diffutils.decode_file_data('abc\xc3\xa9', 'ascii'),
+                         (u'abc\xe9', 'utf-8'))
+
+    def testDecodeFallback(self):
+        """Testing decode_file_data with a fallback encoding"""
+        self.assertEqual(diffutils.decode_file_data('abc\xe9',
+                                                    'ascii,iso-8859-15'),
+                         (u'abc\xe9', 'iso-8859-15'))
+        self.assertRaises(Exception,
+                          lambda: diffutils.decode_file_data('abc\xe9',
+                                                             'ascii'))
+
+    def testDecodeWithEncoding(self):
+        """Testing decode_file_data with a known encoding"""
+        self.assertEqual(diffutils.decode_file_data('abc\xe9', 'ascii',
+                                                    'iso-8859-15'),
+                         (u'abc\xe9', 'iso-8859-15'))
+
+        # The known encoding is tried before UTF-8.
+        self.assertEqual(diffutils.decode_file_data('abc\xc3\xa9', 'ascii',
+                                                    'iso-8859-15'),
+                         (u'abc\xc3\xa9', 'iso-8859-15'))
+
+        # Falls back on detecting the encoding if the known one fails.
+        self.assertEqual(diffutils.decode_file_data('abc\xe9',
+                                                    'ascii,iso-8859-15',
+                                                    'ascii'),
+                         (u'abc\xe9', 'iso-8859-15'))
+
+
 class InterestingLinesTest(TestCase):
     PREFIX = os.path.join(os.path.dirname(__file__), 'testdata')
 
@@ -345,6 +427,49 @@ class DiffParserTest(unittest.TestCase):
         return data
 
 
+class LargeFileTest(TestCase):
+    def setUp(self):
+        self.siteconfig = SiteConfiguration.objects.get_current()
+        self.siteconfig.set('diffviewer_max_diff_size', 100)
+        self.siteconfig.set('diffviewer_max_diff_lines', 5)
+        self.siteconfig.set('diffviewer_summary_only_patterns',
+                            ['*.min.js', 'package-lock.json'])
+
+    def _make_filediff(self, diff, source_file='foo.js', dest_file=None):
+        return FileDiff(diff=diff, source_file=source_file,
+                        dest_file=dest_file or source_file)
+
+    def testLineCounts(self):
+        """Testing get_diff_line_counts"""
+        diff = ('--- foo.js\n'
+                '+++ foo.js\n'
+                '@@ -1,3 +1,3 @@\n'
+                ' a\n'
+                '-b\n'
+                '+c\n'
+                '+d\n')
+        self.assertEqual(diffutils.get_diff_line_counts(diff), (2, 1))
+
+    def testSmallFile(self):
+        """Testing is_large_file with a small file"""
+        self.assertFalse(diffutils.is_large_file(
+            self._make_filediff('+a\n+b\n')))
+
+    def testLargeFile(self):
+        """Testing is_large_file with files over the limits"""
+        self.assertTrue(diffutils.is_large_file(
+            self._make_filediff('+%s\n' % ('a' * 100))))
+        self.assertTrue(diffutils.is_large_file(
+            self._make_filediff('+a\n' * 6)))
+
+    def testGeneratedFile(self):
+        """Testing is_large_file with generated files"""
+        self.assertTrue(diffutils.is_large_file(
+            self._make_filediff('+a\n', 'media/js/jquery.min.js')))
+        self.assertTrue(diffutils.is_large_file(
+            self._make_filediff('+a\n', 'web/package-lock.json')))
+
+
 class HighlightRegionTest(TestCase):
     def setUp(self):
         siteconfig = SiteConfiguration.objects.get_current()
@@ -407,6 +532,331 @@ class HighlightRegionTest(TestCase):
             'foo=<span class="ab"><span class="hl">&quot;foo&quot;' +
             '</span></span>)')
 
+        self.assertEquals(highlightregion(
+            'abcdef',
+            [(0, 1), (1, 1), (2, 4)]),
+            '<span class="hl">a</span>b<span class="hl">cd</span>ef')
+
+        self.assertEquals(highlightregion(
+            'abc<span class="xy">def</span>',
+            [(1, 10)]),
+            'a<span class="hl">bc</span><span class="xy">' +
+            '<span class="hl">def</span></span>')
+
+
+class ChunkRangeTest(unittest.TestCase):
+    def _make_chunks(self):
+        def make_lines(start, end):
+            return [[i, i, 'line %s' % i, [], i, 'line %s' % i, [], False]
+                    for i in xrange(start, end)]
+
+        return [
+            {
+                'lines': make_lines(1, 5),
+                'numlines': 4,
+                'change': 'equal',
+                'meta': {
+                    'left_headers': [(2, 'def foo():')],
+                    'right_headers': [(2, 'def foo():')],
+                },
+            },
+            {
+                'lines': make_lines(5, 8),
+                'numlines': 3,
+                'change': 'replace',
+                'meta': {
+                    'left_headers': [],
+                    'right_headers': [],
+                    'headers': ['def bar():', 'def bar():'],
+                },
+            },
+        ]
+
+    def testRangeWithinChunk(self):
+        """Testing get_chunks_in_range with a range inside one chunk"""
+        chunks = self._make_chunks()
+        result = list(diffutils.get_chunks_in_range(chunks, 3, 2))
+
+        self.assertEqual(len(result), 1)
+        self.assertEqual(result[0]['numlines'], 2)
+        self.assertEqual(result[0]['lines'][0][0], 3)
+        self.assertEqual(result[0]['meta']['headers'],
+                         ['def foo():', 'def foo():'])
+
+        # The original chunks must not be modified.
+        self.assertTrue('left_headers' in chunks[0]['meta'])
+
+    def testRangeAcrossChunks(self):
+        """Testing get_chunks_in_range with a range spanning chunks"""
+        chunks = self._make_chunks()
+        range_index = diffutils.get_chunk_range_index(chunks)
+
+        result = list(diffutils.get_chunks_in_range(chunks, 4, 3,
+                                                    range_index))
+        self.assertEqual([chunk['numlines'] for chunk in result], [1, 2])
+        self.assertEqual(result[1]['change'], 'replace')
+        self.assertEqual(result[1]['meta']['headers'],
+                         ['def bar():', 'def bar():'])
+
+        # Reusing the index for another range should give the same results
+        # as building it from scratch.
+        self.assertEqual(
+            list(diffutils.get_chunks_in_range(chunks, 6, 1, range_index)),
+            list(diffutils.get_chunks_in_range(chunks, 6, 1)))
+
+
+class RenderFileChunksTest(unittest.TestCase):
+    def _make_file(self):
+        class Dummy(object):
+            pass
+
+        filediff = Dummy()
+        filediff.id = 12
+        filediff.diffset = Dummy()
+        filediff.diffset.revision = 3
+
+        return {
+            'index': 1,
+            'filediff': filediff,
+            'interfilediff': None,
+            'chunks': [
+                {
+                    'index': 0,
+                    'change': 'equal',
+                    'collapsable': True,
+                    'numlines': 1,
+                    'meta': {'headers': ['<main>', '<main>']},
+                    'lines': [[1, 1, 'a', [], 1, 'a', [], False]],
+                },
+                {
+                    'index': 1,
+                    'change': 'replace',
+                    'collapsable': False,
+                    'numlines': 1,
+                    'meta': {},
+                    'lines': [[2, 2, 'abc', [(1, 2)], 2, 'axc', [(1, 2)],
+                               False]],
+                },
+            ],
+        }
+
+    def testRenderExpanded(self):
+        """Testing render_file_chunks with expanded chunks"""
+        html = render_file_chunks(self._make_file(), False, '/r/1/')
+
+        self.assertTrue('<tbody id="chunk1.0" class="collapsable">' in html)
+        self.assertTrue('<tbody id="chunk1.1" class="replace">' in html)
+        self.assertTrue('<tr line="2" class="first last">' in html)
+        self.assertTrue('<a name="1.1" class="chunk-anchor"></a>2' in html)
+        self.assertTrue('<pre>a<span class="hl">b</span>c</pre>' in html)
+
+    def testRenderCollapsed(self):
+        """Testing render_file_chunks with collapsed chunks"""
+        html = render_file_chunks(self._make_file(), True, '/r/1/')
+
+        self.assertFalse('id="chunk1.0"' in html)
+        self.assertTrue('id="collapsed-chunk1.0"' in html)
+        self.assertTrue('1 line hidden' in html)
+        self.assertTrue("expandChunk('/r/1/', '1', '12', '3', null, "
+                        "1, 1, 1, 1, this)" in html)
+        self.assertTrue('<td colspan="4"><pre>&lt;main&gt;</pre></td>'
+                        in html)
+
+    def testRenderContextLines(self):
+        """Testing render_context_lines"""
+        html = render_context_lines(1, [[5, 4, 'a', [], 6, 'a', [], False]])
+
+        self.assertTrue('<tbody id="chunk1.context5">' in html)
+        self.assertTrue('<tr line="5">' in html)
+        self.assertEqual(render_context_lines(1, []), '')
+
+
+class FileLinesInRangeTest(unittest.TestCase):
+    def setUp(self):
+        self.file_lines = [
+            ['old %s' % i for i in xrange(1, 11)],
+            ['new %s' % i for i in xrange(1, 13)],
+        ]
+
+    def testRange(self):
+        """Testing get_file_lines_in_range"""
+        lines = diffutils.get_file_lines_in_range(self.file_lines, 20, 3, 5, 2)
+
+        self.assertEqual(lines, [
+            [20, 3, 'old 3', [], 5, 'new 5', [], False],
+            [21, 4, 'old 4', [], 6, 'new 6', [], False],
+        ])
+
+    def testRangePastEnd(self):
+        """Testing get_file_lines_in_range with a range past the end"""
+        lines = diffutils.get_file_lines_in_range(self.file_lines, 1, 9, 11,
+                                                  20)
+        self.assertEqual([line[1] for line in lines], [9, 10])
+        self.assertEqual([line[4] for line in lines], [11, 12])
+
+        self.assertEqual(
+            diffutils.get_file_lines_in_range(self.file_lines, 1, 11, 1, 5),
+            [])
+
+    def testInvalidRange(self):
+        """Testing get_file_lines_in_range with an invalid range"""
+        self.assertEqual(
+            diffutils.get_file_lines_in_range(self.file_lines, 1, 0, 1, 5),
+            [])
+        self.assertEqual(
+            diffutils.get_file_lines_in_range(self.file_lines, 1, 1, 1, -1),
+            [])
+
+
+class AcceptsGzipTest(unittest.TestCase):
+    def _make_request(self, accept_encoding, user_agent='Mozilla/5.0'):
+        request = HttpRequest()
+        request.META['HTTP_ACCEPT_ENCODING'] = accept_encoding
+        request.META['HTTP_USER_AGENT'] = user_agent
+        return request
+
+    def testAcceptsGzip(self):
+        """Testing accepts_gzip"""
+        self.assertTrue(accepts_gzip(self._make_request('gzip, deflate'),
+                                     'text/html'))
+        self.assertTrue(accepts_gzip(self._make_request('gzip'),
+                                     'text/x-patch'))
+        self.assertFalse(accepts_gzip(self._make_request('deflate'),
+                                      'text/html'))
+        self.assertFalse(accepts_gzip(self._make_request(''), 'text/html'))
+
+    def testAcceptsGzipMSIE(self):
+        """Testing accepts_gzip with MSIE"""
+        msie = 'Mozilla/4.0 (compatible; MSIE 7.0; Windows NT 6.0)'
+
+        self.assertTrue(accepts_gzip(self._make_request('gzip', msie),
+                                     'text/html'))
+        self.assertFalse(accepts_gzip(self._make_request('gzip', msie),
+                                      'application/octet-stream'))
+        self.assertFalse(accepts_gzip(self._make_request('gzip', msie),
+                                      'text/javascript'))
+
+
+class StreamingResponseTest(unittest.TestCase):
+    def testStreamedContent(self):
+        """Testing StreamingHttpResponse iteration"""
+        response = StreamingHttpResponse(iter(['abc', u'def', 'ghi']))
+        self.assertEqual(list(response), ['abc', 'def', 'ghi'])
+
+    def testContentAccess(self):
+        """Testing StreamingHttpResponse.content keeps the response intact"""
+        response = StreamingHttpResponse(iter(['abc', 'def']))
+        self.assertEqual(response.content, 'abcdef')
+        self.assertEqual(response.content, 'abcdef')
+        self.assertEqual(''.join(response), 'abcdef')
+
+    def testCompressIter(self):
+        """Testing compress_iter"""
+        data = compress_iter(iter(['abc', u'def', 'ghi' * 100]))
+        self.assertEqual(GzipFile(fileobj=StringIO(data)).read(),
+                         'abcdef' + 'ghi' * 100)
+
+
+class FetchWithTimeoutTest(unittest.TestCase):
+    def testFetch(self):
+        """Testing fetch_with_timeout"""
+        self.assertEqual(
+            diffutils.fetch_with_timeout('fetch-test-fast', lambda: 'data',
+                                         5, '/foo', '1'),
+            'data')
+
+    def testFetchError(self):
+        """Testing fetch_with_timeout passes on errors"""
+        def fetch():
+            raise FileNotFoundError('/foo', '1')
+
+        self.assertRaises(FileNotFoundError,
+                          lambda: diffutils.fetch_with_timeout(
+                              'fetch-test-error', fetch, 5, '/foo', '1'))
+
+    def testFetchTimeout(self):
+        """Testing fetch_with_timeout caches slow files in the background"""
+        key = 'fetch-test-slow'
+        event = threading.Event()
+
+        def fetch():
+            event.wait()
+            return 'data'
+
+        self.assertRaises(SCMTimeoutError,
+                          lambda: diffutils.fetch_with_timeout(
+                              key, fetch, 0.01, '/foo', '1'))
+
+        fetch_thread = diffutils._pending_fetches[key]
+        event.set()
+        fetch_thread.join()
+
+        self.assertFalse(key in diffutils._pending_fetches)
+        self.assertEqual(cache_memoize(key, lambda: ['refetched'],
+                                       large_data=True),
+                         ['data'])
+
+    def testFetchHung(self):
+        """Testing fetch_with_timeout replaces hung fetches"""
+        key = 'fetch-test-hung'
+        event = threading.Event()
+
+        def fetch():
+            event.wait()
+            return 'hung'
+
+        self.assertRaises(SCMTimeoutError,
+                          lambda: diffutils.fetch_with_timeout(
+                              key, fetch, 0.01, '/foo', '1'))
+
+        hung_thread = diffutils._pending_fetches[key]
+        hung_thread.started -= diffutils.MAX_FETCH_AGE + 1
+
+        try:
+            self.assertEqual(
+                diffutils.fetch_with_timeout(key, lambda: 'data', 5,
+                                             '/foo', '1'),
+                'data')
+            self.assertFalse(key in diffutils._pending_fetches)
+        finally:
+            event.set()
+            hung_thread.join()
+
+    def testFetchRepositoryLimit(self):
+        """Testing fetch_with_timeout limits fetches per repository"""
+        event = threading.Event()
+        threads = []
+
+        def fetch():
+            event.wait()
+            return 'data'
+
+        try:
+            for i in range(diffutils.MAX_FETCHES_PER_REPOSITORY):
+                key = 'fetch-test-limit-%s' % i
+                self.assertRaises(SCMTimeoutError,
+                                  lambda: diffutils.fetch_with_timeout(
+                                      key, fetch, 0.01, '/foo', '1', 1000))
+                threads.append(diffutils._pending_fetches[key])
+
+            try:
+                diffutils.fetch_with_timeout('fetch-test-limit', fetch, 0.01,
+                                             '/foo', '1', 1000)
+                self.fail('SCMError was not raised')
+            except SCMTimeoutError:
+                self.fail('A new fetch was started')
+            except SCMError:
+                pass
+
+            self.assertFalse('fetch-test-limit' in diffutils._pending_fetches)
+        finally:
+            event.set()
+
+            for thread in threads:
+                thread.join()
+
+        self.assertFalse(1000 in diffutils._repository_fetch_counts)
+
 
 class DbTests(TestCase):
     """Unit tests for database operations."""
@@ -427,3 +877,30 @@ class DbTests(TestCase):
 
         filediff = FileDiff.objects.get(pk=filediff.id)
         self.assertEquals(filediff.source_file, long_filename)
+
+    def testDiffFileList(self):
+        """Testing get_diff_file_list and load_diff_file_list"""
+        repository = Repository.objects.get(pk=1)
+        diffset = DiffSet.objects.create(name='test',
+                                         revision=1,
+                                         repository=repository)
+
+        for filename in ('b.c', 'a.c'):
+            FileDiff.objects.create(source_file=filename,
+                                    dest_file=filename,
+                                    source_revision='1',
+                                    dest_detail='',
+                                    diff='+a\n',
+                                    diffset=diffset)
+
+        file_list = diffutils.get_diff_file_list(diffset)
+        self.assertEqual([f['depot_filename'] for f in file_list],
+                         ['a.c', 'b.c'])
+        self.assertFalse('filediff' in file_list[0])
+
+        files = diffutils.load_diff_file_list(file_list, diffset)
+        self.assertEqual(len(files), 2)
+        self.assertEqual(files[0]['filediff'].id, file_list[0]['filediff_id'])
+        self.assertEqual(files[0]['filediff'].source_file, 'a.c')
+        self.assertEqual(files[0]['interfilediff'], None)
+        self.assertFalse('filediff' in file_list[0])
@@ -1,26 +1,56 @@
 import logging
+import re
+import time
 import traceback
+from cStringIO import StringIO
+from gzip import GzipFile
 
 from django.conf import settings
 from django.core.paginator import Paginator
-from django.http import HttpResponse, HttpResponseServerError
+from django.http import HttpResponse, HttpResponseNotModified, \
+                        HttpResponseServerError
 from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
 from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.utils.encoding import smart_str
+from django.utils.safestring import mark_safe
+from django.utils.text import compress_string
 from django.utils.translation import ugettext as _
 
 from djblets.siteconfig.models import SiteConfiguration
+from djblets.util.dates import get_latest_timestamp
+from djblets.util.http import etag_if_none_match, set_etag, \
+                              set_last_modified
 from djblets.util.misc import cache_memoize, get_object_or_none
 
 from reviewboard.diffviewer.models import DiffSet, FileDiff
 from reviewboard.diffviewer.diffutils import UserVisibleError, \
+                                             get_diff_file_list, \
                                              get_diff_files, \
-                                             get_enable_highlighting
+                                             get_enable_highlighting, \
+                                             get_file_lines, \
+                                             get_file_lines_in_range, \
+                                             load_diff_file_list, \
+                                             populate_diff_chunks, \
+                                             set_fetch_deadline
+from reviewboard.diffviewer.renderers import render_context_lines, \
+                                             render_file_chunks
+from reviewboard.scmtools.errors import SCMTimeoutError
 
 
-def build_diff_fragment(request, file, chunkindex, highlighting, collapseall,
-                        context,
-                        template_name='diffviewer/diff_file_fragment.html'):
+ACCEPTS_GZIP_RE = re.compile(r'\bgzip\b')
+
+
+def get_diff_fragment_cache_key(file, chunkindex, highlighting, collapseall,
+                                template_name):
+    """
+    Returns the cache key for a rendered diff fragment.
+
+    This only depends on information available without loading the chunks
+    for the file, so callers can check for a cached fragment before
+    loading them.
+    """
     key = "%s-%s-%s-" % (template_name, file['index'],
                          file['filediff'].diffset.revision)
 
@@ -33,6 +63,29 @@ def build_diff_fragment(request, file, chunkindex, highlighting, collapseall,
     else:
         key += str(file['filediff'].id)
 
+    if chunkindex:
+        key += '-chunk-%s' % int(chunkindex)
+
+    if file['summary_only']:
+        key += '-summary'
+
+    if collapseall:
+        key += '-collapsed'
+
+    if highlighting:
+        key += '-highlighting'
+
+    key += '-%s' % settings.AJAX_SERIAL
+
+    return key
+
+
+def build_diff_fragment(request, file, chunkindex, highlighting, collapseall,
+                        context,
+                        template_name='diffviewer/diff_file_fragment.html'):
+    key = get_diff_fragment_cache_key(file, chunkindex, highlighting,
+                                      collapseall, template_name)
+
     if chunkindex:
         chunkindex = int(chunkindex)
         if chunkindex < 0 or chunkindex >= len(file['chunks']):
@@ -40,22 +93,126 @@ def build_diff_fragment(request, file, chunkindex, highlighting, collapseall,
                                    chunkindex)
 
         file['chunks'] = [file['chunks'][chunkindex]]
-        key += '-chunk-%s' % chunkindex
 
     if collapseall:
-        key += '-collapsed'
         context['collapseall'] = True
 
-    if highlighting:
-        key += '-highlighting'
+    context['file'] = file
 
-    key += '-%s' % settings.AJAX_SERIAL
+    def render_fragment():
+        if not file['binary'] and not file['deleted']:
+            context['chunks_html'] = mark_safe(
+                render_file_chunks(file, collapseall,
+                                   context.get('base_url', '')))
 
-    context['file'] = file
+        return render_to_string(template_name,
+                                RequestContext(request, context))
+
+    return cache_memoize(key, render_fragment)
+
+
+def accepts_gzip(request, mimetype):
+    """
+    Returns whether a response of the given mimetype can be sent to the
+    client gzip-compressed.
+
+    This follows the same rules as GZipMiddleware.
+    """
+    if not ACCEPTS_GZIP_RE.search(request.META.get('HTTP_ACCEPT_ENCODING',
+                                                   '')):
+        return False
+
+    # MSIE has issues with gzipped responses of various content types.
+    if "msie" in request.META.get('HTTP_USER_AGENT', '').lower():
+        mimetype = mimetype.lower()
+        return mimetype.startswith("text/") and "javascript" not in mimetype
+
+    return True
+
+
+class StreamingHttpResponse(HttpResponse):
+    """
+    An HttpResponse whose content is sent to the client from an iterator.
+
+    Django writes iterator content out piece by piece, so large content
+    never needs to be held in memory. However, reading ``content`` consumes
+    the iterator. If something does need the full content, it's joined and
+    kept, so the response is still sent intact.
+
+    The ``streaming`` attribute lets middleware skip processing that would
+    need the full content.
+    """
+    streaming = True
+
+    def _get_content(self):
+        if not self._is_string:
+            self._container = [''.join([smart_str(e, self._charset)
+                                        for e in self._container])]
+            self._is_string = True
+
+        return HttpResponse._get_content(self)
+
+    content = property(_get_content, HttpResponse._set_content)
+
+
+def compress_iter(iterable):
+    """
+    Returns the gzip-compressed form of the strings from an iterable.
+
+    Each string is compressed as it's read, so only the compressed data
+    is held in memory in full.
+    """
+    buf = StringIO()
+    zfile = GzipFile(mode='wb', compresslevel=6, fileobj=buf)
+
+    for data in iterable:
+        zfile.write(smart_str(data))
+
+    zfile.close()
+
+    return buf.getvalue()
 
-    return cache_memoize(key,
-        lambda: render_to_string(template_name,
-                                 RequestContext(request, context)))
+
+def build_compressible_response(request, key, lookup_callable,
+                                mimetype=None, streaming=False):
+    """
+    Returns an HttpResponse for content that can be served pre-compressed.
+
+    If the client accepts gzip, the content is compressed once and stored
+    in the cache under a variant of the given key, and the compressed data
+    is served directly with a ``Content-Encoding: gzip`` header. This
+    saves GZipMiddleware from compressing the same data on every request.
+
+    Otherwise, the content is returned from ``lookup_callable`` as-is.
+
+    If ``streaming`` is True, ``lookup_callable`` returns an iterator of
+    strings rather than a single string. The uncompressed content is then
+    streamed to the client, and the compressed content is built up
+    incrementally, so the full uncompressed content is never held in
+    memory.
+    """
+    if accepts_gzip(request, mimetype or settings.DEFAULT_CONTENT_TYPE):
+        if streaming:
+            compress = lambda: compress_iter(lookup_callable())
+        else:
+            compress = lambda: compress_string(smart_str(lookup_callable()))
+
+        # As with file contents, wrap the data in a list so that the cache
+        # backend doesn't try to convert it to unicode.
+        data = cache_memoize('%s-gzip' % key, lambda: [compress()],
+                             large_data=True)[0]
+
+        response = HttpResponse(data, mimetype=mimetype)
+        response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = str(len(data))
+    elif streaming:
+        response = StreamingHttpResponse(lookup_callable(), mimetype=mimetype)
+    else:
+        response = HttpResponse(lookup_callable(), mimetype=mimetype)
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+    return response
 
 
 def get_collapse_diff(request):
@@ -69,11 +226,41 @@ def get_collapse_diff(request):
         return True
 
 
+def get_diff_etag(diffset, interdiffset, highlighting, collapseall, *extra):
+    """
+    Returns an ETag for a rendered diff or diff fragment.
+
+    The ETag is based on the timestamps of the diffsets being shown, the
+    user's syntax highlighting preference, the collapse state and the
+    AJAX serial. Any extra values that affect the rendered page can be
+    passed and will be included.
+    """
+    if interdiffset:
+        interdiffset_timestamp = interdiffset.timestamp
+    else:
+        interdiffset_timestamp = ""
+
+    return ":".join([unicode(value) for value in
+                     (diffset.id, diffset.timestamp,
+                      interdiffset_timestamp, int(bool(highlighting)),
+                      int(bool(collapseall))) +
+                     extra +
+                     (settings.AJAX_SERIAL,)])
+
+
 def view_diff(request, diffset_id, interdiffset_id=None, extra_context={},
-              template_name='diffviewer/view_diff.html'):
+              template_name='diffviewer/view_diff.html', etag_extra=()):
     diffset = get_object_or_404(DiffSet, pk=diffset_id)
     interdiffset = get_object_or_none(DiffSet, pk=interdiffset_id)
     highlighting = get_enable_highlighting(request.user)
+    collapse_diffs = get_collapse_diff(request)
+
+    # Find out if we can bail early.
+    etag = get_diff_etag(diffset, interdiffset, highlighting, collapse_diffs,
+                         request.user, *etag_extra)
+
+    if etag_if_none_match(request, etag):
+        return HttpResponseNotModified()
 
     try:
         if interdiffset_id:
@@ -84,13 +271,13 @@ def view_diff(request, diffset_id, interdiffset_id=None, extra_context={},
             logging.debug("Generating diff viewer page for filediff id %s",
                           diffset_id)
 
-        files = get_diff_files(diffset, None, interdiffset,
-                               highlighting, False)
+        file_list = get_diff_file_list(diffset, interdiffset,
+                                       summarize_large_files=True)
 
         # Break the list of files into pages
         siteconfig = SiteConfiguration.objects.get_current()
 
-        paginator = Paginator(files,
+        paginator = Paginator(file_list,
                               siteconfig.get("diffviewer_paginate_by"),
                               siteconfig.get("diffviewer_paginate_orphans"))
 
@@ -99,22 +286,21 @@ def view_diff(request, diffset_id, interdiffset_id=None, extra_context={},
         if request.GET.get('file', False):
             file_id = int(request.GET['file'])
 
-            for i, f in enumerate(files):
-                if f['filediff'].id == file_id:
+            for i, f in enumerate(file_list):
+                if f['filediff_id'] == file_id:
                     page_num = i // paginator.per_page + 1
                     if page_num > paginator.num_pages:
                         page_num = paginator.num_pages
                     break
 
         page = paginator.page(page_num)
-
-        collapse_diffs = get_collapse_diff(request)
+        files = load_diff_file_list(page.object_list, diffset, interdiffset)
 
         context = {
             'diffset': diffset,
             'interdiffset': interdiffset,
             'diffset_pair': (diffset, interdiffset),
-            'files': page.object_list,
+            'files': files,
             'collapseall': collapse_diffs,
 
             # Add the pagination context
@@ -137,32 +323,32 @@ def view_diff(request, diffset_id, interdiffset_id=None, extra_context={},
         # diff immediately and instead saw a spinner, making them feel it was
         # taking longer than it used to to load a page. We just trick the
         # user by providing that first file.
-        if page.object_list:
-            first_file = page.object_list[0]
-        else:
-            first_file = None
-
-        if first_file:
-            filediff = first_file['filediff']
-
-            if filediff.diffset == interdiffset:
-                temp_files = get_diff_files(interdiffset, filediff,
-                                            None, highlighting, True)
-            else:
-                temp_files = get_diff_files(diffset, filediff,
-                                            interdiffset, highlighting, True)
-
-            if temp_files:
-                file_temp = temp_files[0]
-                file_temp['index'] = first_file['index']
-                first_file['fragment'] = \
-                    build_diff_fragment(request, file_temp, None,
-                                        highlighting, collapse_diffs, context,
-                                        'diffviewer/diff_file_fragment.html')
+        if files:
+            first_file = files[0]
+            file_temp = dict(first_file)
+
+            set_fetch_deadline(time.time() +
+                               diffset.repository.get_timeout())
+
+            try:
+                try:
+                    populate_diff_chunks([file_temp], highlighting)
+                    first_file['fragment'] = \
+                        build_diff_fragment(
+                            request, file_temp, None, highlighting,
+                            collapse_diffs, context,
+                            'diffviewer/diff_file_fragment.html')
+                except SCMTimeoutError:
+                    # Rather than holding up the page, let the file be
+                    # loaded along with the rest once the page is shown.
+                    pass
+            finally:
+                set_fetch_deadline(None)
 
         response = render_to_response(template_name,
                                       RequestContext(request, context))
         response.set_cookie('collapsediffs', collapse_diffs)
+        set_etag(response, etag)
 
         if interdiffset_id:
             logging.debug("Done generating diff viewer page for interdiffset "
@@ -192,7 +378,8 @@ def view_diff_fragment(
 
     def get_requested_diff_file(get_chunks=True):
         files = get_diff_files(diffset, filediff, interdiffset, highlighting,
-                               get_chunks)
+                               get_chunks,
+                               summarize_large_files=not show_full)
 
         if files:
             assert len(files) == 1
@@ -210,37 +397,157 @@ def view_diff_fragment(
     interdiffset = get_object_or_none(DiffSet, pk=interdiffset_id)
     highlighting = get_enable_highlighting(request.user)
 
+    # Large and generated files are only shown as a summary, unless the
+    # user has asked to see the full diff.
+    show_full = bool(chunkindex or request.GET.get('show-full', False))
+
     if chunkindex:
         collapseall = False
     else:
         collapseall = get_collapse_diff(request)
 
+    # The fragment only changes when the diffsets or display settings do.
+    # Check this before doing any work on the chunks.
+    etag = get_diff_etag(diffset, interdiffset, highlighting, collapseall,
+                         filediff.id, request.GET.get('index', ''),
+                         chunkindex, base_url, int(show_full))
+
+    if etag_if_none_match(request, etag):
+        return HttpResponseNotModified()
+
+    set_fetch_deadline(time.time() + diffset.repository.get_timeout())
+
     try:
-        file = get_requested_diff_file()
-
-        if file:
-            context = {
-                'standalone': chunkindex is not None,
-                'base_url': base_url,
-            }
-
-            return HttpResponse(build_diff_fragment(request, file,
-                                                    chunkindex,
-                                                    highlighting, collapseall,
-                                                    context, template_name))
-        raise UserVisibleError(
-            _(u"Internal error. Unable to locate file record for filediff %s") % \
-            filediff.id)
+        try:
+            # The chunks are only loaded if the fragment needs to be rendered.
+            file = get_requested_diff_file(False)
+
+            if file:
+                context = {
+                    'standalone': chunkindex is not None,
+                    'base_url': base_url,
+                }
+
+                key = get_diff_fragment_cache_key(file, chunkindex,
+                                                  highlighting, collapseall,
+                                                  template_name)
+
+                response = build_compressible_response(
+                    request, key,
+                    lambda: build_diff_fragment(request,
+                                                get_requested_diff_file(),
+                                                chunkindex, highlighting,
+                                                collapseall, context,
+                                                template_name))
+                set_etag(response, etag)
+
+                if interdiffset:
+                    set_last_modified(
+                        response,
+                        get_latest_timestamp([diffset.timestamp,
+                                              interdiffset.timestamp]))
+                else:
+                    set_last_modified(response, diffset.timestamp)
+
+                return response
+            raise UserVisibleError(
+                _(u"Internal error. Unable to locate file record for "
+                  u"filediff %s") % filediff.id)
+        except Exception, e:
+            return exception_traceback(
+                request, e, error_template_name,
+                extra_context={'file': get_requested_diff_file(False)})
+    finally:
+        set_fetch_deadline(None)
+
+
+def view_diff_lines(
+    request,
+    diffset_id,
+    filediff_id,
+    interdiffset_id=None,
+    error_template_name='diffviewer/diff_fragment_error.html'):
+    """
+    View which renders lines of unchanged context from a diffed file.
+
+    This is used to show more context around a chunk, such as the 20 lines
+    above it. Rather than loading the chunks for the file, the lines are
+    taken from a cached copy of the rendered old and new files.
+
+    The lines are specified with the following query arguments:
+
+        ``line``     - The line number in the diff of the first line.
+        ``old_line`` - The line number in the old file of the first line.
+        ``new_line`` - The line number in the new file of the first line.
+        ``num_lines`` - The number of lines to render.
+
+    The result is a ``<tbody>`` for the lines.
+    """
+    diffset = get_object_or_404(DiffSet, pk=diffset_id)
+    filediff = get_object_or_404(FileDiff, pk=filediff_id, diffset=diffset)
+    interdiffset = get_object_or_none(DiffSet, pk=interdiffset_id)
+    highlighting = get_enable_highlighting(request.user)
+
+    try:
+        try:
+            first_line = int(request.GET['line'])
+            old_first_line = int(request.GET['old_line'])
+            new_first_line = int(request.GET['new_line'])
+            num_lines = int(request.GET['num_lines'])
+        except (KeyError, ValueError):
+            raise UserVisibleError(_(u"Invalid line range specified."))
+
+        etag = get_diff_etag(diffset, interdiffset, highlighting, False,
+                             filediff.id, request.GET.get('index', ''),
+                             first_line, old_first_line, new_first_line,
+                             num_lines)
+
+        if etag_if_none_match(request, etag):
+            return HttpResponseNotModified()
+
+        set_fetch_deadline(time.time() + diffset.repository.get_timeout())
+
+        try:
+            files = get_diff_files(diffset, filediff, interdiffset,
+                                   highlighting, False)
+
+            if not files:
+                raise UserVisibleError(
+                    _(u"Internal error. Unable to locate file record for "
+                      u"filediff %s") % filediff.id)
+
+            assert len(files) == 1
+            file = files[0]
+
+            if file['binary'] or file['deleted']:
+                raise UserVisibleError(
+                    _(u"Lines cannot be shown for binary or deleted files."))
+
+            file_lines = get_file_lines(file['filediff'],
+                                        file['interfilediff'],
+                                        file['force_interdiff'],
+                                        highlighting)
+            lines = get_file_lines_in_range(file_lines, first_line,
+                                            old_first_line, new_first_line,
+                                            num_lines)
+
+            response = HttpResponse(
+                render_context_lines(request.GET.get('index', file['index']),
+                                     lines))
+            set_etag(response, etag)
+
+            return response
+        finally:
+            set_fetch_deadline(None)
     except Exception, e:
-        return exception_traceback(
-            request, e, error_template_name,
-            context={'file': get_requested_diff_file(False)})
+        return exception_traceback(request, e, error_template_name)
 
 
 def exception_traceback_string(request, e, template_name, extra_context={}):
     context = { 'error': e }
     context.update(extra_context)
-    if e.__class__ is not UserVisibleError:
+    if (e.__class__ is not UserVisibleError and
+        not isinstance(e, SCMTimeoutError)):
         context['trace'] = traceback.format_exc()
 
     if request:
@@ -252,5 +559,13 @@ def exception_traceback_string(request, e, template_name, extra_context={}):
 
 
 def exception_traceback(request, e, template_name, extra_context={}):
-    return HttpResponseServerError(
-        exception_traceback_string(request, e, template_name, extra_context))
+    content = exception_traceback_string(request, e, template_name,
+                                         extra_context)
+
+    if isinstance(e, SCMTimeoutError):
+        # The file is still being fetched, so the client can try again.
+        response = HttpResponse(content, status=503)
+        response['Retry-After'] = 5
+        return response
+
+    return HttpResponseServerError(content)
@@ -132,8 +132,17 @@ RB.Diff = function(review_request, revision, interdiff_revision) {
 }
 
 $.extend(RB.Diff.prototype, {
-    getDiffFragment: function(review_base_url, fileid, filediff_id, revision,
-                              interdiff_revision, chunk_index, onSuccess) {
+    /*
+     * Fetches the HTML for lines of unchanged context in a file.
+     *
+     * The lines start at line number old_line in the original file and
+     * new_line in the modified file, and are numbered starting at line in
+     * the diff. This is used to show more context around a chunk without
+     * loading the entire fragment.
+     */
+    getDiffLines: function(review_base_url, fileid, filediff_id, revision,
+                           interdiff_revision, line, old_line, new_line,
+                           num_lines, onSuccess) {
         var revisionStr = revision;
 
         if (interdiff_revision != null) {
@@ -142,8 +151,14 @@ $.extend(RB.Diff.prototype, {
 
         rbApiCall({
             url: review_base_url + 'diff/' + revisionStr + '/fragment/' +
-                 filediff_id + '/chunk/' + chunk_index + '/',
-            data: {},
+                 filediff_id + '/lines/',
+            data: {
+                index: fileid,
+                line: line,
+                old_line: old_line,
+                new_line: new_line,
+                num_lines: num_lines
+            },
             type: "GET",
             dataType: "html",
             complete: function(res, status) {
@@ -230,6 +245,7 @@ RB.ReviewRequest = function(id, path) {
 $.extend(RB.ReviewRequest, {
     /* Constants */
     CHECK_UPDATES_MSECS: 5 * 60 * 1000, // Every 5 minutes
+    LONG_POLL_DELAY_MSECS: 1000,
     CLOSE_DISCARDED: 1,
     CLOSE_SUBMITTED: 2
 });
@@ -325,20 +341,25 @@ $.extend(RB.ReviewRequest.prototype, {
         });
     },
 
-    beginCheckForUpdates: function(type, lastUpdateTimestamp) {
-        var self = this;
-
+    beginCheckForUpdates: function(type, lastUpdateTimestamp, longPoll) {
         this.checkUpdatesType = type;
         this.lastUpdateTimestamp = lastUpdateTimestamp;
+        this.longPollUpdates = longPoll;
 
-        setTimeout(function() { self._checkForUpdates(); },
-                   RB.ReviewRequest.CHECK_UPDATES_MSECS);
+        this._scheduleCheckForUpdates(this.longPollUpdates
+                                      ? RB.ReviewRequest.LONG_POLL_DELAY_MSECS
+                                      : RB.ReviewRequest.CHECK_UPDATES_MSECS);
     },
 
-    _checkForUpdates: function() {
+    _scheduleCheckForUpdates: function(delay) {
         var self = this;
 
-        this._apiCall({
+        setTimeout(function() { self._checkForUpdates(); }, delay);
+    },
+
+    _checkForUpdates: function() {
+        var self = this;
+        var options = {
             type: "GET",
             noActivityIndicator: true,
             path: "/last-update/",
@@ -351,10 +372,31 @@ $.extend(RB.ReviewRequest.prototype, {
 
                 self.lastUpdateTimestamp = rsp.timestamp;
 
-                setTimeout(function() { self._checkForUpdates(); },
-                           RB.ReviewRequest.CHECK_UPDATES_MSECS);
+                /*
+                 * When long polling, the server only responds once there's
+                 * an update or it's waited long enough, so check again
+                 * right away.
+                 */
+                self._scheduleCheckForUpdates(self.longPollUpdates
+                    ? RB.ReviewRequest.LONG_POLL_DELAY_MSECS
+                    : RB.ReviewRequest.CHECK_UPDATES_MSECS);
             }
-        });
+        };
+
+        if (this.longPollUpdates) {
+            options.data = { since: this.lastUpdateTimestamp };
+
+            /*
+             * Waiting requests may be cut off by proxies. Try again later,
+             * rather than showing an error.
+             */
+            options.error = function() {
+                self._scheduleCheckForUpdates(
+                    RB.ReviewRequest.CHECK_UPDATES_MSECS);
+            };
+        }
+
+        this._apiCall(options);
     },
 
     _apiCall: function(options) {
@@ -100,6 +100,7 @@ var gInterdiffFileAnchorToId = {};
 var gAnchors = $();
 var gCommentDlg = null;
 var gHiddenComments = {};
+var gFileCommentCounts = {};
 var gDiffHighlightBorder = null;
 var gStartAtAnchor = null;
 
@@ -1068,17 +1069,26 @@ function addCommentFlags(table, lines, key) {
 /*
  * Expands a chunk of the diff.
  *
- * @param {string} fileid              The file ID.
+ * The hidden lines are loaded from the rendered lines of the file, rather
+ * than from the file's full list of chunks.
+ *
+ * @param {string} review_base_url     The URL of the review request.
+ * @param {string} fileid              The file index.
  * @param {string} filediff_id         The FileDiff ID.
  * @param {string} revision            The revision of the file.
  * @param {string} interdiff_revision  The interdiff revision of the file.
- * @param {int}    chunk_index         The chunk index number.
- * @param {string} tbody_id            The tbody ID to insert into.
+ * @param {int}    line                The diff line number of the first line.
+ * @param {int}    old_line            The first line in the original file.
+ * @param {int}    new_line            The first line in the modified file.
+ * @param {int}    num_lines           The number of hidden lines.
+ * @param {object} link                The "Expand" link that was clicked.
  */
-function expandChunk(fileid, filediff_id, revision, interdiff_revision,
-                     chunk_index, link) {
-    gDiff.getDiffFragment(fileid, filediff_id, revision, interdiff_revision,
-                          chunk_index, function(html) {
+function expandChunk(review_base_url, fileid, filediff_id, revision,
+                     interdiff_revision, line, old_line, new_line, num_lines,
+                     link) {
+    gDiff.getDiffLines(review_base_url, fileid, filediff_id, revision,
+                       interdiff_revision, line, old_line, new_line,
+                       num_lines, function(html) {
         var tbody = $(link).parents("tbody.diff-header");
         var table = tbody.parent();
         var key = "file" + filediff_id;
@@ -1092,6 +1102,44 @@ function expandChunk(fileid, filediff_id, revision, interdiff_revision,
 }
 
 
+/*
+ * Loads the full diff for a file that's only being shown as a summary.
+ *
+ * Large and generated files are only shown as a summary by default. This
+ * replaces the summary with the full diff of the file.
+ *
+ * @param {string} review_base_url     The URL of the review request.
+ * @param {string} filediff_id         The filediff ID.
+ * @param {string} revision            The filediff revision.
+ * @param {string} interdiff_revision  The interdiff revision (optional).
+ * @param {string} file_index          The file index.
+ */
+function showFullFileDiff(review_base_url, filediff_id, revision,
+                          interdiff_revision, file_index) {
+    var revisionStr = revision;
+
+    if (interdiff_revision != null) {
+        revisionStr += "-" + interdiff_revision;
+    }
+
+    $.ajax({
+        type: "GET",
+        url: review_base_url + "diff/" + revisionStr + "/fragment/" +
+             filediff_id + "/?index=" + file_index + "&show-full=1&" +
+             AJAX_SERIAL,
+        complete: function(xhr) {
+            var key = "file" + filediff_id;
+
+            $("#" + key).replaceWith(xhr.responseText);
+
+            var diffTable = $("#" + key);
+            diffTable.diffFile(gFileCommentCounts[key] || [], key);
+            updateAnchors(diffTable);
+        }
+    });
+}
+
+
 /*
  * Scrolls to the anchor at a specified location.
  *
@@ -1214,6 +1262,8 @@ function loadFileDiff(filediff_id, filediff_revision,
     function setupFileDiff() {
         var key = "file" + filediff_id;
 
+        gFileCommentCounts[key] = comment_counts;
+
         gFileAnchorToId[key] = {
             'id': filediff_id,
             'revision': filediff_revision
@@ -1116,8 +1116,10 @@ $.screenshotThumbnail = function(screenshot) {
  *                                comparison purposes.
  * @param {string} type           The type of update to watch for, or
  *                                undefined for all types.
+ * @param {bool}   longPoll       Whether the server waits for updates,
+ *                                rather than being checked periodically.
  */
-function registerForUpdates(lastTimestamp, type) {
+function registerForUpdates(lastTimestamp, type, longPoll) {
     var bubble = $("#updates-bubble");
     var summaryEl;
     var userEl;
@@ -1161,7 +1163,7 @@ function registerForUpdates(lastTimestamp, type) {
             .fadeIn();
     });
 
-    gReviewRequest.beginCheckForUpdates(type, lastTimestamp);
+    gReviewRequest.beginCheckForUpdates(type, lastTimestamp, longPoll);
 }
 
 
@@ -0,0 +1,165 @@
+import random
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+# How long, in seconds, a user's memberships are cached between requests.
+ACCESS_CACHE_EXPIRATION = 60
+
+# The cache key holding the current generation of cached memberships. This
+# changes whenever memberships change, which invalidates the old entries.
+ACCESS_GENERATION_KEY = 'access-generation'
+
+# Memberships looked up during the current request, if any.
+_request_cache = threading.local()
+
+
+def start_request_cache():
+    """Starts caching memberships for the current request.
+
+    This is called by AccessCacheMiddleware. Outside of a request, only the
+    cross-request cache is used.
+    """
+    _request_cache.memberships = {}
+
+
+def end_request_cache():
+    """Stops caching memberships for the current request."""
+    _request_cache.memberships = None
+
+
+def get_user_group_ids(user):
+    """Returns the IDs of the review groups the user is a member of."""
+    return _get_memberships(user)[0]
+
+
+def get_user_repository_ids(user):
+    """Returns the IDs of the repositories the user has explicit access to.
+
+    This includes repositories that list the user, and repositories that
+    list a review group the user is a member of.
+    """
+    return _get_memberships(user)[1]
+
+
+def filter_accessible(queryset, user):
+    """Filters a queryset of review requests down to those the user can read.
+
+    This applies the same rules as ReviewRequest.is_accessible_by, but for
+    all the review requests in a single query, rather than several queries
+    for each review request.
+    """
+    if not user.has_perm('reviews.can_edit_reviewrequest'):
+        q = Q(public=True)
+
+        if user.is_authenticated():
+            q = q | Q(submitter=user)
+
+        queryset = queryset.filter(q)
+
+    repository_q = Q(repository__isnull=True) | Q(repository__public=True)
+    repository_ids = get_user_repository_ids(user)
+
+    if repository_ids:
+        repository_q = repository_q | Q(repository__in=repository_ids)
+
+    queryset = queryset.filter(repository_q)
+
+    if not user.is_superuser:
+        target_q = Q(target_groups__isnull=True) | \
+                   Q(target_groups__invite_only=False)
+        group_ids = get_user_group_ids(user)
+
+        if group_ids:
+            target_q = target_q | Q(target_groups__in=group_ids)
+
+        if user.is_authenticated():
+            target_q = target_q | Q(target_people=user)
+
+        queryset = queryset.filter(target_q)
+
+    return queryset.distinct()
+
+
+def _get_memberships(user):
+    if not user.is_authenticated():
+        return frozenset(), frozenset()
+
+    request_memberships = getattr(_request_cache, 'memberships', None)
+
+    if request_memberships is not None and user.pk in request_memberships:
+        return request_memberships[user.pk]
+
+    key = 'user-access:%s:%s' % (_get_generation(), user.pk)
+    memberships = cache.get(key)
+
+    if memberships is None:
+        from reviewboard.scmtools.models import Repository
+
+        group_ids = frozenset(user.review_groups.values_list('pk', flat=True))
+        repository_ids = frozenset(
+            Repository.objects.filter(Q(users=user.pk) |
+                                      Q(review_groups__users=user.pk))
+                              .values_list('pk', flat=True))
+        memberships = (group_ids, repository_ids)
+        cache.set(key, memberships, ACCESS_CACHE_EXPIRATION)
+
+    if request_memberships is not None:
+        request_memberships[user.pk] = memberships
+
+    return memberships
+
+
+def _get_generation():
+    generation = cache.get(ACCESS_GENERATION_KEY)
+
+    if generation is None:
+        cache.add(ACCESS_GENERATION_KEY, _make_generation(),
+                  settings.CACHE_EXPIRATION_TIME)
+        generation = cache.get(ACCESS_GENERATION_KEY)
+
+    return generation
+
+
+def _make_generation():
+    return '%x' % random.getrandbits(64)
+
+
+def _on_memberships_changed(**kwargs):
+    cache.set(ACCESS_GENERATION_KEY, _make_generation(),
+              settings.CACHE_EXPIRATION_TIME)
+
+    if getattr(_request_cache, 'memberships', None):
+        _request_cache.memberships.clear()
+
+
+def _on_m2m_changed(action, **kwargs):
+    if action.startswith('post_'):
+        _on_memberships_changed()
+
+
+def _on_object_saved(created, **kwargs):
+    # IDs of deleted objects may be reused by new ones, so the cached
+    # memberships must not outlive them.
+    if created:
+        _on_memberships_changed()
+
+
+def connect_signals():
+    """Invalidates cached memberships whenever they may have changed."""
+    from reviewboard.reviews.models import Group
+    from reviewboard.scmtools.models import Repository
+
+    for sender in (Group.users.through,
+                   Repository.users.through,
+                   Repository.review_groups.through):
+        m2m_changed.connect(_on_m2m_changed, sender=sender)
+
+    for sender in (User, Group, Repository):
+        post_save.connect(_on_object_saved, sender=sender)
+        post_delete.connect(_on_memberships_changed, sender=sender)
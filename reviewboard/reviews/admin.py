@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import ugettext_lazy as _
 
+from reviewboard.reviews import inbox
 from reviewboard.reviews.forms import DefaultReviewerForm
 from reviewboard.reviews.models import Comment, DefaultReviewer, Group, \
                                        Review, ReviewRequest, \
@@ -131,6 +132,7 @@ class ReviewRequestAdmin(admin.ModelAdmin):
 
     def close_submitted(self, request, queryset):
         rows_updated = queryset.update(status=ReviewRequest.SUBMITTED)
+        self._update_inboxes(queryset)
 
         if rows_updated == 1:
             msg = '1 review request was closed as submitted.'
@@ -145,6 +147,7 @@ class ReviewRequestAdmin(admin.ModelAdmin):
 
     def close_discarded(self, request, queryset):
         rows_updated = queryset.update(status=ReviewRequest.DISCARDED)
+        self._update_inboxes(queryset)
 
         if rows_updated == 1:
             msg = '1 review request was closed as discarded.'
@@ -159,6 +162,7 @@ class ReviewRequestAdmin(admin.ModelAdmin):
 
     def reopen(self, request, queryset):
         rows_updated = queryset.update(status=ReviewRequest.PENDING_REVIEW)
+        self._update_inboxes(queryset)
 
         if rows_updated == 1:
             msg = '1 review request was reopened.'
@@ -169,6 +173,12 @@ class ReviewRequestAdmin(admin.ModelAdmin):
 
     reopen.short_description = _("Reopen selected review requests")
 
+    def _update_inboxes(self, queryset):
+        # Updating the status in bulk skips the inboxes, which only hold
+        # pending review requests.
+        for review_request in queryset:
+            inbox.update_review_request_inbox(review_request)
+
 
 class ReviewRequestDraftAdmin(admin.ModelAdmin):
     list_display = ('summary', 'submitter', 'last_updated')
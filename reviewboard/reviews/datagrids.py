@@ -10,6 +10,7 @@ from djblets.datagrid.grids import Column, DateTimeColumn, \
 from djblets.util.templatetags.djblets_utils import ageid
 
 from reviewboard.accounts.models import Profile, LocalSiteProfile
+from reviewboard.reviews.inbox import ensure_inbox
 from reviewboard.reviews.models import Group, ReviewRequest
 from reviewboard.reviews.templatetags.reviewtags import render_star
 
@@ -77,8 +78,13 @@ class ReviewRequestStarColumn(StarColumn):
         except Profile.DoesNotExist:
             return queryset
 
-        pks = profile.starred_review_requests.filter(
-            pk__in=self.datagrid.id_list).values_list('pk', flat=True)
+        starred = profile.starred_review_requests.all()
+
+        # Without optimized sorts, this is called before the rows are known.
+        if self.datagrid.id_list:
+            starred = starred.filter(pk__in=self.datagrid.id_list)
+
+        pks = starred.values_list('pk', flat=True)
 
         self.all_starred = {}
 
@@ -121,6 +127,12 @@ class MyCommentsColumn(Column):
     A column meant to represent the status of the logged-in user's
     comments on the review.
     """
+    # The states of the user's comments, in order of priority.
+    NO_COMMENTS = 0
+    COMMENTS_PUBLISHED = 1
+    COMMENTS_SHIP_IT = 2
+    COMMENTS_DRAFTED = 3
+
     def __init__(self, *args, **kwargs):
         Column.__init__(self, *args, **kwargs)
         self.image_url = settings.MEDIA_URL + "rb/images/comment-draft-small.png"
@@ -128,72 +140,66 @@ class MyCommentsColumn(Column):
         self.image_height = 16
         self.image_alt = _("My Comments")
         self.detailed_label = _("My Comments")
+        self.db_field = "mycomments_state"
+        self.sortable = True
         self.shrink = True
 
-        # XXX It'd be nice to be able to sort on this, but datagrids currently
-        # can only sort based on stored (in the DB) values, not computed values.
-
     def augment_queryset(self, queryset):
         user = self.datagrid.request.user
 
-        if user.is_anonymous():
+        if user.is_anonymous() or not ensure_inbox(user):
             return queryset
 
-        query_dict = {
-            'user_id': str(user.id),
-        }
-
+        # The state is looked up from the user's ReviewState for the
+        # review request, so that it can be sorted on. Review requests
+        # without a state have no comments, rather than a NULL state, since
+        # databases sort NULLs differently.
         return queryset.extra(select={
-            'mycomments_my_reviews': """
-                SELECT COUNT(1)
-                  FROM reviews_review
-                  WHERE reviews_review.user_id = %(user_id)s
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-            """ % query_dict,
-            'mycomments_private_reviews': """
-                SELECT COUNT(1)
-                  FROM reviews_review
-                  WHERE reviews_review.user_id = %(user_id)s
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND NOT reviews_review.public
-            """ % query_dict,
-            'mycomments_shipit_reviews': """
-                SELECT COUNT(1)
-                  FROM reviews_review
-                  WHERE reviews_review.user_id = %(user_id)s
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND reviews_review.ship_it
-            """ % query_dict,
+            'mycomments_state': """
+                COALESCE((
+                  SELECT CASE
+                           WHEN reviews_reviewstate.has_draft
+                             THEN %(drafted)d
+                           WHEN reviews_reviewstate.has_ship_it
+                             THEN %(ship_it)d
+                           WHEN reviews_reviewstate.has_public_review
+                             THEN %(published)d
+                           ELSE %(none)d
+                         END
+                    FROM reviews_reviewstate
+                    WHERE reviews_reviewstate.user_id = %(user_id)s
+                      AND reviews_reviewstate.review_request_id =
+                          reviews_reviewrequest.id
+                ), %(none)d)
+            """ % {
+                'user_id': user.id,
+                'drafted': self.COMMENTS_DRAFTED,
+                'ship_it': self.COMMENTS_SHIP_IT,
+                'published': self.COMMENTS_PUBLISHED,
+                'none': self.NO_COMMENTS,
+            },
         })
 
     def render_data(self, review_request):
-        user = self.datagrid.request.user
-
-        if user.is_anonymous() or review_request.mycomments_my_reviews == 0:
-            return ""
-
-        image_url = None
-        image_alt = None
+        state = getattr(review_request, 'mycomments_state', None)
 
         # Priority is ranked in the following order:
         #
         # 1) Non-public (draft) reviews
         # 2) Public reviews marked "Ship It"
         # 3) Public reviews not marked "Ship It"
-        if review_request.mycomments_private_reviews > 0:
+        if state == self.COMMENTS_DRAFTED:
             image_url = self.image_url
             image_alt = _("Comments drafted")
+        elif state == self.COMMENTS_SHIP_IT:
+            image_url = settings.MEDIA_URL + \
+                        "rb/images/comment-shipit-small.png"
+            image_alt = _("Comments published. Ship it!")
+        elif state == self.COMMENTS_PUBLISHED:
+            image_url = settings.MEDIA_URL + "rb/images/comment-small.png"
+            image_alt = _("Comments published")
         else:
-            if review_request.mycomments_shipit_reviews > 0:
-                image_url = settings.MEDIA_URL + \
-                            "rb/images/comment-shipit-small.png"
-                image_alt = _("Comments published. Ship it!")
-            else:
-                image_url = settings.MEDIA_URL + "rb/images/comment-small.png"
-                image_alt = _("Comments published")
+            return ""
 
         return '<img src="%s?%s" width="%s" height="%s" alt="%s" ' \
                'title="%s" />' % \
@@ -535,6 +541,12 @@ class DashboardDataGrid(ReviewRequestDataGrid):
         else:
             raise Http404
 
+        # Sorting on My Comments needs its state in the initial query, but
+        # optimized sorts only add it to the rows once they're sorted.
+        if 'my_comments' in [sort.lstrip('-') for sort in self.sort_list]:
+            self.queryset = self.post_process_queryset(self.queryset)
+            self.optimize_sorts = False
+
         # Pre-load all querysets for the sidebar.
         self.counts = get_sidebar_counts(user, self.local_site)
 
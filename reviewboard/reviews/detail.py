@@ -0,0 +1,220 @@
+import logging
+
+from django.db.models import Q
+from django.utils.safestring import mark_safe
+
+from reviewboard.reviews.models import Review
+
+
+fields_changed_name_map = {
+    'summary': 'Summary',
+    'description': 'Description',
+    'testing_done': 'Testing Done',
+    'bugs_closed': 'Bugs Closed',
+    'branch': 'Branch',
+    'target_groups': 'Reviewers (Groups)',
+    'target_people': 'Reviewers (People)',
+    'screenshots': 'Screenshots',
+    'screenshot_captions': 'Screenshot Captions',
+    'diff': 'Diff',
+}
+
+
+def get_review_request_entries(review_request, user, last_visited):
+    """Returns the reviews and change descriptions shown on a review
+    request's page, sorted by timestamp.
+
+    Everything the page shows for them is loaded in a fixed number of
+    queries, no matter how many reviews, comments and replies there are.
+    Each review has the following lists set on it for the templates:
+
+      * ``ordered_comments``: The diff comments, by file and line.
+      * ``loaded_screenshot_comments``: The screenshot comments.
+      * ``loaded_body_top_replies``: The replies to the top of the body.
+      * ``loaded_body_bottom_replies``: The replies to the bottom of the body.
+
+    Each comment has its replies in ``loaded_replies``. Replies that are
+    drafts are only included if they're owned by ``user``.
+    """
+    q = Q(public=True)
+
+    if user.is_authenticated():
+        q = q | Q(user=user)
+
+    all_reviews = list(review_request.reviews.filter(q).select_related('user'))
+    reviews_by_id = {}
+
+    for review in all_reviews:
+        review.review_request = review_request
+        review.ordered_comments = []
+        review.loaded_screenshot_comments = []
+        review.loaded_body_top_replies = []
+        review.loaded_body_bottom_replies = []
+        reviews_by_id[review.pk] = review
+
+    reviews = []
+    latest_replies = {}
+
+    for review in all_reviews:
+        if not review.base_reply_to_id:
+            if review.public:
+                reviews.append(review)
+
+            continue
+
+        if review.body_top_reply_to_id in reviews_by_id:
+            reviews_by_id[review.body_top_reply_to_id] \
+                .loaded_body_top_replies.append(review)
+
+        if review.body_bottom_reply_to_id in reviews_by_id:
+            reviews_by_id[review.body_bottom_reply_to_id] \
+                .loaded_body_bottom_replies.append(review)
+
+        if review.public:
+            base_id = review.base_reply_to_id
+
+            if (base_id not in latest_replies or
+                latest_replies[base_id] < review.timestamp):
+                latest_replies[base_id] = review.timestamp
+
+    _load_comments(
+        reviews_by_id, 'ordered_comments',
+        Review.comments.through.objects.filter(review__in=reviews_by_id.keys())
+            .select_related('comment__filediff__diffset',
+                            'comment__interfilediff__diffset'),
+        'comment')
+    _load_comments(
+        reviews_by_id, 'loaded_screenshot_comments',
+        Review.screenshot_comments.through.objects
+            .filter(review__in=reviews_by_id.keys())
+            .select_related('screenshotcomment__screenshot'),
+        'screenshotcomment')
+
+    for review in reviews:
+        review.ordered_comments.sort(
+            key=lambda comment: (comment.filediff_id, comment.first_line))
+
+    changedescs = list(review_request.changedescs.filter(public=True))
+
+    if changedescs:
+        latest_changedesc = max(changedescs,
+                                key=lambda changedesc: changedesc.timestamp)
+        latest_timestamp = latest_changedesc.timestamp
+    else:
+        latest_changedesc = None
+        latest_timestamp = None
+
+    entries = []
+
+    for review in reviews:
+        state = ''
+
+        # Mark as collapsed if the review is older than the latest change
+        if latest_timestamp and review.timestamp < latest_timestamp:
+            state = 'collapsed'
+
+        # Mark as expanded if there is a reply newer than last_visited
+        latest_reply = latest_replies.get(review.pk)
+
+        if latest_reply and last_visited < latest_reply:
+            state = ''
+
+        entries.append({
+            'review': review,
+            'timestamp': review.timestamp,
+            'class': state,
+        })
+
+    for changedesc in changedescs:
+        # Expand the latest review change
+        state = ''
+
+        # Mark as collapsed if the change is older than a newer change
+        if changedesc != latest_changedesc:
+            state = 'collapsed'
+
+        entries.append({
+            'changeinfo': _get_fields_changed(review_request, changedesc),
+            'changedesc': changedesc,
+            'timestamp': changedesc.timestamp,
+            'class': state,
+        })
+
+    entries.sort(key=lambda item: item['timestamp'])
+
+    return entries
+
+
+def _load_comments(reviews_by_id, attrname, through_queryset, comment_field):
+    """Loads comments and their replies onto the reviews they belong to.
+
+    Comments that aren't replies are added to the list in ``attrname`` on
+    their review, and replies to the ``loaded_replies`` list on the comment
+    they reply to.
+    """
+    comments = []
+    comments_by_id = {}
+
+    for row in through_queryset:
+        comment = getattr(row, comment_field)
+        comment._review = reviews_by_id[row.review_id]
+        comment.loaded_replies = []
+        comments.append(comment)
+        comments_by_id[comment.pk] = comment
+
+    comments.sort(key=lambda comment: comment.timestamp)
+
+    for comment in comments:
+        if comment.reply_to_id is None:
+            getattr(comment._review, attrname).append(comment)
+        elif comment.reply_to_id in comments_by_id:
+            comments_by_id[comment.reply_to_id].loaded_replies.append(comment)
+
+
+def _get_fields_changed(review_request, changedesc):
+    fields_changed = []
+
+    for name, info in changedesc.fields_changed.items():
+        multiline = False
+
+        if 'added' in info or 'removed' in info:
+            change_type = 'add_remove'
+
+            # We don't hard-code URLs in the bug info, since the
+            # tracker may move, but we can do it here.
+            if (name == "bugs_closed" and
+                review_request.repository.bug_tracker):
+                bug_url = review_request.repository.bug_tracker
+                for field in info:
+                    for i, buginfo in enumerate(info[field]):
+                        try:
+                            full_bug_url = bug_url % buginfo[0]
+                            info[field][i] = (buginfo[0], full_bug_url)
+                        except TypeError:
+                            logging.warning("Invalid bugtracker url format")
+
+        elif 'old' in info or 'new' in info:
+            change_type = 'changed'
+            multiline = (name == "description" or name == "testing_done")
+
+            # Branch text is allowed to have entities, so mark it safe.
+            if name == "branch":
+                if 'old' in info:
+                    info['old'][0] = mark_safe(info['old'][0])
+
+                if 'new' in info:
+                    info['new'][0] = mark_safe(info['new'][0])
+        elif name == "screenshot_captions":
+            change_type = 'screenshot_captions'
+        else:
+            # No clue what this is. Bail.
+            continue
+
+        fields_changed.append({
+            'title': fields_changed_name_map.get(name, name),
+            'multiline': multiline,
+            'info': info,
+            'type': change_type,
+        })
+
+    return fields_changed
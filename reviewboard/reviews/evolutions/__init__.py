@@ -8,4 +8,5 @@ SEQUENCE = [
     'group_incoming_request_count',
     'group_invite_only',
     'group_visible',
+    'last_activity',
 ]
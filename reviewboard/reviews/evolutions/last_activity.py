@@ -0,0 +1,13 @@
+from django.db import models
+
+from django_evolution.mutations import AddField
+
+
+MUTATIONS = [
+    AddField('ReviewRequest', 'last_activity_time', models.DateTimeField,
+             null=True),
+    AddField('ReviewRequest', 'last_activity_type', models.CharField,
+             initial='', max_length=16),
+    AddField('ReviewRequest', 'last_activity_user', models.ForeignKey,
+             null=True, related_model='auth.User'),
+]
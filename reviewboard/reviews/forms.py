@@ -8,6 +8,7 @@ from djblets.util.misc import get_object_or_none
 
 from reviewboard.diffviewer import forms as diffviewer_forms
 from reviewboard.diffviewer.models import DiffSet
+from reviewboard.reviews import inbox
 from reviewboard.reviews.errors import OwnershipError
 from reviewboard.reviews.models import DefaultReviewer, ReviewRequest, \
                                        ReviewRequestDraft, Screenshot
@@ -182,8 +183,13 @@ class NewReviewRequestForm(forms.Form):
                 # old one is discarded.
                 review_request.status = 'P'
                 review_request.public = False
+                review_request.save()
 
-            review_request.save()
+                # The review request was removed from inboxes when it was
+                # discarded.
+                inbox.update_review_request_inbox(review_request)
+            else:
+                review_request.save()
 
         if diff_file:
             diff_form = UploadDiffForm(
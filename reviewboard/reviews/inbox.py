@@ -0,0 +1,443 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import F, Q
+from django.db.models.signals import m2m_changed, post_delete, \
+                                     post_save, pre_delete
+
+from reviewboard.reviews.signals import reply_published, review_published
+
+
+# The reasons a review request can be in a user's inbox. Each is a flag on
+# InboxEntry.
+INBOX_REASONS = ('to_user', 'to_group', 'starred')
+
+
+def get_inbox_query(user, reasons=INBOX_REASONS):
+    """Returns the query for the pending review requests in a user's inbox.
+
+    Only review requests in the inbox for one of the given reasons are
+    matched. The user's inbox is built first, if it hasn't been yet.
+
+    None is returned if the user has no inbox, which is the case for users
+    without profiles.
+    """
+    from reviewboard.reviews.models import InboxEntry
+
+    if not ensure_inbox(user):
+        return None
+
+    reasons_q = Q(**{reasons[0]: True})
+
+    for reason in reasons[1:]:
+        reasons_q = reasons_q | Q(**{reason: True})
+
+    return Q(pk__in=InboxEntry.objects.filter(reasons_q, user=user)
+                                      .values('review_request'))
+
+
+def ensure_inbox(user):
+    """Builds a user's inbox, if it hasn't been built yet.
+
+    The inbox is made up of the user's InboxEntry and ReviewState objects.
+    It's built the first time it's needed, and kept up to date from then on.
+    Returns whether the user has an inbox.
+    """
+    from reviewboard.accounts.models import Profile
+
+    try:
+        profile = user.get_profile()
+    except ObjectDoesNotExist:
+        return False
+
+    # Only the request that flags the inbox as built builds it, so that
+    # concurrent requests don't build it at the same time.
+    if (not profile.inbox_built and
+        Profile.objects.filter(pk=profile.pk, inbox_built=False)
+                       .update(inbox_built=True)):
+        try:
+            update_user_inbox(user)
+            update_user_review_states(user)
+        except:
+            Profile.objects.filter(pk=profile.pk).update(inbox_built=False)
+            raise
+
+    profile.inbox_built = True
+
+    return True
+
+
+def update_review_request_inbox(review_request):
+    """Updates the entries for a review request in every user's inbox."""
+    from reviewboard.reviews.models import InboxEntry, ReviewRequest
+
+    entries = InboxEntry.objects.filter(review_request=review_request)
+
+    if review_request.status != ReviewRequest.PENDING_REVIEW:
+        entries.delete()
+        return
+
+    reasons = {}
+
+    for reason, users in (
+        ('to_user', review_request.target_people.all()),
+        ('to_group',
+         User.objects.filter(review_groups__review_requests=review_request)),
+        ('starred', User.objects.filter(
+            profile__starred_review_requests=review_request))):
+        for user_id in users.values_list('pk', flat=True):
+            reasons.setdefault(user_id, set()).add(reason)
+
+    _sync_entries(entries, 'user_id', reasons,
+                  lambda user_id: {
+                      'user_id': user_id,
+                      'review_request_id': review_request.pk,
+                  })
+
+
+def update_user_inbox(user):
+    """Updates the entries for every review request in a user's inbox."""
+    from reviewboard.reviews.models import InboxEntry, ReviewRequest
+
+    pending = ReviewRequest.objects.filter(
+        status=ReviewRequest.PENDING_REVIEW)
+    reasons = {}
+
+    for reason, review_requests in (
+        ('to_user', pending.filter(target_people=user)),
+        ('to_group', pending.filter(target_groups__users=user)),
+        ('starred', pending.filter(starred_by__user=user))):
+        for review_request_id in review_requests.values_list('pk', flat=True):
+            reasons.setdefault(review_request_id, set()).add(reason)
+
+    _sync_entries(InboxEntry.objects.filter(user=user), 'review_request_id',
+                  reasons,
+                  lambda review_request_id: {
+                      'user_id': user.pk,
+                      'review_request_id': review_request_id,
+                  })
+
+
+def update_review_state(user_id, review_request_id, create=True):
+    """Updates the state of a user's reviews on a review request.
+
+    If ``create`` is False, the state is only updated if it already exists.
+    """
+    from reviewboard.reviews.models import Review, ReviewState
+
+    reviews = Review.objects.filter(user=user_id,
+                                    review_request=review_request_id) \
+                            .values_list('public', 'ship_it')
+    flags = _get_review_flags(list(reviews))
+
+    if not create:
+        ReviewState.objects.filter(user=user_id,
+                                   review_request=review_request_id) \
+            .update(**flags)
+        return
+
+    state, is_new = ReviewState.objects.get_or_create(
+        user_id=user_id,
+        review_request_id=review_request_id,
+        defaults=flags)
+
+    if not is_new:
+        # Only the flags are updated, so that new review counts updated
+        # at the same time aren't lost.
+        ReviewState.objects.filter(pk=state.pk).update(**flags)
+
+
+def update_user_review_states(user):
+    """Updates the state of a user's reviews on every review request.
+
+    This covers the review requests the user has reviewed or visited.
+    """
+    from reviewboard.accounts.models import ReviewRequestVisit
+    from reviewboard.reviews.models import Review, ReviewState
+
+    review_flags = {}
+
+    for review_request_id, public, ship_it in \
+        Review.objects.filter(user=user).values_list('review_request',
+                                                     'public', 'ship_it'):
+        review_flags.setdefault(review_request_id, []).append((public,
+                                                               ship_it))
+
+    visited_ids = list(ReviewRequestVisit.objects.filter(user=user)
+                                                 .values_list('review_request',
+                                                              flat=True))
+    new_review_counts = _get_new_review_counts([user.pk], visited_ids)
+    existing = dict([(state.review_request_id, state)
+                     for state in ReviewState.objects.filter(user=user)])
+
+    for review_request_id in set(review_flags.keys()) | set(visited_ids):
+        values = _get_review_flags(review_flags.get(review_request_id, []))
+        values['new_review_count'] = \
+            new_review_counts.get((user.pk, review_request_id), 0)
+
+        state = existing.get(review_request_id)
+
+        if state is None:
+            # The state may have been created since it was looked up.
+            state, is_new = ReviewState.objects.get_or_create(
+                user=user,
+                review_request_id=review_request_id,
+                defaults=values)
+
+            if is_new:
+                continue
+
+        if [key for key, value in values.iteritems()
+              if getattr(state, key) != value]:
+            ReviewState.objects.filter(pk=state.pk).update(**values)
+
+
+def _get_review_flags(reviews):
+    """Returns the ReviewState flags for a list of (public, ship_it) pairs."""
+    return {
+        'has_draft': bool([1 for public, ship_it in reviews if not public]),
+        'has_public_review': bool([1 for public, ship_it in reviews
+                                   if public]),
+        'has_ship_it': bool([1 for public, ship_it in reviews if ship_it]),
+    }
+
+
+def _sync_entries(entries, key_attr, reasons, get_lookup):
+    """Updates a set of inbox entries to match the reasons they should have.
+
+    ``reasons`` maps the key of each entry that should exist, as stored in
+    ``key_attr``, to the set of reasons for it. Existing entries with no
+    reasons are deleted. New entries are looked up by the fields returned
+    by ``get_lookup``, and created if another request hasn't already.
+    """
+    existing = {}
+    removed_ids = []
+
+    for entry in entries:
+        key = getattr(entry, key_attr)
+
+        if key in reasons:
+            existing[key] = entry
+        else:
+            removed_ids.append(entry.pk)
+
+    if removed_ids:
+        entries.filter(pk__in=removed_ids).delete()
+
+    for key, entry_reasons in reasons.iteritems():
+        flags = dict([(reason, reason in entry_reasons)
+                      for reason in INBOX_REASONS])
+        entry = existing.get(key)
+
+        if entry is None:
+            entry, is_new = entries.model.objects.get_or_create(
+                defaults=flags, **get_lookup(key))
+
+            if is_new:
+                continue
+
+        if [reason for reason, value in flags.iteritems()
+            if getattr(entry, reason) != value]:
+            entries.model.objects.filter(pk=entry.pk).update(**flags)
+
+
+def _get_new_review_counts(user_ids, review_request_ids):
+    """Returns the number of reviews the users haven't seen.
+
+    The result maps (user ID, review request ID) pairs to the number of
+    public reviews and replies by other users posted since the user last
+    visited the review request. Review requests the user hasn't visited
+    aren't included.
+    """
+    from reviewboard.accounts.models import ReviewRequestVisit
+    from reviewboard.reviews.models import Review
+
+    visits = ReviewRequestVisit.objects.filter(
+        user__in=user_ids,
+        review_request__in=review_request_ids)
+    visits_by_review_request = {}
+
+    for visit in visits:
+        visits_by_review_request.setdefault(visit.review_request_id, []) \
+            .append((visit.user_id, visit.timestamp))
+
+    counts = {}
+
+    if not visits_by_review_request:
+        return counts
+
+    reviews = Review.objects.filter(
+        public=True,
+        review_request__in=visits_by_review_request.keys())
+
+    for author_id, review_request_id, timestamp in \
+        reviews.values_list('user', 'review_request', 'timestamp'):
+        for user_id, visited in visits_by_review_request[review_request_id]:
+            if user_id != author_id and timestamp > visited:
+                key = (user_id, review_request_id)
+                counts[key] = counts.get(key, 0) + 1
+
+    return counts
+
+
+def _get_changed_ids(sender, instance, action, model, pk_set):
+    """Returns the IDs of the objects added to or removed from a relation.
+
+    The IDs are only known once the relation has changed, so None is
+    returned for the pre_* actions. Clearing a relation doesn't say what
+    was removed, so that's looked up before it's cleared.
+    """
+    if action == 'pre_clear':
+        instance._inbox_cleared_ids = list(
+            sender.objects.filter(**{instance._meta.module_name: instance})
+                          .values_list(model._meta.module_name, flat=True))
+    elif action == 'post_clear':
+        return instance.__dict__.pop('_inbox_cleared_ids', [])
+    elif action.startswith('post_'):
+        return pk_set
+
+    return None
+
+
+def _on_reviewers_changed(sender, instance, action, reverse, model, pk_set,
+                          **kwargs):
+    from reviewboard.reviews.models import ReviewRequest
+
+    if not reverse:
+        if action.startswith('post_'):
+            update_review_request_inbox(instance)
+    else:
+        review_request_ids = _get_changed_ids(sender, instance, action,
+                                              model, pk_set)
+
+        if review_request_ids:
+            for review_request in \
+                ReviewRequest.objects.filter(pk__in=review_request_ids):
+                update_review_request_inbox(review_request)
+
+
+def _on_starred_changed(sender, instance, action, reverse, model, pk_set,
+                        **kwargs):
+    from reviewboard.reviews.models import ReviewRequest
+
+    if not reverse:
+        review_request_ids = _get_changed_ids(sender, instance, action,
+                                              model, pk_set)
+
+        if review_request_ids:
+            for review_request in \
+                ReviewRequest.objects.filter(pk__in=review_request_ids):
+                update_review_request_inbox(review_request)
+    else:
+        profile_ids = _get_changed_ids(sender, instance, action, model,
+                                       pk_set)
+
+        if profile_ids:
+            update_review_request_inbox(instance)
+
+
+def _on_group_members_changed(sender, instance, action, reverse, model,
+                              pk_set, **kwargs):
+    if reverse:
+        if action.startswith('post_'):
+            update_user_inbox(instance)
+    else:
+        user_ids = _get_changed_ids(sender, instance, action, model, pk_set)
+
+        if user_ids:
+            for user in User.objects.filter(pk__in=user_ids):
+                update_user_inbox(user)
+
+
+def _on_group_deleting(instance, **kwargs):
+    instance._inbox_member_ids = list(instance.users.values_list('pk',
+                                                                 flat=True))
+
+
+def _on_group_deleted(instance, **kwargs):
+    member_ids = getattr(instance, '_inbox_member_ids', [])
+
+    for user in User.objects.filter(pk__in=member_ids):
+        update_user_inbox(user)
+
+
+def _on_review_saved(instance, raw=False, **kwargs):
+    if not raw:
+        update_review_state(instance.user_id, instance.review_request_id)
+
+
+def _on_review_deleted(instance, **kwargs):
+    # The review may be deleted along with its review request or user, so
+    # a new state mustn't be created for them.
+    update_review_state(instance.user_id, instance.review_request_id,
+                        create=False)
+
+
+def _on_review_published(review=None, reply=None, **kwargs):
+    from reviewboard.reviews.models import ReviewState
+
+    review = review or reply
+
+    # Only users who have visited the review request count new reviews.
+    ReviewState.objects.filter(
+        review_request=review.review_request_id,
+        user__review_request_visits__review_request=
+            review.review_request_id) \
+        .exclude(user=review.user_id) \
+        .update(new_review_count=F('new_review_count') + 1)
+
+
+def _on_visit_saved(instance, raw=False, **kwargs):
+    from reviewboard.reviews.models import ReviewState
+
+    if raw:
+        return
+
+    state, is_new = ReviewState.objects.get_or_create(
+        user_id=instance.user_id,
+        review_request_id=instance.review_request_id)
+
+    if state.new_review_count:
+        ReviewState.objects.filter(pk=state.pk).update(new_review_count=0)
+
+
+def _on_visit_deleted(instance, **kwargs):
+    from reviewboard.reviews.models import ReviewState
+
+    ReviewState.objects.filter(user=instance.user_id,
+                               review_request=instance.review_request_id,
+                               new_review_count__gt=0) \
+        .update(new_review_count=0)
+
+
+def connect_signals():
+    """Keeps inboxes up to date as review requests, reviews and groups
+    change.
+    """
+    from reviewboard.reviews.models import Group, Review, ReviewRequest
+
+    m2m_changed.connect(_on_reviewers_changed,
+                        sender=ReviewRequest.target_people.through)
+    m2m_changed.connect(_on_reviewers_changed,
+                        sender=ReviewRequest.target_groups.through)
+    m2m_changed.connect(_on_group_members_changed,
+                        sender=Group.users.through)
+    pre_delete.connect(_on_group_deleting, sender=Group)
+    post_delete.connect(_on_group_deleted, sender=Group)
+    post_save.connect(_on_review_saved, sender=Review)
+    post_delete.connect(_on_review_deleted, sender=Review)
+    review_published.connect(_on_review_published)
+    reply_published.connect(_on_review_published)
+
+
+def connect_account_signals():
+    """Keeps inboxes up to date as users star and visit review requests.
+
+    This is separate from connect_signals, since the accounts models depend
+    on the review models.
+    """
+    from reviewboard.accounts.models import Profile, ReviewRequestVisit
+
+    m2m_changed.connect(_on_starred_changed,
+                        sender=Profile.starred_review_requests.through)
+    post_save.connect(_on_visit_saved, sender=ReviewRequestVisit)
+    post_delete.connect(_on_visit_deleted, sender=ReviewRequestVisit)
@@ -9,6 +9,7 @@ from django.db.models.query import QuerySet
 from djblets.util.db import ConcurrencyManager
 
 from reviewboard.diffviewer.models import DiffSetHistory
+from reviewboard.reviews.inbox import ensure_inbox, get_inbox_query
 from reviewboard.scmtools.errors import ChangeNumberInUseError
 
 
@@ -48,26 +49,45 @@ class ReviewGroupManager(Manager):
 
 class ReviewRequestQuerySet(QuerySet):
     def with_counts(self, user):
+        """Adds the number of new reviews since the user's last visit.
+
+        The counts are read from the user's ReviewStates, building the
+        user's inbox first if needed. Users without an inbox have the
+        reviews counted instead.
+        """
         queryset = self
 
         if user and user.is_authenticated():
             select_dict = {}
 
-            select_dict['new_review_count'] = """
-                SELECT COUNT(*)
-                  FROM reviews_review, accounts_reviewrequestvisit
-                  WHERE reviews_review.public
-                    AND reviews_review.review_request_id =
-                        reviews_reviewrequest.id
-                    AND accounts_reviewrequestvisit.review_request_id =
-                        reviews_reviewrequest.id
-                    AND accounts_reviewrequestvisit.user_id = %(user_id)s
-                    AND reviews_review.timestamp >
-                        accounts_reviewrequestvisit.timestamp
-                    AND reviews_review.user_id != %(user_id)s
-            """ % {
-                'user_id': str(user.id)
-            }
+            if ensure_inbox(user):
+                select_dict['new_review_count'] = """
+                    COALESCE(
+                        (SELECT reviews_reviewstate.new_review_count
+                           FROM reviews_reviewstate
+                           WHERE reviews_reviewstate.review_request_id =
+                                 reviews_reviewrequest.id
+                             AND reviews_reviewstate.user_id = %(user_id)s),
+                        0)
+                """ % {
+                    'user_id': str(user.id)
+                }
+            else:
+                select_dict['new_review_count'] = """
+                    SELECT COUNT(*)
+                      FROM reviews_review, accounts_reviewrequestvisit
+                      WHERE reviews_review.public
+                        AND reviews_review.review_request_id =
+                            reviews_reviewrequest.id
+                        AND accounts_reviewrequestvisit.review_request_id =
+                            reviews_reviewrequest.id
+                        AND accounts_reviewrequestvisit.user_id = %(user_id)s
+                        AND reviews_review.timestamp >
+                            accounts_reviewrequestvisit.timestamp
+                        AND reviews_review.user_id != %(user_id)s
+                """ % {
+                    'user_id': str(user.id)
+                }
 
             queryset = self.extra(select=select_dict)
 
@@ -146,18 +166,28 @@ class ReviewRequestManager(ConcurrencyManager):
         return Q(target_groups__name=group_name,
                  local_site=local_site)
 
-    def get_to_user_groups_query(self, user_or_username):
+    def get_to_user_groups_query(self, user_or_username, status=None):
         """Returns the query targetting groups joined by a user.
 
         This is meant to be passed as an extra_query to
         ReviewRequest.objects.public().
+
+        If ``status`` is pending, the user's inbox is used, rather than
+        joining against the groups.
         """
         query_user = self._get_query_user(user_or_username)
+
+        if status == 'P':
+            query = get_inbox_query(query_user, ('to_group',))
+
+            if query is not None:
+                return query
+
         groups = list(query_user.review_groups.values_list('pk', flat=True))
 
         return Q(target_groups__in=groups)
 
-    def get_to_user_directly_query(self, user_or_username):
+    def get_to_user_directly_query(self, user_or_username, status=None):
         """Returns the query targetting a user directly.
 
         This will include review requests where the user has been listed
@@ -165,9 +195,18 @@ class ReviewRequestManager(ConcurrencyManager):
 
         This is meant to be passed as an extra_query to
         ReviewRequest.objects.public().
+
+        If ``status`` is pending, the user's inbox is used, rather than
+        joining against the reviewers and starred review requests.
         """
         query_user = self._get_query_user(user_or_username)
 
+        if status == 'P':
+            query = get_inbox_query(query_user, ('to_user', 'starred'))
+
+            if query is not None:
+                return query
+
         query = Q(target_people=query_user)
 
         try:
@@ -178,7 +217,7 @@ class ReviewRequestManager(ConcurrencyManager):
 
         return query
 
-    def get_to_user_query(self, user_or_username):
+    def get_to_user_query(self, user_or_username, status=None):
         """Returns the query targetting a user indirectly.
 
         This will include review requests where the user has been listed
@@ -187,8 +226,18 @@ class ReviewRequestManager(ConcurrencyManager):
 
         This is meant to be passed as an extra_query to
         ReviewRequest.objects.public().
+
+        If ``status`` is pending, the user's inbox is used, rather than
+        joining against the reviewers, groups and starred review requests.
         """
         query_user = self._get_query_user(user_or_username)
+
+        if status == 'P':
+            query = get_inbox_query(query_user)
+
+            if query is not None:
+                return query
+
         groups = list(query_user.review_groups.values_list('pk', flat=True))
 
         query = Q(target_people=query_user) | \
@@ -228,19 +277,16 @@ class ReviewRequestManager(ConcurrencyManager):
         return self.to_group(group_name, None, *args, **kwargs)
 
     def to_user_groups(self, username, *args, **kwargs):
-        return self._query(
-            extra_query=self.get_to_user_groups_query(username),
-            *args, **kwargs)
+        return self._query_to_user(self.get_to_user_groups_query, username,
+                                   *args, **kwargs)
 
     def to_user_directly(self, user_or_username, *args, **kwargs):
-        return self._query(
-            extra_query=self.get_to_user_directly_query(user_or_username),
-            *args, **kwargs)
+        return self._query_to_user(self.get_to_user_directly_query,
+                                   user_or_username, *args, **kwargs)
 
     def to_user(self, user_or_username, *args, **kwargs):
-        return self._query(
-            extra_query=self.get_to_user_query(user_or_username),
-            *args, **kwargs)
+        return self._query_to_user(self.get_to_user_query, user_or_username,
+                                   *args, **kwargs)
 
     def from_user(self, user_or_username, *args, **kwargs):
         return self._query(
@@ -271,6 +317,13 @@ class ReviewRequestManager(ConcurrencyManager):
 
         return query
 
+    def _query_to_user(self, get_query, user_or_username, user=None,
+                       status='P', **kwargs):
+        return self._query(
+            user=user, status=status,
+            extra_query=get_query(user_or_username, status),
+            **kwargs)
+
     def _get_query_user(self, user_or_username):
         """Returns a User object, given a possible User or username."""
         if isinstance(user_or_username, User):
@@ -18,6 +18,8 @@ from djblets.util.templatetags.djblets_images import crop_image, thumbnail
 
 from reviewboard.changedescs.models import ChangeDescription
 from reviewboard.diffviewer.models import DiffSet, DiffSetHistory, FileDiff
+from reviewboard.reviews import access, inbox, updates
+from reviewboard.reviews.access import get_user_group_ids
 from reviewboard.reviews.signals import review_request_published, \
                                         reply_published, review_published
 from reviewboard.reviews.errors import PermissionError
@@ -105,7 +107,7 @@ class Group(models.Model):
         return (not self.invite_only or
                 user.is_superuser or
                 (user.is_authenticated() and
-                 self.users.filter(pk=user.pk).count() > 0))
+                 self.pk in get_user_group_ids(user)))
 
     def __unicode__(self):
         return self.name
@@ -189,13 +191,20 @@ class Screenshot(models.Model):
     def __unicode__(self):
         return u"%s (%s)" % (self.caption, self.image)
 
-    def get_absolute_url(self):
-        try:
-            review = self.review_request.all()[0]
-        except IndexError:
-            review = self.inactive_review_request.all()[0]
+    def get_absolute_url(self, review_request=None):
+        """
+        Returns the URL of the screenshot's page.
 
-        return '%ss/%d/' % (review.get_absolute_url(), self.id)
+        The review request the screenshot belongs to can be passed in if
+        it's already loaded, so that it isn't looked up again.
+        """
+        if review_request is None:
+            try:
+                review_request = self.review_request.all()[0]
+            except IndexError:
+                review_request = self.inactive_review_request.all()[0]
+
+        return '%ss/%d/' % (review_request.get_absolute_url(), self.id)
 
 
 class ReviewRequest(models.Model):
@@ -219,6 +228,12 @@ class ReviewRequest(models.Model):
         (DISCARDED,      _('Discarded')),
     )
 
+    # Types of public activity on a review request.
+    ACTIVITY_REVIEW_REQUEST = "review-request"
+    ACTIVITY_DIFF           = "diff"
+    ACTIVITY_REVIEW         = "review"
+    ACTIVITY_REPLY          = "reply"
+
     submitter = models.ForeignKey(User, verbose_name=_("submitter"),
                                   related_name="review_requests")
     time_added = models.DateTimeField(_("time added"), default=datetime.now)
@@ -280,6 +295,16 @@ class ReviewRequest(models.Model):
                                                  blank=True)
     shipit_count = CounterField(_("ship-it count"), default=0)
 
+    # The last public activity. See get_last_activity.
+    last_activity_time = models.DateTimeField(_("last activity time"),
+                                              null=True, default=None,
+                                              blank=True)
+    last_activity_type = models.CharField(_("last activity type"),
+                                          max_length=16, blank=True)
+    last_activity_user = models.ForeignKey(
+        User, verbose_name=_("last activity user"), related_name="+",
+        blank=True, null=True)
+
     local_site = models.ForeignKey(LocalSite, blank=True, null=True)
     local_id = models.IntegerField('site-local ID', null=True)
 
@@ -468,14 +493,36 @@ class ReviewRequest(models.Model):
         return Review.objects.get_pending_review(self, user)
 
     def get_last_activity(self):
-        """Returns the last public activity information on the review request.
+        """Returns the last public activity on the review request.
+
+        This returns the timestamp of the activity and its type, which is
+        one of the ACTIVITY_* values. The user responsible for it is in
+        ``last_activity_user``. It can be used to judge whether something
+        on a review request has been made public more recently.
 
-        This will return the last object updated, along with the timestamp
-        of that object. It can be used to judge whether something on a
-        review request has been made public more recently.
+        The activity is recorded on the review request as it happens, so
+        this doesn't need any queries. For review requests that were last
+        updated before activity was recorded, it's worked out from the
+        latest diff and review, and recorded for next time.
         """
+        if not self.last_activity_type:
+            self._update_last_activity()
+
+        return self.last_activity_time, self.last_activity_type
+
+    def set_last_activity(self, activity_type, user, timestamp=None):
+        """Records public activity on the review request.
+
+        This is stored when the review request is next saved.
+        """
+        self.last_activity_time = timestamp or datetime.now()
+        self.last_activity_type = activity_type
+        self.last_activity_user = user
+
+    def _update_last_activity(self):
         timestamp = self.last_updated
-        updated_object = self
+        activity_type = self.ACTIVITY_REVIEW_REQUEST
+        user_id = self.submitter_id
 
         # Check if the diff was updated along with this.
         try:
@@ -483,7 +530,8 @@ class ReviewRequest(models.Model):
 
             if diffset.timestamp >= timestamp:
                 timestamp = diffset.timestamp
-                updated_object = diffset
+                activity_type = self.ACTIVITY_DIFF
+                user_id = None
         except DiffSet.DoesNotExist:
             pass
 
@@ -493,11 +541,25 @@ class ReviewRequest(models.Model):
 
             if review.timestamp >= timestamp:
                 timestamp = review.timestamp
-                updated_object = review
+                user_id = review.user_id
+
+                if review.base_reply_to_id:
+                    activity_type = self.ACTIVITY_REPLY
+                else:
+                    activity_type = self.ACTIVITY_REVIEW
         except Review.DoesNotExist:
             pass
 
-        return timestamp, updated_object
+        self.last_activity_time = timestamp
+        self.last_activity_type = activity_type
+        self.last_activity_user_id = user_id
+
+        # This is stored without saving the review request, which would
+        # change its last_updated timestamp.
+        ReviewRequest.objects.filter(pk=self.pk).update(
+            last_activity_time=timestamp,
+            last_activity_type=activity_type,
+            last_activity_user=user_id)
 
     def changeset_is_pending(self):
         """
@@ -603,7 +665,11 @@ class ReviewRequest(models.Model):
             raise AttributeError("%s is not a valid close type" % type)
 
         self.status = type
+        self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST,
+                               user or self.submitter)
         self.save(update_counts=True)
+        inbox.update_review_request_inbox(self)
+        updates.hub.notify(self.pk)
 
         try:
             draft = self.draft.get()
@@ -625,7 +691,11 @@ class ReviewRequest(models.Model):
                 self.public = False
 
             self.status = self.PENDING_REVIEW
+            self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST,
+                                   user or self.submitter)
             self.save(update_counts=True)
+            inbox.update_review_request_inbox(self)
+            updates.hub.notify(self.pk)
 
     def update_changenum(self,changenum, user=None):
         if (user and not self.is_mutable_by(user)):
@@ -649,9 +719,11 @@ class ReviewRequest(models.Model):
             draft.delete()
         else:
             changes = None
+            self.set_last_activity(self.ACTIVITY_REVIEW_REQUEST, user)
 
         self.public = True
         self.save(update_counts=True)
+        updates.hub.notify(self.pk)
 
         review_request_published.send(sender=self.__class__, user=user,
                                       review_request=self,
@@ -980,8 +1052,13 @@ class ReviewRequestDraft(models.Model):
                     self.changedesc.record_field_change(name, a.all(), b.all(),
                                                         name_field)
 
-                a.clear()
-                map(a.add, b.all())
+                # Only change what differs, so that the inbox is updated
+                # once for the removals and once for the additions.
+                if aset - bset:
+                    a.remove(*(aset - bset))
+
+                if bset - aset:
+                    a.add(*(bset - aset))
 
                 # Decrement the counts on everything we had before.
                 # we lose them. We'll increment the resulting set
@@ -1075,7 +1152,15 @@ class ReviewRequestDraft(models.Model):
             self.changedesc.save()
             review_request.changedescs.add(self.changedesc)
 
+        if self.diffset:
+            review_request.set_last_activity(review_request.ACTIVITY_DIFF,
+                                             user)
+        else:
+            review_request.set_last_activity(
+                review_request.ACTIVITY_REVIEW_REQUEST, user)
+
         review_request.save()
+        updates.hub.notify(review_request.pk)
 
         if send_notification:
             review_request_published.send(sender=review_request.__class__,
@@ -1139,19 +1224,30 @@ class Comment(models.Model):
         else:
             return self.replies.filter(review__public=True)
 
+    def get_review(self):
+        """
+        Returns the review containing this comment.
+
+        This is cached on the comment after the first lookup.
+        """
+        if not hasattr(self, '_review'):
+            self._review = self.review.get()
+
+        return self._review
+
     def get_absolute_url(self):
         revision_path = str(self.filediff.diffset.revision)
         if self.interfilediff:
             revision_path += "-%s" % self.interfilediff.diffset.revision
 
         return "%sdiff/%s/?file=%s#file%sline%s" % \
-             (self.review.get().review_request.get_absolute_url(),
+             (self.get_review().review_request.get_absolute_url(),
               revision_path, self.filediff.id, self.filediff.id,
               self.first_line)
 
     def get_review_url(self):
         return "%s#comment%d" % \
-            (self.review.get().review_request.get_absolute_url(), self.id)
+            (self.get_review().review_request.get_absolute_url(), self.id)
 
     def save(self, **kwargs):
         super(Comment, self).save()
@@ -1210,6 +1306,17 @@ class ScreenshotComment(models.Model):
         else:
             return self.replies.filter(review__public=True)
 
+    def get_review(self):
+        """
+        Returns the review containing this comment.
+
+        This is cached on the comment after the first lookup.
+        """
+        if not hasattr(self, '_review'):
+            self._review = self.review.get()
+
+        return self._review
+
     def get_image_url(self):
         """
         Returns the URL for the thumbnail, creating it if necessary.
@@ -1226,7 +1333,7 @@ class ScreenshotComment(models.Model):
 
     def get_review_url(self):
         return "%s#scomment%d" % \
-            (self.review.get().review_request.get_absolute_url(), self.id)
+            (self.get_review().review_request.get_absolute_url(), self.id)
 
     def save(self, **kwargs):
         super(ScreenshotComment, self).save()
@@ -1383,7 +1490,16 @@ class Review(models.Model):
 
         # Update the last_updated timestamp on the review request.
         self.review_request.last_review_timestamp = self.timestamp
+
+        if self.is_reply():
+            activity_type = ReviewRequest.ACTIVITY_REPLY
+        else:
+            activity_type = ReviewRequest.ACTIVITY_REVIEW
+
+        self.review_request.set_last_activity(activity_type, self.user,
+                                              self.timestamp)
         self.review_request.save()
+        updates.hub.notify(self.review_request_id)
 
         # Atomicly update the shipit_count
         if self.ship_it:
@@ -1416,3 +1532,63 @@ class Review(models.Model):
     class Meta:
         ordering = ['timestamp']
         get_latest_by = 'timestamp'
+
+
+class InboxEntry(models.Model):
+    """
+    A pending review request in a user's inbox.
+
+    Users have one InboxEntry per pending review request that lists them as
+    a reviewer, lists a group they're a member of, or that they've starred.
+    The flags record which of these apply. Entries are kept up to date as
+    reviewers, group members, starred review requests and review request
+    statuses change, so that dashboards don't have to join across all of
+    these to find the review requests.
+    """
+    user = models.ForeignKey(User, related_name="inbox_entries")
+    review_request = models.ForeignKey(ReviewRequest,
+                                       related_name="inbox_entries")
+    to_user = models.BooleanField(_("to user"), default=False)
+    to_group = models.BooleanField(_("to group"), default=False)
+    starred = models.BooleanField(_("starred"), default=False)
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.user.username, self.review_request)
+
+    class Meta:
+        unique_together = ("user", "review_request")
+        verbose_name_plural = _("inbox entries")
+
+
+class ReviewState(models.Model):
+    """
+    A summary of a user's reviews on a review request.
+
+    Users have one ReviewState per review request they've reviewed or
+    visited. It's kept up to date as reviews are saved and published, so
+    that review request lists can show the state of the user's reviews and
+    the number of new reviews without counting reviews for each review
+    request.
+    """
+    user = models.ForeignKey(User, related_name="review_states")
+    review_request = models.ForeignKey(ReviewRequest,
+                                       related_name="review_states")
+    has_draft = models.BooleanField(_("has draft"), default=False)
+    has_public_review = models.BooleanField(_("has public review"),
+                                            default=False)
+    has_ship_it = models.BooleanField(_("has ship it"), default=False)
+
+    # The number of public reviews and replies by other users since the
+    # user last visited the review request.
+    new_review_count = models.PositiveIntegerField(_("new review count"),
+                                                   default=0)
+
+    def __unicode__(self):
+        return u"%s: %s" % (self.user.username, self.review_request)
+
+    class Meta:
+        unique_together = ("user", "review_request")
+
+
+access.connect_signals()
+inbox.connect_signals()
@@ -254,17 +254,28 @@ def reply_list(context, review, comment, context_type, context_id):
     s = ""
 
     if context_type == "comment" or context_type == "screenshot_comment":
-        for reply_comment in comment.public_replies(user):
-            s += generate_reply_html(reply_comment.review.get(),
+        # The review request page loads the replies up-front.
+        if hasattr(comment, 'loaded_replies'):
+            reply_comments = comment.loaded_replies
+        else:
+            reply_comments = comment.public_replies(user)
+
+        for reply_comment in reply_comments:
+            s += generate_reply_html(reply_comment.get_review(),
                                      reply_comment.timestamp,
                                      reply_comment.text)
     elif context_type == "body_top" or context_type == "body_bottom":
-        q = Q(public=True)
+        attrname = "loaded_%s_replies" % context_type
 
-        if user:
-            q = q | Q(user=user)
+        if hasattr(review, attrname):
+            replies = getattr(review, attrname)
+        else:
+            q = Q(public=True)
 
-        replies = getattr(review, "%s_replies" % context_type).filter(q)
+            if user:
+                q = q | Q(user=user)
+
+            replies = getattr(review, "%s_replies" % context_type).filter(q)
 
         for reply in replies:
             s += generate_reply_html(reply, reply.timestamp,
@@ -374,6 +385,14 @@ def bug_url(bug_id, review_request):
     return None
 
 
+@register.filter
+def screenshot_url(screenshot, review_request):
+    """
+    Returns the URL of a screenshot's page on the specified review request.
+    """
+    return screenshot.get_absolute_url(review_request)
+
+
 @register.filter
 def diffsets_with_comments(review, current_pair):
     """
@@ -8,12 +8,18 @@ from django.test import TestCase
 
 from djblets.siteconfig.models import SiteConfiguration
 
-from reviewboard.accounts.models import Profile, LocalSiteProfile
+from reviewboard.accounts.models import LocalSiteProfile, Profile, \
+                                        ReviewRequestVisit
+from reviewboard.reviews.access import filter_accessible
+from reviewboard.reviews.inbox import ensure_inbox
 from reviewboard.reviews.models import DefaultReviewer, \
                                        Group, \
+                                       InboxEntry, \
                                        ReviewRequest, \
                                        ReviewRequestDraft, \
+                                       ReviewState, \
                                        Review
+from reviewboard.reviews.updates import UpdateHub, wait_for_activity
 from reviewboard.scmtools.models import Repository, Tool
 from reviewboard.site.models import LocalSite
 
@@ -225,6 +231,28 @@ class ViewTests(TestCase):
 
         self.client.logout()
 
+    def testReviewDetailEntries(self):
+        """Testing review_detail view's preloaded reviews and replies"""
+        response = self.client.get('/r/3/')
+        self.assertEqual(response.status_code, 200)
+
+        entries = self.getContextVar(response, 'entries')
+        reviews = [entry['review'] for entry in entries if 'review' in entry]
+        self.assertEqual([review.pk for review in reviews], [2, 4, 5])
+
+        self.assertEqual([c.pk for c in reviews[0].ordered_comments], [1])
+        self.assertEqual(
+            [c.pk for c in reviews[0].ordered_comments[0].loaded_replies],
+            [2])
+        self.assertEqual(
+            reviews[0].ordered_comments[0].loaded_replies[0].get_review().pk,
+            3)
+        self.assertEqual([c.pk for c in reviews[1].ordered_comments], [3, 4])
+        self.assertEqual(
+            [reply.pk for reply in reviews[2].loaded_body_top_replies],
+            [6, 7])
+        self.assertEqual(reviews[2].loaded_body_bottom_replies, [])
+
     def testReviewDetailSitewideLogin(self):
         """Testing review_detail view with site-wide login enabled"""
         self.siteconfig.set("auth_require_sitewide_login", True)
@@ -523,6 +551,16 @@ class ViewTests(TestCase):
         self.assert_('fragment' in files[0])
         self.assert_('interfilediff' in files[0])
 
+    def testDiffNotModified(self):
+        """Testing the diff viewer with a matching If-None-Match header"""
+        response = self.client.get('/r/8/diff/1-2/')
+        self.assertEqual(response.status_code, 200)
+        self.assert_(response.has_header('ETag'))
+
+        response = self.client.get('/r/8/diff/1-2/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
     def testDashboard5(self):
         """Testing dashboard view (mine)"""
         self.client.login(username='doc', password='doc')
@@ -681,6 +719,267 @@ class ConcurrencyTests(TestCase):
         self.assertEqual(comments[2].text, comment_text_3)
 
 
+class LastActivityTests(TestCase):
+    """Testing the last activity recorded on review requests"""
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def setUp(self):
+        self.review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+
+    def testUnrecordedActivity(self):
+        """Testing ReviewRequest.get_last_activity without recorded activity"""
+        last_updated = self.review_request.last_updated
+
+        self.assertEqual(self.review_request.get_last_activity(),
+                         (last_updated, ReviewRequest.ACTIVITY_REVIEW_REQUEST))
+        self.assertEqual(self.review_request.last_activity_user,
+                         self.review_request.submitter)
+
+        # The activity is stored without changing last_updated.
+        review_request = ReviewRequest.objects.get(pk=self.review_request.pk)
+        self.assertEqual(review_request.last_updated, last_updated)
+        self.assertEqual(review_request.last_activity_type,
+                         ReviewRequest.ACTIVITY_REVIEW_REQUEST)
+
+    def testReviewActivity(self):
+        """Testing ReviewRequest.get_last_activity after publishing reviews"""
+        user = User.objects.get(username="doc")
+
+        review = Review(review_request=self.review_request, user=user)
+        review.save()
+        review.publish()
+
+        review_request = ReviewRequest.objects.get(pk=self.review_request.pk)
+        self.assertEqual(review_request.get_last_activity(),
+                         (review.timestamp, ReviewRequest.ACTIVITY_REVIEW))
+        self.assertEqual(review_request.last_activity_user, user)
+
+        reply = Review(review_request=review_request,
+                       user=review_request.submitter,
+                       base_reply_to=review)
+        reply.save()
+        reply.publish()
+
+        review_request = ReviewRequest.objects.get(pk=self.review_request.pk)
+        self.assertEqual(review_request.get_last_activity(),
+                         (reply.timestamp, ReviewRequest.ACTIVITY_REPLY))
+        self.assertEqual(review_request.last_activity_user,
+                         review_request.submitter)
+
+    def testCloseActivity(self):
+        """Testing ReviewRequest.get_last_activity after closing"""
+        user = User.objects.get(username="admin")
+
+        self.review_request.close(ReviewRequest.SUBMITTED, user)
+
+        review_request = ReviewRequest.objects.get(pk=self.review_request.pk)
+        timestamp, activity_type = review_request.get_last_activity()
+        self.assertEqual(activity_type, ReviewRequest.ACTIVITY_REVIEW_REQUEST)
+        self.assertEqual(review_request.last_activity_user, user)
+
+
+class UpdateHubTests(TestCase):
+    """Testing waiting for activity on review requests"""
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def testWaitTimeout(self):
+        """Testing UpdateHub.wait without activity"""
+        hub = UpdateHub()
+        version = hub.get_version(1)
+
+        self.assertFalse(hub.wait(1, version, 0.1))
+
+    def testNotify(self):
+        """Testing UpdateHub.wait after activity is published"""
+        hub = UpdateHub()
+        version = hub.get_version(1)
+        hub.notify(1)
+
+        self.assertNotEqual(hub.get_version(1), version)
+        self.assertTrue(hub.wait(1, version, 1))
+
+    def testWaitForNewerActivity(self):
+        """Testing wait_for_activity with newer activity"""
+        review_request = ReviewRequest.objects.get(
+            summary="Add permission checking for JSON API")
+
+        # This returns right away, without reloading the review request.
+        self.assert_(wait_for_activity(review_request, '2007-01-01 00:00:00')
+                     is review_request)
+
+
+class InboxTests(TestCase):
+    """Testing the review requests in users' inboxes"""
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def setUp(self):
+        self.user = User.objects.get(username="grumpy")
+        self.review_request = ReviewRequest.objects.get(
+            summary="Update for cleaned_data changes")
+
+    def getEntry(self, user=None, review_request=None):
+        try:
+            return InboxEntry.objects.get(
+                user=user or self.user,
+                review_request=review_request or self.review_request)
+        except InboxEntry.DoesNotExist:
+            return None
+
+    def testBuildInbox(self):
+        """Testing building an inbox"""
+        user = User.objects.get(username="doc")
+
+        self.assertTrue(ensure_inbox(user))
+        self.assertTrue(Profile.objects.get(user=user).inbox_built)
+
+        entries = InboxEntry.objects.filter(user=user) \
+                                    .order_by('review_request')
+        self.assertEqual(
+            [(entry.review_request_id, entry.to_user, entry.to_group,
+              entry.starred)
+             for entry in entries],
+            [(1, False, True, False),
+             (2, False, True, False),
+             (3, True, True, False),
+             (4, True, False, False)])
+
+    def testBuildInboxWithoutProfile(self):
+        """Testing building an inbox for a user without a profile"""
+        self.assertFalse(ensure_inbox(User.objects.get(username="dopey")))
+
+    def testReviewerChanges(self):
+        """Testing inbox entries after changing reviewers"""
+        self.review_request.target_people.add(self.user)
+
+        entry = self.getEntry()
+        self.assertTrue(entry.to_user)
+        self.assertFalse(entry.to_group)
+
+        self.review_request.target_people.remove(self.user)
+        self.assertEqual(self.getEntry(), None)
+
+    def testGroupMembershipChanges(self):
+        """Testing inbox entries after changing group members"""
+        group = Group.objects.get(name="devgroup")
+        group.users.add(self.user)
+
+        entry = self.getEntry()
+        self.assertTrue(entry.to_group)
+        self.assertFalse(entry.to_user)
+
+        group.users.clear()
+        self.assertEqual(self.getEntry(), None)
+
+    def testStarredChanges(self):
+        """Testing inbox entries after starring review requests"""
+        profile = self.user.get_profile()
+        profile.starred_review_requests.add(self.review_request)
+
+        entry = self.getEntry()
+        self.assertTrue(entry.starred)
+
+        profile.starred_review_requests.remove(self.review_request)
+        self.assertEqual(self.getEntry(), None)
+
+        profile.starred_review_requests.add(self.review_request)
+        self.assertTrue(self.getEntry().starred)
+
+        profile.starred_review_requests.clear()
+        self.assertEqual(self.getEntry(), None)
+
+    def testCloseAndReopen(self):
+        """Testing inbox entries after closing and reopening"""
+        user = User.objects.get(username="doc")
+        ensure_inbox(user)
+
+        self.review_request.close(ReviewRequest.SUBMITTED)
+        self.assertEqual(self.getEntry(user), None)
+        self.assertFalse(self.review_request in
+                         ReviewRequest.objects.to_user(user, user))
+
+        self.review_request.reopen()
+        self.assertTrue(self.getEntry(user).to_group)
+        self.assertTrue(self.review_request in
+                        ReviewRequest.objects.to_user(user, user))
+
+
+class ReviewStateTests(TestCase):
+    """Testing the summaries of users' reviews on review requests"""
+    fixtures = ['test_users', 'test_reviewrequests', 'test_scmtools']
+
+    def setUp(self):
+        self.user = User.objects.get(username="grumpy")
+        self.review_request = ReviewRequest.objects.get(
+            summary="Update for cleaned_data changes")
+
+    def getState(self, user=None):
+        state = ReviewState.objects.get(user=user or self.user,
+                                        review_request=self.review_request)
+
+        return (state.has_draft, state.has_public_review, state.has_ship_it,
+                state.new_review_count)
+
+    def testBuildReviewStates(self):
+        """Testing building review states with an inbox"""
+        user = User.objects.get(username="doc")
+        ensure_inbox(user)
+
+        states = ReviewState.objects.filter(user=user) \
+                                    .order_by('review_request')
+        self.assertEqual(
+            [(state.review_request_id, state.has_draft,
+              state.has_public_review, state.has_ship_it)
+             for state in states],
+            [(2, False, True, True),
+             (3, False, True, False)])
+
+    def testSaveAndPublish(self):
+        """Testing review states after saving and publishing reviews"""
+        review = Review(review_request=self.review_request, user=self.user)
+        review.save()
+        self.assertEqual(self.getState(), (True, False, False, 0))
+
+        review.ship_it = True
+        review.publish()
+        self.assertEqual(self.getState(), (False, True, True, 0))
+
+        reply = Review(review_request=self.review_request, user=self.user,
+                       base_reply_to=review)
+        reply.save()
+        self.assertEqual(self.getState(), (True, True, True, 0))
+
+        reply.delete()
+        self.assertEqual(self.getState(), (False, True, True, 0))
+
+    def testNewReviewCount(self):
+        """Testing review state new review counts"""
+        user = User.objects.get(username="doc")
+        ensure_inbox(user)
+
+        # Reviews only count once the review request has been visited.
+        review = Review(review_request=self.review_request, user=self.user)
+        review.save()
+        review.publish()
+        self.assertEqual(self.getState(user)[3], 0)
+
+        visit = ReviewRequestVisit.objects.create(
+            user=user, review_request=self.review_request)
+
+        review = Review(review_request=self.review_request, user=self.user)
+        review.save()
+        review.publish()
+
+        self.assertEqual(self.getState(user)[3], 1)
+        self.assertEqual(
+            ReviewRequest.objects.filter(pk=self.review_request.pk)
+                .with_counts(user)[0].new_review_count,
+            1)
+
+        visit.save()
+        self.assertEqual(self.getState(user)[3], 0)
+
+
 class DefaultReviewerTests(TestCase):
     fixtures = ['test_scmtools.json']
 
@@ -1219,6 +1518,43 @@ class PolicyTests(TestCase):
         self.assertTrue(review_request.is_accessible_by(self.user))
         self.assertFalse(review_request.is_accessible_by(self.anonymous))
 
+    def test_filter_accessible_with_invite_only_group(self):
+        """Testing filter_accessible with an invite-only group"""
+        group = Group.objects.create(name='test-group', invite_only=True)
+
+        review_request = self._get_review_request()
+        review_request.target_groups.add(group)
+
+        self.assertFalse(review_request in self._filter_accessible(self.user))
+        self.assertFalse(
+            review_request in self._filter_accessible(self.anonymous))
+
+        group.users.add(self.user)
+
+        self.assertTrue(review_request in self._filter_accessible(self.user))
+        self.assertFalse(
+            review_request in self._filter_accessible(self.anonymous))
+
+    def test_filter_accessible_with_private_repository(self):
+        """Testing filter_accessible with a private repository"""
+        review_request = self._get_review_request()
+        review_request.target_groups.add(
+            Group.objects.create(name='test-group'))
+
+        review_request.repository.public = False
+        review_request.repository.save()
+
+        self.assertFalse(review_request in self._filter_accessible(self.user))
+
+        review_request.repository.users.add(self.user)
+
+        self.assertTrue(review_request in self._filter_accessible(self.user))
+        self.assertFalse(
+            review_request in self._filter_accessible(self.anonymous))
+
+    def _filter_accessible(self, user):
+        return list(filter_accessible(ReviewRequest.objects.all(), user))
+
     def _get_review_request(self):
         # Get a review request and clear out the reviewers.
         review_request = ReviewRequest.objects.public()[0]
@@ -0,0 +1,127 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+
+# How long, in seconds, a request waits for new activity before returning.
+# This is kept under the usual five minute timeouts of web servers.
+UPDATE_WAIT_TIMEOUT = 4 * 60
+
+# How often, in seconds, waiting requests check for activity published by
+# other server processes.
+SHARED_CHECK_INTERVAL = 5
+
+# The format of the activity timestamps given to clients.
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class UpdateHub(object):
+    """Wakes up requests waiting for activity on review requests.
+
+    Requests waiting in this process are woken up as soon as activity is
+    published in this process. Activity published in other server processes
+    is counted in the cache, which the waiting requests check every few
+    seconds, rather than querying the database.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._serials = {}
+
+    def get_version(self, review_request_id):
+        """Returns a value that changes whenever there's new activity."""
+        self._condition.acquire()
+
+        try:
+            serial = self._serials.get(review_request_id, 0)
+        finally:
+            self._condition.release()
+
+        return serial, cache.get(self._make_key(review_request_id))
+
+    def notify(self, review_request_id):
+        """Notifies waiting requests of new activity on a review request."""
+        key = self._make_key(review_request_id)
+
+        try:
+            cache.incr(key)
+        except ValueError:
+            # The key doesn't exist yet. If another process adds it first,
+            # increment that instead.
+            if not cache.add(key, 1, UPDATE_WAIT_TIMEOUT * 2):
+                cache.incr(key)
+
+        self._condition.acquire()
+
+        try:
+            self._serials[review_request_id] = \
+                self._serials.get(review_request_id, 0) + 1
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def wait(self, review_request_id, version, timeout):
+        """Waits for the version of a review request to change.
+
+        Returns whether it changed within ``timeout`` seconds.
+        """
+        deadline = time.time() + timeout
+
+        while True:
+            if self.get_version(review_request_id) != version:
+                return True
+
+            remaining = deadline - time.time()
+
+            if remaining <= 0:
+                return False
+
+            self._condition.acquire()
+
+            try:
+                if self._serials.get(review_request_id, 0) == version[0]:
+                    self._condition.wait(min(remaining,
+                                             SHARED_CHECK_INTERVAL))
+            finally:
+                self._condition.release()
+
+    def _make_key(self, review_request_id):
+        return 'review-request-updates:%s' % review_request_id
+
+
+hub = UpdateHub()
+
+
+def format_timestamp(timestamp):
+    """Formats an activity timestamp the way it's given to clients."""
+    if timestamp:
+        return timestamp.strftime(TIMESTAMP_FORMAT)
+
+    return ''
+
+
+def wait_for_activity(review_request, since, timeout=UPDATE_WAIT_TIMEOUT):
+    """Waits for public activity on a review request newer than ``since``.
+
+    ``since`` is the timestamp of the last activity the client knows about,
+    in the format of format_timestamp. This returns as soon as there's newer
+    activity, or after ``timeout`` seconds, with the review request as it is
+    then. A reloaded review request has its last activity's user loaded.
+
+    The request's database connection is closed while waiting, so that
+    waiting requests don't hold on to connections.
+    """
+    from reviewboard.reviews.models import ReviewRequest
+
+    version = hub.get_version(review_request.pk)
+    timestamp, activity_type = review_request.get_last_activity()
+
+    if format_timestamp(timestamp) != since:
+        return review_request
+
+    connection.close()
+    hub.wait(review_request.pk, version, timeout)
+
+    return ReviewRequest.objects.select_related('last_activity_user') \
+                                .get(pk=review_request.pk)
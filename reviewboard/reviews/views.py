@@ -1,4 +1,3 @@
-import logging
 import time
 from datetime import datetime
 
@@ -16,7 +15,6 @@ from django.template.context import RequestContext
 from django.template.loader import render_to_string
 from django.utils import simplejson
 from django.utils.http import http_date
-from django.utils.safestring import mark_safe
 from django.utils.translation import ugettext as _
 from django.views.decorators.cache import cache_control
 from django.views.generic.list_detail import object_list
@@ -26,21 +24,26 @@ from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.dates import get_latest_timestamp
 from djblets.util.http import set_last_modified, get_modified_since, \
                               set_etag, etag_if_none_match
-from djblets.util.misc import get_object_or_none
+from djblets.util.misc import cache_memoize, get_object_or_none
 
 from reviewboard.accounts.decorators import check_login_required, \
                                             valid_prefs_required
 from reviewboard.accounts.models import ReviewRequestVisit
-from reviewboard.changedescs.models import ChangeDescription
-from reviewboard.diffviewer.diffutils import get_file_chunks_in_range
+from reviewboard.diffviewer.diffutils import get_chunk_range_index, \
+                                             get_chunks_in_range, \
+                                             get_diff_files, \
+                                             get_enable_highlighting
 from reviewboard.diffviewer.models import DiffSet
-from reviewboard.diffviewer.views import view_diff, view_diff_fragment, \
-                                         exception_traceback_string
+from reviewboard.diffviewer.views import build_compressible_response, \
+                                         exception_traceback_string, \
+                                         view_diff, view_diff_fragment, \
+                                         view_diff_lines
 from reviewboard.reviews.datagrids import DashboardDataGrid, \
                                           GroupDataGrid, \
                                           ReviewRequestDataGrid, \
                                           SubmitterDataGrid, \
                                           WatchedGroupDataGrid
+from reviewboard.reviews.detail import get_review_request_entries
 from reviewboard.reviews.errors import OwnershipError
 from reviewboard.reviews.forms import NewReviewRequestForm, \
                                       UploadDiffForm, \
@@ -163,23 +166,72 @@ def build_diff_comment_fragments(
     comments, context,
     comment_template_name='reviews/diff_comment_fragment.html',
     error_template_name='diffviewer/diff_fragment_error.html'):
+    """Renders the diff fragments for a list of comments.
 
+    Comments are grouped by their filediff and interfilediff, so that each
+    file's chunks are loaded and indexed at most once, no matter how many
+    comments were made on it. Each rendered fragment is cached based on the
+    comment's ID and timestamp, so the chunks only need to be loaded for
+    comments that haven't been rendered before.
+
+    Returns a tuple of whether there was an error rendering any fragment,
+    and the list of comment entries.
+    """
     comment_entries = []
     had_error = False
     siteconfig = SiteConfiguration.objects.get_current()
+    domain = Site.objects.get_current().domain
+    domain_method = siteconfig.get("site_domain_method")
+    highlighting = get_enable_highlighting(context['user'])
+    file_chunks = {}
+
+    def get_file_chunks(comment):
+        key = (comment.filediff_id, comment.interfilediff_id)
+
+        if key not in file_chunks:
+            if comment.interfilediff:
+                interdiffset = comment.interfilediff.diffset
+            else:
+                interdiffset = None
+
+            files = get_diff_files(comment.filediff.diffset, comment.filediff,
+                                   interdiffset, highlighting)
+
+            if files:
+                assert len(files) == 1
+                chunks = files[0]['chunks']
+            else:
+                chunks = []
+
+            file_chunks[key] = (chunks, get_chunk_range_index(chunks))
+
+        return file_chunks[key]
+
+    def render_comment(comment):
+        chunks, range_index = get_file_chunks(comment)
+
+        return render_to_string(comment_template_name, {
+            'comment': comment,
+            'chunks': list(get_chunks_in_range(chunks,
+                                               comment.first_line,
+                                               comment.num_lines,
+                                               range_index)),
+            'domain': domain,
+            'domain_method': domain_method,
+        })
 
     for comment in comments:
+        key = "diff-comment-fragment-%s-%s-%s-%s://%s" % (
+            comment_template_name, comment.id,
+            comment.timestamp.isoformat(), domain_method, domain)
+
+        if highlighting:
+            key += '-highlighting'
+
+        key += '-%s' % settings.AJAX_SERIAL
+
         try:
-            content = render_to_string(comment_template_name, {
-                'comment': comment,
-                'chunks': list(get_file_chunks_in_range(context,
-                                                        comment.filediff,
-                                                        comment.interfilediff,
-                                                        comment.first_line,
-                                                        comment.num_lines)),
-                'domain': Site.objects.get_current().domain,
-                'domain_method': siteconfig.get("site_domain_method"),
-            })
+            content = cache_memoize(key, lambda: render_comment(comment))
         except Exception, e:
             content = exception_traceback_string(None, e,
                                                  error_template_name, {
@@ -189,8 +241,8 @@ def build_diff_comment_fragments(
                     'index': None,
                     'filediff': comment.filediff,
                 },
-                'domain': Site.objects.get_current().domain,
-                'domain_method': siteconfig.get("site_domain_method"),
+                'domain': domain,
+                'domain_method': domain_method,
             })
 
             # It's bad that we failed, and we'll return a 500, but we'll
@@ -206,20 +258,6 @@ def build_diff_comment_fragments(
     return had_error, comment_entries
 
 
-fields_changed_name_map = {
-    'summary': 'Summary',
-    'description': 'Description',
-    'testing_done': 'Testing Done',
-    'bugs_closed': 'Bugs Closed',
-    'branch': 'Branch',
-    'target_groups': 'Reviewers (Groups)',
-    'target_people': 'Reviewers (People)',
-    'screenshots': 'Screenshots',
-    'screenshot_captions': 'Screenshot Captions',
-    'diff': 'Diff',
-}
-
-
 #####
 ##### View functions
 #####
@@ -285,7 +323,6 @@ def review_detail(request,
     if not review_request:
         return response
 
-    reviews = review_request.get_public_reviews()
     review = review_request.get_pending_review(request.user)
     review_timestamp = 0
     last_visited = 0
@@ -301,8 +338,9 @@ def review_detail(request,
             visited.timestamp = datetime.now()
             visited.save()
 
-        starred = review_request in \
-                  request.user.get_profile().starred_review_requests.all()
+        starred = bool(request.user.get_profile().starred_review_requests
+                                                  .filter(pk=review_request.pk)
+                                                  .count())
 
         # Unlike review above, this covers replies as well.
         try:
@@ -318,120 +356,25 @@ def review_detail(request,
     draft = review_request.get_draft(request.user)
 
     # Find out if we can bail early. Generate an ETag for this.
-    last_activity_time, updated_object = review_request.get_last_activity()
+    last_activity_time, last_activity_type = \
+        review_request.get_last_activity()
 
     if draft:
         draft_timestamp = draft.last_updated
     else:
         draft_timestamp = ""
 
-    etag = "%s:%s:%s:%s:%s:%s" % (request.user, last_activity_time,
-                                  draft_timestamp, review_timestamp,
-                                  int(starred),
-                                  settings.AJAX_SERIAL)
+    etag = "%s:%s:%s:%s:%s:%s:%s" % (request.user, last_activity_time,
+                                     review_request.last_updated,
+                                     draft_timestamp, review_timestamp,
+                                     int(starred),
+                                     settings.AJAX_SERIAL)
 
     if etag_if_none_match(request, etag):
         return HttpResponseNotModified()
 
-    changedescs = review_request.changedescs.filter(public=True)
-
-    entries = []
-
-    for temp_review in reviews:
-        temp_review.ordered_comments = \
-            temp_review.comments.order_by('filediff', 'first_line')
-
-        state = ''
-
-        try:
-            latest_changedesc = changedescs.latest('timestamp')
-            latest_timestamp = latest_changedesc.timestamp
-        except ChangeDescription.DoesNotExist:
-            latest_timestamp = None
-
-        # Mark as collapsed if the review is older than the latest change
-        if latest_timestamp:
-            if temp_review.timestamp < latest_timestamp:
-                state = 'collapsed'
-
-        try:
-            latest_reply = temp_review.public_replies().latest('timestamp').timestamp
-        except Review.DoesNotExist:
-            latest_reply = None
-
-        # Mark as expanded if there is a reply newer than last_visited
-        if latest_reply:
-          if last_visited < latest_reply:
-              state = ''
-
-        entries.append({
-            'review': temp_review,
-            'timestamp': temp_review.timestamp,
-            'class': state,
-        })
-
-    for changedesc in changedescs:
-        fields_changed = []
-
-        for name, info in changedesc.fields_changed.items():
-            multiline = False
-
-            if 'added' in info or 'removed' in info:
-                change_type = 'add_remove'
-
-                # We don't hard-code URLs in the bug info, since the
-                # tracker may move, but we can do it here.
-                if (name == "bugs_closed" and
-                    review_request.repository.bug_tracker):
-                    bug_url = review_request.repository.bug_tracker
-                    for field in info:
-                        for i, buginfo in enumerate(info[field]):
-                            try:
-                                full_bug_url = bug_url % buginfo[0]
-                                info[field][i] = (buginfo[0], full_bug_url)
-                            except TypeError:
-                                logging.warning("Invalid bugtracker url format")
-
-            elif 'old' in info or 'new' in info:
-                change_type = 'changed'
-                multiline = (name == "description" or name == "testing_done")
-
-                # Branch text is allowed to have entities, so mark it safe.
-                if name == "branch":
-                    if 'old' in info:
-                        info['old'][0] = mark_safe(info['old'][0])
-
-                    if 'new' in info:
-                        info['new'][0] = mark_safe(info['new'][0])
-            elif name == "screenshot_captions":
-                change_type = 'screenshot_captions'
-            else:
-                # No clue what this is. Bail.
-                continue
-
-            fields_changed.append({
-                'title': fields_changed_name_map.get(name, name),
-                'multiline': multiline,
-                'info': info,
-                'type': change_type,
-            })
-
-        # Expand the latest review change
-        state = ''
-
-        # Mark as collapsed if the change is older than a newer change
-        if latest_timestamp:
-            if changedesc != latest_changedesc:
-                state = 'collapsed'
-
-        entries.append({
-            'changeinfo': fields_changed,
-            'changedesc': changedesc,
-            'timestamp': changedesc.timestamp,
-            'class': state,
-        })
-
-    entries.sort(key=lambda item: item['timestamp'])
+    entries = get_review_request_entries(review_request, request.user,
+                                         last_visited)
 
     response = render_to_response(
         template_name,
@@ -678,11 +621,39 @@ def diff(request,
     if draft and draft.diffset:
         num_diffs += 1
 
-    last_activity_time, updated_object = review_request.get_last_activity()
+    last_activity_time, last_activity_type = \
+        review_request.get_last_activity()
+
+    if draft:
+        draft_timestamp = draft.last_updated
+    else:
+        draft_timestamp = ""
+
+    if review:
+        review_timestamp = review.timestamp
+    else:
+        review_timestamp = ""
+
+    if request.user.is_authenticated():
+        starred = bool(request.user.get_profile().starred_review_requests
+                                                  .filter(pk=review_request.pk)
+                                                  .count())
+    else:
+        starred = False
+
+    # The page also shows the review request, the user's draft and pending
+    # review, so these need to be part of the ETag for the diff.
+    etag_extra = (review_request.id, last_activity_time,
+                  review_request.last_updated, draft_timestamp,
+                  review_timestamp, int(starred),
+                  int(revision is not None or
+                      interdiff_revision is not None))
 
     return view_diff(
          request, diffset.id, interdiffset_id, template_name=template_name,
+         etag_extra=etag_extra,
          extra_context=_make_review_request_context(review_request, {
+            'base_url': review_request.get_absolute_url(),
             'review': review,
             'review_request_details': draft or review_request,
             'draft': draft,
@@ -712,10 +683,15 @@ def raw_diff(request,
 
     diffset = _query_for_diff(review_request, request.user, revision)
 
-    tool = review_request.repository.get_scmtool()
-    data = tool.get_parser('').raw_diff(diffset)
+    # The diff is streamed, so ConditionalGetMiddleware won't handle this.
+    if get_modified_since(request, diffset.timestamp):
+        return HttpResponseNotModified()
 
-    resp = HttpResponse(data, mimetype='text/x-patch')
+    tool = review_request.repository.get_scmtool()
+    resp = build_compressible_response(
+        request, 'diffset-raw-diff-%s' % diffset.id,
+        lambda: tool.get_parser('').iter_raw_diff(diffset),
+        mimetype='text/x-patch', streaming=True)
 
     if diffset.name == 'diff':
         filename = "bug%s.patch" % review_request.bugs_closed.replace(',', '_')
@@ -820,6 +796,38 @@ def diff_fragment(request,
                               interdiffset_id, chunkindex, template_name)
 
 
+@check_login_required
+def diff_lines(request,
+               review_request_id,
+               revision,
+               filediff_id,
+               interdiff_revision=None,
+               local_site_name=None):
+    """
+    Wrapper around diffviewer.views.view_diff_lines that takes a review
+    request.
+
+    Displays lines of unchanged context from a file in a diff or interdiff
+    owned by the given review request.
+    """
+    review_request, response = \
+        _find_review_request(request, review_request_id, local_site_name)
+
+    if not review_request:
+        return response
+
+    if interdiff_revision is not None:
+        interdiffset = _query_for_diff(review_request, request.user,
+                                       interdiff_revision)
+        interdiffset_id = interdiffset.id
+    else:
+        interdiffset_id = None
+
+    diffset = _query_for_diff(review_request, request.user, revision)
+
+    return view_diff_lines(request, diffset.id, filediff_id, interdiffset_id)
+
+
 @check_login_required
 def preview_review_request_email(
     request,
@@ -1,12 +1,14 @@
 from django.contrib import admin
+from django.utils.timesince import timesince
 from django.utils.translation import ugettext_lazy as _
 
 from reviewboard.scmtools.forms import RepositoryForm
+from reviewboard.scmtools.mirrors import get_mirror_last_updated
 from reviewboard.scmtools.models import Repository, Tool
 
 
 class RepositoryAdmin(admin.ModelAdmin):
-    list_display = ('__unicode__', 'path', 'visible')
+    list_display = ('__unicode__', 'path', 'visible', 'mirror_updated')
     fieldsets = (
         (_('General Information'), {
             'fields': ('name', 'visible',),
@@ -43,7 +45,7 @@ class RepositoryAdmin(admin.ModelAdmin):
             'classes': ('wide',),
         }),
         (_('Advanced'), {
-            'fields': ('encoding',),
+            'fields': ('encoding', 'timeout'),
             'classes': ('wide',),
         }),
         (_('State'), {
@@ -55,6 +57,15 @@ class RepositoryAdmin(admin.ModelAdmin):
     )
     form = RepositoryForm
 
+    def mirror_updated(self, repository):
+        last_updated = get_mirror_last_updated(repository)
+
+        if last_updated:
+            return _('%s ago') % timesince(last_updated)
+        else:
+            return ''
+    mirror_updated.short_description = _('Local mirror updated')
+
 
 class ToolAdmin(admin.ModelAdmin):
     list_display = ('__unicode__', 'class_name')
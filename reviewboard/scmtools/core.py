@@ -70,6 +70,26 @@ class SCMTool(object):
         except FileNotFoundError:
             return False
 
+    def prefetch_files(self, files):
+        """
+        Prepares for fetching a list of files.
+
+        ``files`` is a list of (path, revision) tuples. Tools that can look
+        up information on many files with fewer requests to the repository
+        can override this to do so and cache the results, which get_file
+        and file_exists can then use. This does nothing by default.
+        """
+        pass
+
+    def get_local_mirror(self):
+        """
+        Returns the LocalMirror used for reading files, or None.
+
+        Tools that can keep a local mirror of remote repositories (see
+        reviewboard.scmtools.mirrors) override this.
+        """
+        return None
+
     def parse_diff_revision(self, file_str, revision_str):
         raise NotImplementedError
 
@@ -1,12 +1,12 @@
 import os
 import re
-import subprocess
+import shutil
 import tempfile
 import urlparse
 
 from djblets.util.filesystem import is_exe_in_path
 
-from reviewboard.scmtools import sshutils
+from reviewboard.scmtools import procutils, sshutils
 from reviewboard.scmtools.core import SCMTool, HEAD, PRE_CREATION
 from reviewboard.scmtools.errors import SCMError, FileNotFoundError, \
                                         RepositoryNotFoundError
@@ -35,7 +35,8 @@ class CVSTool(SCMTool):
             self.build_cvsroot(self.repository.path,
                                self.repository.username,
                                self.repository.password)
-        self.client = CVSClient(self.cvsroot, self.repopath)
+        self.client = CVSClient(self.cvsroot, self.repopath,
+                                repository.get_timeout())
 
     def get_file(self, path, revision=HEAD):
         if not path:
@@ -181,26 +182,80 @@ class CVSDiffParser(DiffParser):
 
 
 class CVSClient:
-    def __init__(self, repository, path):
-        self.tempdir = ""
-        self.currentdir = os.getcwd()
+    # Files that were last found in the Attic, keyed on the CVSROOT and
+    # the normal filename. The Attic is tried first the next time these
+    # files are fetched.
+    attic_filenames = set()
+
+    def __init__(self, repository, path, timeout=None):
         self.repository = repository
         self.path = path
+        self.timeout = timeout
 
         if not is_exe_in_path('cvs'):
             # This is technically not the right kind of error, but it's the
             # pattern we use with all the other tools.
             raise ImportError
 
-    def cleanup(self):
-        if self.currentdir != os.getcwd():
-            # Restore current working directory
-            os.chdir(self.currentdir)
-            # Remove temporary directory
-            if self.tempdir != "":
-                os.rmdir(self.tempdir)
-
     def cat_file(self, filename, revision):
+        filename, filenameAttic = self._normalize_filename(filename)
+        candidates = self._get_candidate_filenames(filename, filenameAttic)
+
+        for i, candidate in enumerate(candidates):
+            try:
+                contents = self._cat_specific_file(candidate, revision)
+            except FileNotFoundError:
+                if i == len(candidates) - 1:
+                    raise
+            else:
+                self._set_in_attic(filename, candidate == filenameAttic)
+                return contents
+
+    def cat_files(self, filenames, revision):
+        """
+        Fetches several files at the same revision.
+
+        The files are fetched with a single cvs checkout, followed by one
+        more for any files that were only found under their alternate
+        Attic or non-Attic names. The result is a dictionary mapping each
+        filename that was found to its contents.
+        """
+        results = {}
+        normalized = {}
+        candidates = {}
+
+        for path in filenames:
+            filename, filenameAttic = self._normalize_filename(path)
+            normalized[path] = (filename, filenameAttic)
+            candidates[path] = self._get_candidate_filenames(filename,
+                                                             filenameAttic)
+
+        for i in (0, 1):
+            pending = {}
+
+            for path, names in candidates.iteritems():
+                if path not in results and len(names) > i:
+                    pending.setdefault(names[i], []).append(path)
+
+            if not pending:
+                break
+
+            found = self._checkout_files(pending.keys(), revision)
+
+            for candidate, contents in found.iteritems():
+                for path in pending[candidate]:
+                    filename, filenameAttic = normalized[path]
+                    results[path] = contents
+                    self._set_in_attic(filename, candidate == filenameAttic)
+
+        return results
+
+    def _normalize_filename(self, filename):
+        """
+        Returns the filename to fetch, along with its name in the Attic.
+
+        The name in the Attic is None if the file has no path information.
+        """
         # We strip the repo off of the fully qualified path as CVS does
         # not like to be given absolute paths.
         repos_path = self.path.split(":")[-1]
@@ -237,27 +292,93 @@ class CVSClient:
             # Attic path that makes any kind of sense.
             filenameAttic = None
 
+        return filename, filenameAttic
+
+    def _get_candidate_filenames(self, filename, filenameAttic):
+        """
+        Returns the names to try when fetching a file, in order.
+
+        Files are looked for outside the Attic first, unless they were
+        last found in the Attic.
+        """
+        if not filenameAttic:
+            return [filename]
+        elif (self.repository, filename) in self.attic_filenames:
+            return [filenameAttic, filename]
+        else:
+            return [filename, filenameAttic]
+
+    def _set_in_attic(self, filename, in_attic):
+        if in_attic:
+            self.attic_filenames.add((self.repository, filename))
+        else:
+            self.attic_filenames.discard((self.repository, filename))
+
+    def _run_cvs(self, args):
+        """
+        Runs cvs in a new temporary directory.
+
+        Somehow CVS sometimes seems to write .cvsignore files to the current
+        working directory even though we force stdout with -p, and checkouts
+        write the files there. cvs is run with the temporary directory as
+        its working directory, rather than changing the working directory
+        of the whole process, so this is safe to use from several threads.
+
+        Returns the stdout, stderr, exit code and the temporary directory,
+        which the caller must remove.
+        """
+        tempdir = tempfile.mkdtemp()
+
         try:
-            return self._cat_specific_file(filename, revision)
-        except FileNotFoundError:
-            if filenameAttic:
-                return self._cat_specific_file(filenameAttic, revision)
-            else:
-                raise
+            contents, errmsg, returncode = procutils.run_command(
+                ['cvs', '-f', '-d', self.repository] + args,
+                timeout=self.timeout,
+                cwd=tempdir)
+        except:
+            shutil.rmtree(tempdir, ignore_errors=True)
+            raise
+
+        return contents, errmsg, returncode, tempdir
+
+    def _checkout_files(self, filenames, revision):
+        """
+        Checks out several files at a revision with a single cvs command.
+
+        Returns a dictionary mapping each filename that was found to its
+        contents.
+        """
+        results = {}
+        contents, errmsg, failure, tempdir = \
+            self._run_cvs(['checkout', '-r', str(revision)] + filenames)
+
+        try:
+            for filename in filenames:
+                path = os.path.join(tempdir, filename)
+
+                if os.path.isfile(path):
+                    f = open(path, 'rb')
+
+                    try:
+                        results[filename] = f.read()
+                    finally:
+                        f.close()
+        finally:
+            shutil.rmtree(tempdir, ignore_errors=True)
+
+        # See _cat_specific_file for the error messages that may be
+        # returned. Files that couldn't be found are simply left out.
+        if (not results and failure and
+            not errmsg.startswith('cvs checkout: cannot find module') and
+            not errmsg.startswith('cvs checkout: could not read RCS file') and
+            not ".cvspass does not exist - creating new file" in errmsg):
+            raise SCMError(errmsg)
+
+        return results
 
     def _cat_specific_file(self, filename, revision):
-        # Somehow CVS sometimes seems to write .cvsignore files to current
-        # working directory even though we force stdout with -p.
-        self.tempdir = tempfile.mkdtemp()
-        os.chdir(self.tempdir)
-
-        p = subprocess.Popen(['cvs', '-f', '-d', self.repository, 'checkout',
-                              '-r', str(revision), '-p', filename],
-                             stderr=subprocess.PIPE, stdout=subprocess.PIPE,
-                             close_fds=(os.name != 'nt'))
-        contents = p.stdout.read()
-        errmsg = p.stderr.read()
-        failure = p.wait()
+        contents, errmsg, failure, tempdir = \
+            self._run_cvs(['checkout', '-r', str(revision), '-p', filename])
+        shutil.rmtree(tempdir, ignore_errors=True)
 
         # Unfortunately, CVS is not consistent about exiting non-zero on
         # errors.  If the file is not found at all, then CVS will print an
@@ -279,7 +400,6 @@ class CVSClient:
         if not errmsg or \
            errmsg.startswith('cvs checkout: cannot find module') or \
            errmsg.startswith('cvs checkout: could not read RCS file'):
-            self.cleanup()
             raise FileNotFoundError(filename, revision)
 
         # Otherwise, if there's an exit code, or errmsg doesn't look like
@@ -289,8 +409,6 @@ class CVSClient:
         # stating this. This is safe to ignore.
         if (failure and not errmsg.startswith('==========')) and \
            not ".cvspass does not exist - creating new file" in errmsg:
-            self.cleanup()
             raise SCMError(errmsg)
 
-        self.cleanup()
         return contents
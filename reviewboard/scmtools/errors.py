@@ -62,6 +62,25 @@ class FileNotFoundError(SCMError):
         self.detail = detail
 
 
+class SCMTimeoutError(SCMError):
+    """An error indicating that fetching a file took too long.
+
+    The file continues to be fetched in the background, and will be
+    available from the cache once it has been fetched.
+    """
+    def __init__(self, path, revision, timeout):
+        SCMError.__init__(self, _("The file '%(path)s' (r%(revision)s) is "
+                                  "taking too long to fetch from the "
+                                  "repository. It's still being fetched; "
+                                  "reload the page to try again.") % {
+            'path': path,
+            'revision': revision,
+        })
+        self.path = path
+        self.revision = revision
+        self.timeout = timeout
+
+
 class RepositoryNotFoundError(SCMError):
     """An error indicating that a path does not represent a valid repository."""
     def __init__(self):
@@ -0,0 +1,7 @@
+from django_evolution.mutations import AddField
+from django.db import models
+
+
+MUTATIONS = [
+    AddField('Repository', 'timeout', models.PositiveIntegerField, null=True)
+]
@@ -14,6 +14,7 @@ from reviewboard.scmtools import sshutils
 from reviewboard.scmtools.errors import BadHostKeyError, \
                                         UnknownHostKeyError, \
                                         UnverifiedCertificateError
+from reviewboard.scmtools.metrics import measure_call
 from reviewboard.scmtools.models import Tool
 from reviewboard.site.models import LocalSite
 
@@ -354,6 +355,16 @@ class RepositoryForm(forms.ModelForm):
                     "an advanced setting and should only be used if you're "
                     "sure you need it."))
 
+    timeout = forms.IntegerField(
+        label=_("Timeout"),
+        min_value=1,
+        required=False,
+        help_text=_("The number of seconds to wait for a file from this "
+                    "repository before showing an error. The file continues "
+                    "to be fetched in the background. This is an advanced "
+                    "setting and should only be used if the repository is "
+                    "slow to respond."))
+
     # Access Control
     local_site = forms.ModelChoiceField(
         label=_("Local site"),
@@ -679,7 +690,9 @@ class RepositoryForm(forms.ModelForm):
             # Keep doing this until we have an error we don't want
             # to ignore, or it's successful.
             try:
-                scmtool_class.check_repository(path, username, password)
+                measure_call('check_repository', tool.name, self.instance,
+                             scmtool_class.check_repository,
+                             path, username, password)
 
                 # Success.
                 break
@@ -16,7 +16,10 @@ from django.utils.translation import ugettext_lazy as _
 from djblets.util.filesystem import is_exe_in_path
 
 from reviewboard.diffviewer.parser import DiffParser, DiffParserError, File
+from reviewboard.scmtools import httputils, procutils, sshutils
 from reviewboard.scmtools.core import SCMTool, HEAD, PRE_CREATION
+from reviewboard.scmtools.mirrors import GitMirror, get_mirror_path, \
+                                         is_remote_url
 from reviewboard.scmtools.errors import FileNotFoundError, \
                                         InvalidRevisionFormatError, \
                                         RepositoryNotFoundError, \
@@ -56,7 +59,16 @@ class GitTool(SCMTool):
 
     def __init__(self, repository):
         SCMTool.__init__(self, repository)
-        self.client = GitClient(repository.path, repository.raw_file_url)
+        self.client = GitClient(repository.path, repository.raw_file_url,
+                                repository.get_timeout())
+
+        mirror_path = get_mirror_path(repository)
+
+        if mirror_path and is_remote_url(self.client.path):
+            self.client.mirror = GitMirror(mirror_path, self.client.path)
+
+    def get_local_mirror(self):
+        return self.client.mirror
 
     def get_file(self, path, revision=HEAD):
         if revision == PRE_CREATION:
@@ -263,7 +275,7 @@ class GitClient(object):
         r'^(?P<username>[A-Za-z0-9_\.-]+@)?(?P<hostname>[A-Za-z0-9_\.-]+):'
         r'(?P<path>.*)')
 
-    def __init__(self, path, raw_file_url=None):
+    def __init__(self, path, raw_file_url=None, timeout=None):
         if not is_exe_in_path('git'):
             # This is technically not the right kind of error, but it's the
             # pattern we use with all the other tools.
@@ -271,7 +283,9 @@ class GitClient(object):
 
         self.path = self._normalize_git_url(path)
         self.raw_file_url = raw_file_url
+        self.timeout = timeout
         self.git_dir = None
+        self.mirror = None
 
         url_parts = urlparse.urlparse(self.path)
 
@@ -302,7 +316,8 @@ class GitClient(object):
             ['git', 'ls-remote', self.path, 'HEAD'],
             stderr=subprocess.PIPE,
             stdout=subprocess.PIPE,
-            close_fds=(os.name != 'nt')
+            close_fds=(os.name != 'nt'),
+            env=sshutils.get_ssh_env()
         )
         errmsg = p.stderr.read()
         failure = p.wait()
@@ -315,13 +330,19 @@ class GitClient(object):
         return True
 
     def get_file(self, path, revision):
+        if self.mirror:
+            data = self._cat_mirrored_file(path, revision, "blob")
+
+            if data is not None:
+                return data
+
         if self.raw_file_url:
             self.validate_sha1_format(path, revision)
 
             # First, try to grab the file remotely.
             try:
                 url = self._build_raw_url(path, revision)
-                return urllib2.urlopen(url).read()
+                return httputils.urlopen(url, timeout=self.timeout).read()
             except Exception, e:
                 logging.error("Git: Error fetching file from %s: %s" % (url, e))
                 raise SCMError("Error fetching file from %s: %s" % (url, e))
@@ -329,13 +350,31 @@ class GitClient(object):
             return self._cat_file(path, revision, "blob")
 
     def get_file_exists(self, path, revision):
+        if self.mirror:
+            try:
+                contents = self._cat_mirrored_file(path, revision, "-t")
+            except FileNotFoundError:
+                return False
+
+            if contents is not None:
+                return contents.strip() == "blob"
+
         if self.raw_file_url:
             self.validate_sha1_format(path, revision)
 
-            # First, try to grab the file remotely.
+            # Check for the file remotely. A HEAD request avoids downloading
+            # the file, but not all servers support them.
             try:
                 url = self._build_raw_url(path, revision)
-                return urllib2.urlopen(url).geturl()
+
+                try:
+                    return httputils.urlopen(url, method='HEAD',
+                                             timeout=self.timeout).geturl()
+                except urllib2.HTTPError, e:
+                    if e.code not in (405, 501):
+                        raise
+
+                return httputils.urlopen(url, timeout=self.timeout).geturl()
             except urllib2.HTTPError, e:
                 if e.code != 404:
                     logging.error("Git: HTTP error code %d when fetching "
@@ -359,7 +398,20 @@ class GitClient(object):
         url = url.replace("<filename>", urllib_quote(path))
         return url
 
-    def _cat_file(self, path, revision, option):
+    def _cat_mirrored_file(self, path, revision, option):
+        """
+        Calls _cat_file on the local mirror of a remote repository.
+
+        The mirror is updated in the background if the object isn't in it
+        yet. If there's a raw file URL to fall back on, this then returns
+        None. Otherwise, there's no other way to read the file, so an error
+        is raised until the mirror has been updated.
+        """
+        return self.mirror.fetch(lambda: self._cat_file(path, revision, option,
+                                                        self.mirror.path),
+                                 can_fall_back=bool(self.raw_file_url))
+
+    def _cat_file(self, path, revision, option, git_dir=None):
         """
         Call git-cat-file(1) to get content or type information for a
         repository object.
@@ -369,18 +421,16 @@ class GitClient(object):
 
         Otherwise, "option" can be used to pass a switch to git-cat-file,
         e.g. to test or existence or get the type of "commit".
+
+        The repository in ``git_dir`` is used instead of this client's, if
+        provided.
         """
         commit = self._resolve_head(revision, path)
 
-        p = subprocess.Popen(
-            ['git', '--git-dir=%s' % self.git_dir, 'cat-file', option, commit],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            close_fds=(os.name != 'nt')
-        )
-        contents = p.stdout.read()
-        errmsg = p.stderr.read()
-        failure = p.wait()
+        contents, errmsg, failure = procutils.run_command(
+            ['git', '--git-dir=%s' % (git_dir or self.git_dir), 'cat-file',
+             option, commit],
+            timeout=self.timeout)
 
         if failure:
             if errmsg.startswith("fatal: Not a valid object name"):
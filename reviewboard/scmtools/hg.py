@@ -7,9 +7,11 @@ except ImportError:
     from urllib import quote as urllib_quote
 
 from reviewboard.diffviewer.parser import DiffParser, DiffParserError
+from reviewboard.scmtools import httputils
 from reviewboard.scmtools.git import GitDiffParser
 from reviewboard.scmtools.core import \
     FileNotFoundError, SCMTool, HEAD, PRE_CREATION, UNKNOWN
+from reviewboard.scmtools.mirrors import HgMirror, get_mirror_path
 
 
 class HgTool(SCMTool):
@@ -21,10 +23,20 @@ class HgTool(SCMTool):
 
     def __init__(self, repository):
         SCMTool.__init__(self, repository)
+        self.mirror = None
+
         if repository.path.startswith('http'):
             self.client = HgWebClient(repository.path,
                                       repository.username,
-                                      repository.password)
+                                      repository.password,
+                                      repository.get_timeout())
+
+            mirror_path = get_mirror_path(repository)
+
+            if mirror_path:
+                self.mirror = HgMirror(mirror_path, repository.path,
+                                       repository.username,
+                                       repository.password)
         else:
             self.client = HgClient(repository.path)
 
@@ -32,8 +44,21 @@ class HgTool(SCMTool):
         self.diff_uses_changeset_ids = True
 
     def get_file(self, path, revision=HEAD):
+        # The tip of the mirror may be out of date, so only use it for
+        # specific revisions.
+        if self.mirror and revision not in (HEAD, UNKNOWN, PRE_CREATION):
+            data = self.mirror.fetch(
+                lambda: HgClient(self.mirror.path).cat_file(path,
+                                                            str(revision)))
+
+            if data is not None:
+                return data
+
         return self.client.cat_file(path, str(revision))
 
+    def get_local_mirror(self):
+        return self.mirror
+
     def parse_diff_revision(self, file_str, revision_str):
         revision = revision_str
         if file_str == "/dev/null":
@@ -108,11 +133,17 @@ class HgDiffParser(DiffParser):
 
 class HgWebClient(object):
     FULL_FILE_URL = '%(url)s/%(rawpath)s/%(revision)s/%(quoted_path)s'
+    RAW_PATHS = ['raw-file', 'raw']
+
+    # The raw path last found to work for each hgweb URL, which is tried
+    # first for later files.
+    raw_paths = {}
 
-    def __init__(self, repoPath, username, password):
+    def __init__(self, repoPath, username, password, timeout=None):
         self.url = repoPath
         self.username = username
         self.password = password
+        self.timeout = timeout
         logging.debug('Initialized HgWebClient with url=%r, username=%r',
                       self.url, self.username)
 
@@ -122,25 +153,29 @@ class HgWebClient(object):
         elif rev == PRE_CREATION:
             rev = ""
 
-        found = False
+        e = None
+        rawpaths = list(self.RAW_PATHS)
+        known_rawpath = self.raw_paths.get(self.url)
 
-        for rawpath in ["raw-file", "raw"]:
+        if known_rawpath in rawpaths:
+            rawpaths.remove(known_rawpath)
+            rawpaths.insert(0, known_rawpath)
+
+        for rawpath in rawpaths:
             full_url = ''
 
             try:
-                passman = urllib2.HTTPPasswordMgrWithDefaultRealm()
-                passman.add_password(None, self.url, self.username,
-                                     self.password)
-                authhandler = urllib2.HTTPBasicAuthHandler(passman)
-                opener = urllib2.build_opener(authhandler)
                 full_url = self.FULL_FILE_URL % {
                     'url': self.url.rstrip('/'),
                     'rawpath': rawpath,
                     'revision': rev,
                     'quoted_path': urllib_quote(path.lstrip('/')),
                 }
-                f = opener.open(full_url)
-                return f.read()
+                data = httputils.urlopen(full_url, username=self.username,
+                                         password=self.password,
+                                         timeout=self.timeout).read()
+                self.raw_paths[self.url] = rawpath
+                return data
 
             except urllib2.HTTPError, e:
 
@@ -149,12 +184,11 @@ class HgWebClient(object):
                                   "file from %s: %s", self.__class__.__name__,
                                   e.code, full_url, e)
 
-            except Exception:
+            except Exception, e:
                 logging.exception('%s: Non-HTTP error when fetching %r: ',
                                   self.__class__.__name__, full_url)
 
-        if not found:
-            raise FileNotFoundError(path, rev, str(e))
+        raise FileNotFoundError(path, rev, str(e))
 
     def get_filenames(self, rev):
         raise NotImplemented
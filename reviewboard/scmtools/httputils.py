@@ -0,0 +1,226 @@
+import base64
+import httplib
+import socket
+import threading
+import urllib
+import urllib2
+import urlparse
+
+
+# The maximum number of idle connections kept open to each host.
+MAX_IDLE_CONNECTIONS = 4
+
+# The maximum number of redirects followed for a request.
+MAX_REDIRECTS = 5
+
+
+class HTTPResponse(object):
+    """The result of a successful HTTP request."""
+    def __init__(self, url, status, headers, data):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+    def geturl(self):
+        return self.url
+
+    def read(self):
+        return self.data
+
+
+class HTTPConnectionPool(object):
+    """A thread-safe pool of keep-alive HTTP connections.
+
+    Idle connections are kept for each scheme, host and port, and reused by
+    later requests to the same host. This saves setting up a new TCP
+    connection (and for HTTPS, a new SSL session) for every file fetched
+    from a repository's web server.
+    """
+    def __init__(self, max_idle=MAX_IDLE_CONNECTIONS):
+        self.max_idle = max_idle
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def request(self, url, method='GET', username=None, password=None,
+                timeout=None):
+        """Performs a request, following any redirects.
+
+        Returns an HTTPResponse for successful requests. Error responses
+        raise urllib2.HTTPError, like urllib2.urlopen does. If ``timeout``
+        is given, connecting and each read give up after that many seconds
+        with socket.timeout.
+        """
+        headers = {}
+
+        if username:
+            headers['Authorization'] = 'Basic %s' % \
+                base64.b64encode('%s:%s' % (username, password or ''))
+
+        for i in range(MAX_REDIRECTS + 1):
+            status, reason, response_headers, data = \
+                self._request(url, method, headers, timeout)
+
+            if (status in (301, 302, 303, 307) and
+                'location' in response_headers):
+                new_url = urlparse.urljoin(url, response_headers['location'])
+
+                # Don't send the credentials on to another host.
+                if urlparse.urlsplit(new_url)[1] != urlparse.urlsplit(url)[1]:
+                    headers.pop('Authorization', None)
+
+                url = new_url
+
+                if status == 303:
+                    method = 'GET'
+            elif status >= 400:
+                raise urllib2.HTTPError(url, status, reason, response_headers,
+                                        None)
+            else:
+                return HTTPResponse(url, status, response_headers, data)
+
+        raise urllib2.HTTPError(url, status, 'Too many redirects',
+                                response_headers, None)
+
+    def close(self):
+        """Closes all idle connections."""
+        self._lock.acquire()
+
+        try:
+            idle = self._idle
+            self._idle = {}
+        finally:
+            self._lock.release()
+
+        for conns in idle.itervalues():
+            for conn in conns:
+                conn.close()
+
+    def _request(self, url, method, headers, timeout):
+        scheme, netloc, path, query = urlparse.urlsplit(url)[:4]
+        key = (scheme, netloc)
+
+        if query:
+            path += '?' + query
+
+        if not path:
+            path = '/'
+
+        conn = self._get_idle(key)
+        reused = conn is not None
+
+        if reused:
+            # The connection may have been opened for another repository,
+            # with a different timeout.
+            conn.timeout = timeout
+            conn.sock.settimeout(timeout)
+
+        while True:
+            if conn is None:
+                conn = self._connect(scheme, netloc, timeout)
+
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                conn = None
+
+                # The server may have closed an idle connection, so retry
+                # once with a new one.
+                if not reused:
+                    raise
+
+                reused = False
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._put_idle(key, conn)
+
+        return (response.status, response.reason,
+                dict(response.getheaders()), data)
+
+    def _connect(self, scheme, netloc, timeout):
+        if scheme == 'https':
+            return httplib.HTTPSConnection(netloc, timeout=timeout)
+        elif scheme == 'http':
+            return httplib.HTTPConnection(netloc, timeout=timeout)
+        else:
+            raise ValueError('Unsupported URL scheme %s' % scheme)
+
+    def _get_idle(self, key):
+        self._lock.acquire()
+
+        try:
+            conns = self._idle.get(key)
+
+            if conns:
+                return conns.pop()
+
+            return None
+        finally:
+            self._lock.release()
+
+    def _put_idle(self, key, conn):
+        self._lock.acquire()
+
+        try:
+            conns = self._idle.setdefault(key, [])
+
+            if len(conns) < self.max_idle:
+                conns.append(conn)
+                conn = None
+        finally:
+            self._lock.release()
+
+        if conn:
+            conn.close()
+
+
+_pool = HTTPConnectionPool()
+
+
+def urlopen(url, method='GET', username=None, password=None, timeout=None):
+    """Performs an HTTP request, reusing a pooled connection if possible.
+
+    This is a replacement for urllib2.urlopen for fetching files from
+    repositories' web servers. The response body is read fully before
+    returning. If a proxy is configured for the URL's scheme, the request
+    goes through urllib2 so that the proxy is used.
+
+    SCMTools pass their repository's timeout as ``timeout``, so that a
+    server that stops responding can't hold up a fetch forever.
+    """
+    scheme = urlparse.urlsplit(url)[0]
+
+    if scheme in urllib.getproxies():
+        return _urllib2_open(url, method, username, password, timeout)
+
+    return _pool.request(url, method, username, password, timeout)
+
+
+def _urllib2_open(url, method, username, password, timeout):
+    handlers = []
+
+    if username:
+        passman = urllib2.HTTPPasswordMgrWithDefaultRealm()
+        passman.add_password(None, url, username, password)
+        handlers.append(urllib2.HTTPBasicAuthHandler(passman))
+
+    request = urllib2.Request(url)
+    request.get_method = lambda: method
+    opener = urllib2.build_opener(*handlers)
+
+    if timeout is None:
+        f = opener.open(request)
+    else:
+        f = opener.open(request, timeout=timeout)
+
+    try:
+        return HTTPResponse(f.geturl(), f.code, dict(f.info().items()),
+                            f.read())
+    finally:
+        f.close()
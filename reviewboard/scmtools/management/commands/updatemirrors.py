@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from reviewboard.scmtools.errors import SCMError
+from reviewboard.scmtools.models import Repository
+
+
+class Command(BaseCommand):
+    help = 'Creates or updates the local mirrors of remote repositories.'
+    args = '[repository-id ...]'
+
+    def handle(self, *args, **options):
+        repositories = Repository.objects.all()
+
+        if args:
+            repositories = repositories.filter(pk__in=args)
+
+        for repository in repositories:
+            try:
+                mirror = repository.get_scmtool().get_local_mirror()
+            except Exception, e:
+                sys.stderr.write("Unable to load the SCMTool for %s: %s\n" %
+                                 (repository, e))
+                continue
+
+            if not mirror:
+                continue
+
+            print "Updating the local mirror of %s" % repository
+
+            try:
+                mirror.update()
+            except SCMError, e:
+                sys.stderr.write("Unable to update the local mirror of %s: "
+                                 "%s\n" % (repository, e))
@@ -0,0 +1,187 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+from reviewboard.scmtools.errors import FileNotFoundError
+
+
+# The SCMTool operations that are measured.
+OPERATIONS = ('get_file', 'file_exists', 'get_changeset', 'check_repository')
+
+# The upper bounds, in seconds, of the buckets in the latency histograms.
+# Slower calls go in a final bucket.
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# How long, in seconds, each counter is kept after it's first recorded.
+METRICS_EXPIRATION = 60 * 60 * 24 * 30
+
+# Tracks which tools are in the middle of an instrumented call, so that
+# calls a tool makes to itself (such as file_exists calling get_file) are
+# only counted once.
+_active_calls = threading.local()
+
+
+def get_repository_scope(repository):
+    return 'repository-%s' % repository.pk
+
+
+def get_tool_scope(tool_name):
+    return 'tool-%s' % tool_name
+
+
+def record_call(operation, tool_name, repository, duration, failed):
+    """Records a call to an SCMTool.
+
+    The call is counted for the repository, if there is one (repositories
+    being checked before they're created don't have one), and for the
+    type of tool, given as the name of its Tool.
+
+    Metrics are kept in the cache so that they're shared by every server
+    process. They're lost if the cache is cleared.
+    """
+    scopes = [get_tool_scope(tool_name)]
+
+    if repository and repository.pk:
+        scopes.append(get_repository_scope(repository))
+
+    for bucket, upper_bound in enumerate(LATENCY_BUCKETS):
+        if duration <= upper_bound:
+            break
+    else:
+        bucket = len(LATENCY_BUCKETS)
+
+    for scope in scopes:
+        prefix = _make_key(scope, operation)
+
+        _incr('%s:calls' % prefix)
+        _incr('%s:time-ms' % prefix, int(duration * 1000))
+        _incr('%s:bucket-%d' % (prefix, bucket))
+
+        if failed:
+            _incr('%s:errors' % prefix)
+
+
+def measure_call(operation, tool_name, repository, func, *args, **kwargs):
+    """Calls an SCMTool function and records how long it took.
+
+    FileNotFoundError isn't counted as an error, since it's a valid answer
+    from the repository.
+    """
+    start = time.time()
+    failed = False
+
+    try:
+        try:
+            return func(*args, **kwargs)
+        except FileNotFoundError:
+            raise
+        except Exception:
+            failed = True
+            raise
+    finally:
+        record_call(operation, tool_name, repository, time.time() - start,
+                    failed)
+
+
+def instrument_tool(tool):
+    """Records metrics on the calls made to an SCMTool instance.
+
+    The SCMTool's methods for the measured operations are wrapped in place,
+    and the tool is returned.
+    """
+    repository = tool.repository
+
+    def wrap(operation, func):
+        def _wrapped(*args, **kwargs):
+            if not hasattr(_active_calls, 'tools'):
+                _active_calls.tools = set()
+
+            if id(tool) in _active_calls.tools:
+                return func(*args, **kwargs)
+
+            _active_calls.tools.add(id(tool))
+
+            try:
+                return measure_call(operation, repository.tool.name,
+                                    repository, func, *args, **kwargs)
+            finally:
+                _active_calls.tools.discard(id(tool))
+
+        return _wrapped
+
+    for operation in OPERATIONS:
+        if operation != 'check_repository':
+            setattr(tool, operation, wrap(operation,
+                                          getattr(tool, operation)))
+
+    return tool
+
+
+def get_metrics(scopes):
+    """Returns the metrics for a list of scopes.
+
+    The result is a dictionary mapping each scope to a dictionary of
+    operations. Each operation has the number of calls and errors, the
+    error rate, the total and mean time in seconds, and a histogram of
+    latencies as a list of (upper bound, count) tuples. The upper bound
+    of the last bucket is None.
+    """
+    fields = ['calls', 'errors', 'time-ms'] + \
+             ['bucket-%d' % i for i in range(len(LATENCY_BUCKETS) + 1)]
+    keys = [_make_key(scope, operation, field)
+            for scope in scopes
+            for operation in OPERATIONS
+            for field in fields]
+    values = cache.get_many(keys)
+    bounds = list(LATENCY_BUCKETS) + [None]
+    result = {}
+
+    for scope in scopes:
+        result[scope] = scope_metrics = {}
+
+        for operation in OPERATIONS:
+            def get_value(field):
+                return int(values.get(_make_key(scope, operation, field), 0))
+
+            calls = get_value('calls')
+            errors = get_value('errors')
+            total_time = get_value('time-ms') / 1000.0
+
+            if calls:
+                error_rate = float(errors) / calls
+                mean_time = total_time / calls
+            else:
+                error_rate = 0
+                mean_time = 0
+
+            scope_metrics[operation] = {
+                'calls': calls,
+                'errors': errors,
+                'error_rate': error_rate,
+                'total_time': total_time,
+                'mean_time': mean_time,
+                'latency': [(bound, get_value('bucket-%d' % i))
+                            for i, bound in enumerate(bounds)],
+            }
+
+    return result
+
+
+def _make_key(scope, operation, field=None):
+    key = 'scm-metrics:%s:%s' % (scope, operation)
+
+    if field:
+        key += ':' + field
+
+    return key
+
+
+def _incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # The key doesn't exist yet. If another process adds it first,
+        # increment that instead.
+        if not cache.add(key, delta, METRICS_EXPIRATION):
+            cache.incr(key, delta)
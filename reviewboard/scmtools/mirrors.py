@@ -0,0 +1,316 @@
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import urlparse
+from datetime import datetime, timedelta
+
+try:
+    import fcntl
+except ImportError:
+    # Windows doesn't have fcntl. Updates are then only serialized within
+    # each process.
+    fcntl = None
+
+from django.utils.translation import ugettext as _
+from djblets.siteconfig.models import SiteConfiguration
+
+from reviewboard.scmtools import sshutils
+from reviewboard.scmtools.errors import FileNotFoundError, SCMError
+
+
+# The file in a mirror that records when it was last updated.
+UPDATED_FILENAME = 'reviewboard-updated'
+
+# The minimum number of seconds between updates of a mirror caused by
+# files missing from it.
+MIN_UPDATE_INTERVAL = 30
+
+# Guards the state of the background updates below.
+_updates_lock = threading.Lock()
+
+# The paths of the mirrors being updated in the background by this process.
+_updating_paths = set()
+
+# When this process last started a background update of each mirror.
+_update_attempts = {}
+
+
+def get_mirrors_dir():
+    """Returns the directory that local mirrors are kept in.
+
+    This is None if local mirrors are disabled.
+    """
+    siteconfig = SiteConfiguration.objects.get_current()
+    return siteconfig.get('scmtools_mirrors_dir') or None
+
+
+def get_mirror_path(repository):
+    """Returns the path to the local mirror of a repository.
+
+    This is None if local mirrors are disabled. The mirror may not exist
+    yet.
+    """
+    mirrors_dir = get_mirrors_dir()
+
+    if not mirrors_dir or not repository.pk:
+        return None
+
+    return os.path.join(mirrors_dir, 'repository-%s' % repository.pk)
+
+
+def get_mirror_last_updated(repository):
+    """Returns when the local mirror of a repository was last updated.
+
+    This is None if the repository has no local mirror.
+    """
+    path = get_mirror_path(repository)
+
+    if path:
+        return LocalMirror(path, None).get_last_updated()
+
+    return None
+
+
+def is_remote_url(url):
+    """Returns whether a repository URL is on another machine."""
+    scheme = urlparse.urlparse(url)[0]
+
+    # Single letters are Windows drive letters.
+    return len(scheme) > 1 and scheme != 'file'
+
+
+class LocalMirror(object):
+    """A local copy of a remote repository.
+
+    SCMTools can read files from the mirror with their local code paths
+    instead of fetching them over the network. Mirrors are created and
+    updated by the updatemirrors management command, and in the background
+    when a file is missing from one. They're never updated while a request
+    waits.
+
+    Subclasses implement creating and updating the mirror for a particular
+    type of repository.
+    """
+    def __init__(self, path, url, username=None, password=None):
+        self.path = path
+        self.url = url
+        self.username = username
+        self.password = password
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, UPDATED_FILENAME))
+
+    def get_last_updated(self):
+        """Returns when the mirror was last updated, or None."""
+        try:
+            return datetime.fromtimestamp(
+                os.path.getmtime(os.path.join(self.path, UPDATED_FILENAME)))
+        except OSError:
+            return None
+
+    def update(self):
+        """Creates the mirror if needed, and fetches any new changes.
+
+        Only one update of a mirror runs at a time. Others wait for it to
+        finish. Raises SCMError if the mirror couldn't be updated.
+        """
+        lock_file = self._lock()
+
+        try:
+            self._update()
+
+            f = open(os.path.join(self.path, UPDATED_FILENAME), 'w')
+            f.write('%s\n' % time.time())
+            f.close()
+        finally:
+            self._unlock(lock_file)
+
+    def start_update(self):
+        """Updates the mirror in a background thread.
+
+        This does nothing if the mirror is already being updated by this
+        process, or if it was updated or an update was started in the last
+        MIN_UPDATE_INTERVAL seconds.
+        """
+        now = time.time()
+        last_updated = self.get_last_updated()
+
+        if (last_updated and
+            datetime.now() - last_updated <
+            timedelta(seconds=MIN_UPDATE_INTERVAL)):
+            return
+
+        _updates_lock.acquire()
+
+        try:
+            if (self.path in _updating_paths or
+                now - _update_attempts.get(self.path, 0) <
+                MIN_UPDATE_INTERVAL):
+                return
+
+            _updating_paths.add(self.path)
+            _update_attempts[self.path] = now
+        finally:
+            _updates_lock.release()
+
+        thread = threading.Thread(target=self._update_in_background)
+        thread.setDaemon(True)
+        thread.start()
+
+    def fetch(self, fetch_func, can_fall_back=True):
+        """Reads from the mirror.
+
+        ``fetch_func`` reads from the mirror, and raises FileNotFoundError
+        if the mirror doesn't have what was requested.
+
+        If the mirror hasn't been created yet or doesn't have what was
+        requested, it's updated in the background. This then returns None
+        when ``can_fall_back`` is True, so the caller can fetch from the
+        repository directly.
+
+        Otherwise, FileNotFoundError is raised if the mirror was just
+        updated, since what was requested doesn't exist. If the mirror may
+        be out of date, SCMError is raised instead, asking to try again
+        once it's updated.
+        """
+        if self.exists():
+            try:
+                return fetch_func()
+            except FileNotFoundError:
+                last_updated = self.get_last_updated()
+
+                if (not can_fall_back and
+                    last_updated and
+                    datetime.now() - last_updated <
+                    timedelta(seconds=MIN_UPDATE_INTERVAL)):
+                    raise
+
+        self.start_update()
+
+        if can_fall_back:
+            return None
+
+        raise SCMError(_('The local mirror of %s is being updated. Please '
+                         'try again in a few minutes.') % self.url)
+
+    def _update(self):
+        raise NotImplementedError
+
+    def _update_in_background(self):
+        try:
+            try:
+                self.update()
+            except Exception, e:
+                logging.error('Unable to update the local mirror %s of %s: '
+                              '%s' % (self.path, self.url, e))
+        finally:
+            _updates_lock.acquire()
+
+            try:
+                _updating_paths.discard(self.path)
+            finally:
+                _updates_lock.release()
+
+    def _lock(self):
+        """Locks the mirror for an update, across all processes.
+
+        Returns the lock file, to pass to _unlock.
+        """
+        if fcntl is None:
+            return None
+
+        parent_dir = os.path.dirname(self.path.rstrip(os.sep))
+
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir)
+
+        lock_file = open(self.path.rstrip(os.sep) + '.lock', 'w')
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+
+        return lock_file
+
+    def _unlock(self, lock_file):
+        if lock_file:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _run(self, args, env=None):
+        p = subprocess.Popen(args,
+                             stderr=subprocess.PIPE,
+                             stdout=subprocess.PIPE,
+                             close_fds=(os.name != 'nt'),
+                             env=env or sshutils.get_ssh_env())
+        errmsg = p.communicate()[1]
+
+        if p.returncode:
+            raise SCMError(errmsg)
+
+
+class GitMirror(LocalMirror):
+    """A bare local mirror of a remote Git repository."""
+    def _update(self):
+        if not os.path.exists(self.path):
+            self._run(['git', 'init', '--bare', '--quiet', self.path])
+
+        self._run(['git', '--git-dir=%s' % self.path, 'fetch', '--quiet',
+                   '--prune', self.url,
+                   '+refs/heads/*:refs/heads/*',
+                   '+refs/tags/*:refs/tags/*'])
+
+
+class HgMirror(LocalMirror):
+    """A local mirror, with no working copy, of a remote Mercurial
+    repository.
+    """
+    def _update(self):
+        if not os.path.exists(self.path):
+            self._run(['hg', 'init', self.path])
+
+        args = ['hg', '--repository', self.path, 'pull', '--quiet']
+
+        ssh_command = sshutils.get_ssh_command()
+
+        if ssh_command and sshutils.is_ssh_uri(self.url):
+            args += ['--config', 'ui.ssh=%s' % ssh_command]
+
+        if not self.username:
+            self._run(args + [self.url])
+            return
+
+        # The credentials are passed in a temporary configuration file,
+        # rather than on the command line where other users could see
+        # them. They're never stored in the mirror's configuration.
+        fd, hgrc_path = tempfile.mkstemp(suffix='.hgrc')
+
+        try:
+            f = os.fdopen(fd, 'w')
+            f.write('[auth]\n'
+                    'reviewboard.prefix = %s\n'
+                    'reviewboard.username = %s\n'
+                    'reviewboard.password = %s\n'
+                    % (self.url, self.username, self.password or ''))
+            f.close()
+
+            env = sshutils.get_ssh_env()
+            env['HGRCPATH'] = os.pathsep.join(
+                self._get_hgrc_paths() + [hgrc_path])
+
+            self._run(args + [self.url], env)
+        finally:
+            os.unlink(hgrc_path)
+
+    def _get_hgrc_paths(self):
+        """Returns the configuration files Mercurial would normally read.
+
+        Setting HGRCPATH replaces these, so they're listed along with the
+        temporary configuration file.
+        """
+        if 'HGRCPATH' in os.environ:
+            return os.environ['HGRCPATH'].split(os.pathsep)
+
+        return ['/etc/mercurial/hgrc',
+                '/etc/mercurial/hgrc.d',
+                os.path.expanduser('~/.hgrc')]
@@ -3,10 +3,16 @@ from django.core.exceptions import ImproperlyConfigured
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
+from reviewboard.reviews.access import get_user_repository_ids
 from reviewboard.scmtools.managers import RepositoryManager
+from reviewboard.scmtools.metrics import instrument_tool
 from reviewboard.site.models import LocalSite
 
 
+# The default number of seconds to wait for a file from a repository.
+DEFAULT_REPOSITORY_TIMEOUT = 30
+
+
 class Tool(models.Model):
     name = models.CharField(max_length=32, unique=True)
     class_name = models.CharField(max_length=128, unique=True)
@@ -50,6 +56,13 @@ class Repository(models.Model):
     tool = models.ForeignKey(Tool, related_name="repositories")
     bug_tracker = models.CharField(max_length=256, blank=True)
     encoding = models.CharField(max_length=32, blank=True)
+    timeout = models.PositiveIntegerField(
+        _('timeout'),
+        blank=True,
+        null=True,
+        help_text=_('The number of seconds to wait for a file from the '
+                    'repository before showing an error. The file continues '
+                    'to be fetched in the background.'))
     visible = models.BooleanField(default=True)
 
     # Access control
@@ -81,7 +94,13 @@ class Repository(models.Model):
 
     def get_scmtool(self):
         cls = self.tool.get_scmtool_class()
-        return cls(self)
+        return instrument_tool(cls(self))
+
+    def get_timeout(self):
+        """Returns the number of seconds to wait for a file from the
+        repository.
+        """
+        return self.timeout or DEFAULT_REPOSITORY_TIMEOUT
 
     def is_accessible_by(self, user):
         """Returns whether or not the user has access to the repository.
@@ -92,8 +111,7 @@ class Repository(models.Model):
         """
         return (self.public or
                 (user.is_authenticated() and
-                 (self.review_groups.filter(users__pk=user.pk).count() > 0 or
-                  self.users.filter(pk=user.pk).count() > 0)))
+                 self.pk in get_user_repository_ids(user)))
 
     def __unicode__(self):
         return self.name
@@ -1,9 +1,9 @@
 import os
-import subprocess
 
 from djblets.util.filesystem import is_exe_in_path
 
 from reviewboard.diffviewer.parser import DiffParser
+from reviewboard.scmtools import procutils
 from reviewboard.scmtools.core import SCMTool
 from reviewboard.scmtools.errors import FileNotFoundError, SCMError
 
@@ -21,7 +21,8 @@ class MonotoneTool(SCMTool):
     #    - Empty files cause the diff viewer to blow up.
     def __init__(self, repository):
         SCMTool.__init__(self, repository)
-        self.client = MonotoneClient(repository.path)
+        self.client = MonotoneClient(repository.path,
+                                     repository.get_timeout())
 
     def get_file(self, path, revision=None):
         # revision is actually the file id here...
@@ -71,13 +72,14 @@ class MonotoneDiffParser(DiffParser):
 
 
 class MonotoneClient:
-    def __init__(self, path):
+    def __init__(self, path, timeout=None):
         if not is_exe_in_path('mtn'):
             # This is technically not the right kind of error, but it's the
             # pattern we use with all the other tools.
             raise ImportError
 
         self.path = path
+        self.timeout = timeout
 
         if not os.path.isfile(self.path):
             raise SCMError("Repository %s does not exist" % path)
@@ -85,14 +87,7 @@ class MonotoneClient:
     def get_file(self, fileid):
         args = ['mtn', '-d', self.path, 'automate', 'get_file', fileid]
 
-        p = subprocess.Popen(args,
-                             stderr=subprocess.PIPE,
-                             stdout=subprocess.PIPE,
-                             close_fds=(os.name != 'nt'))
-
-        out = p.stdout.read()
-        err = p.stderr.read()
-        failure = p.wait()
+        out, err, failure = procutils.run_command(args, timeout=self.timeout)
 
         if not failure:
             return out
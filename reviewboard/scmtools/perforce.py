@@ -1,5 +1,4 @@
 import re
-import subprocess
 
 try:
     from P4 import P4Error
@@ -7,6 +6,7 @@ except ImportError:
     pass
 
 from reviewboard.diffviewer.parser import DiffParser
+from reviewboard.scmtools import procutils
 from reviewboard.scmtools.core import SCMTool, ChangeSet, \
                                       HEAD, PRE_CREATION
 from reviewboard.scmtools.errors import SCMError, EmptyChangeSetError
@@ -88,10 +88,8 @@ class PerforceTool(SCMTool):
             cmdline.extend(['-P', self.p4.password])
         cmdline.extend(['print', '-q', file])
 
-        p = subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        (res, errdata) = p.communicate()
-        failure = p.poll()
+        res, errdata, failure = procutils.run_command(
+            cmdline, timeout=self.repository.get_timeout())
 
         if failure:
             error = errdata.splitlines()
@@ -0,0 +1,62 @@
+import os
+import signal
+import subprocess
+import threading
+
+from django.utils.translation import ugettext as _
+
+from reviewboard.scmtools.errors import SCMError
+
+
+def run_command(args, timeout=None, **kwargs):
+    """Runs a command line tool, returning its output.
+
+    This returns a tuple of the command's stdout, stderr and exit code. Any
+    other keyword arguments are passed to subprocess.Popen.
+
+    If ``timeout`` is given and the command is still running after that
+    many seconds, it's killed and SCMError is raised. This keeps a hung
+    repository from tying up the process running the command forever.
+    """
+    p = subprocess.Popen(args,
+                         stderr=subprocess.PIPE,
+                         stdout=subprocess.PIPE,
+                         close_fds=(os.name != 'nt'),
+                         **kwargs)
+    timed_out = []
+
+    if timeout:
+        def kill():
+            timed_out.append(True)
+            _kill(p)
+
+        timer = threading.Timer(timeout, kill)
+        timer.setDaemon(True)
+        timer.start()
+
+    try:
+        stdout, stderr = p.communicate()
+    finally:
+        if timeout:
+            timer.cancel()
+
+    if timed_out:
+        raise SCMError(_('%(command)s did not finish within %(timeout)s '
+                         'seconds.') % {
+            'command': args[0],
+            'timeout': timeout,
+        })
+
+    return stdout, stderr, p.returncode
+
+
+def _kill(p):
+    try:
+        if hasattr(p, 'kill'):
+            p.kill()
+        else:
+            # Python 2.5 doesn't have Popen.kill.
+            os.kill(p.pid, signal.SIGKILL)
+    except OSError:
+        # The process already exited.
+        pass
@@ -1,4 +1,5 @@
 import os
+import subprocess
 import urlparse
 
 from django.utils.translation import ugettext_lazy as _
@@ -12,6 +13,9 @@ from reviewboard.scmtools.errors import AuthenticationError, \
 # A list of known SSH URL schemes.
 ssh_uri_schemes = ["ssh", "sftp"]
 
+# The number of seconds that idle SSH connections are kept open.
+SSH_IDLE_TIMEOUT = 60
+
 urlparse.uses_netloc.extend(ssh_uri_schemes)
 
 
@@ -123,6 +127,58 @@ def replace_host_key(hostname, old_key, new_key):
             })
 
 
+_ssh_supports_multiplexing = None
+
+
+def get_ssh_command():
+    """Returns the ssh command line to use for SCM command line tools.
+
+    This enables OpenSSH's connection multiplexing, so repeated operations
+    against the same host (such as updating local mirrors) reuse one
+    connection, which is kept open while idle for SSH_IDLE_TIMEOUT seconds.
+
+    This is None if the installed ssh doesn't support multiplexing.
+    """
+    global _ssh_supports_multiplexing
+
+    if _ssh_supports_multiplexing is None:
+        try:
+            p = subprocess.Popen(['ssh', '-o', 'ControlPersist=no', '-V'],
+                                 stderr=subprocess.PIPE,
+                                 stdout=subprocess.PIPE,
+                                 close_fds=(os.name != 'nt'))
+            p.communicate()
+            _ssh_supports_multiplexing = (p.returncode == 0)
+        except OSError:
+            _ssh_supports_multiplexing = False
+
+    if not _ssh_supports_multiplexing:
+        return None
+
+    return ('ssh -o ControlMaster=auto -o ControlPersist=%d '
+            '-o "ControlPath=%s"'
+            % (SSH_IDLE_TIMEOUT,
+               os.path.join(os.path.dirname(get_host_keys_filename()),
+                            'reviewboard-%r@%h:%p')))
+
+
+def get_ssh_env():
+    """Returns an environment for running SCM command line tools over SSH.
+
+    This sets GIT_SSH_COMMAND to the command from get_ssh_command, unless
+    it's already set. Only git 2.3 and newer read it. Other tools, and
+    paramiko connections such as those made by check_host, don't share
+    connections.
+    """
+    env = os.environ.copy()
+    ssh_command = get_ssh_command()
+
+    if ssh_command:
+        env.setdefault('GIT_SSH_COMMAND', ssh_command)
+
+    return env
+
+
 def check_host(hostname, username=None, password=None):
     """
     Checks if we can connect to a host with a known key.
@@ -136,6 +192,7 @@ def check_host(hostname, username=None, password=None):
 
     try:
         client.connect(hostname, username=username, password=password)
+        client.close()
     except paramiko.BadHostKeyException, e:
         raise BadHostKeyError(e.hostname, e.key, e.expected_key)
     except paramiko.AuthenticationException, e:
@@ -5,11 +5,13 @@ import urllib
 import urlparse
 
 try:
-    from pysvn import ClientError, Revision, opt_revision_kind
+    from pysvn import ClientError, Revision, depth, opt_revision_kind
 except ImportError:
     pass
 
+from django.utils.http import urlquote
 from django.utils.translation import ugettext as _
+from djblets.util.misc import cache_memoize
 
 from reviewboard.diffviewer.parser import DiffParser
 from reviewboard.scmtools import sshutils
@@ -67,6 +69,10 @@ class SVNTool(SCMTool):
         'URL':                 URL_KEYWORDS,
     }
 
+    # Compiled regexes used to collapse keywords, keyed on the keywords.
+    # These are shared across all instances.
+    keyword_regexes = {}
+
     def __init__(self, repository):
         self.repopath = repository.path
         if self.repopath[-1] == '/':
@@ -103,17 +109,7 @@ class SVNTool(SCMTool):
             raise FileNotFoundError(path, revision)
 
         try:
-            normpath = self.__normalize_path(path)
-
-            # SVN expects to have URLs escaped. Take care to only
-            # escape the path part of the URL.
-            if self.client.is_url(normpath):
-                pathtuple = urlparse.urlsplit(normpath)
-                normpath = urlparse.urlunsplit((pathtuple[0],
-                                                pathtuple[1],
-                                                urllib.quote(pathtuple[2]),
-                                                '',''))
-
+            normpath = self.__normalize_url(path)
             normrev  = self.__normalize_revision(revision)
 
             data = self.client.cat(normpath, normrev)
@@ -121,11 +117,10 @@ class SVNTool(SCMTool):
             # Find out if this file has any keyword expansion set.
             # If it does, collapse these keywords. This is because SVN
             # will return the file expanded to us, which would break patching.
-            keywords = self.client.propget("svn:keywords", normpath, normrev,
-                                           recurse=True)
+            keywords = self.__get_keywords(normpath, revision, normrev)
 
-            if normpath in keywords:
-                data = self.collapse_keywords(data, keywords[normpath])
+            if keywords:
+                data = self.collapse_keywords(data, keywords)
 
             return data
         except ClientError, e:
@@ -164,13 +159,67 @@ class SVNTool(SCMTool):
 
             return "$%s$" % m.group(1)
 
-        # Get any aliased keywords
-        keywords = [keyword
-                    for name in keyword_str.split(" ")
-                    for keyword in self.keywords.get(name, [])]
+        names = keyword_str.split()
+        names.sort()
+        regex_key = " ".join(names)
+
+        try:
+            regex = self.keyword_regexes[regex_key]
+        except KeyError:
+            # Get any aliased keywords
+            keywords = [keyword
+                        for name in names
+                        for keyword in self.keywords.get(name, [])]
+
+            if keywords:
+                regex = re.compile(r"\$(%s):(:?)([^\$\n\r]+)\$" %
+                                   '|'.join(keywords))
+            else:
+                regex = None
+
+            self.keyword_regexes[regex_key] = regex
+
+        if regex is None:
+            return data
+
+        return regex.sub(repl, data)
+
+    def prefetch_files(self, files):
+        """
+        Looks up the svn:keywords properties for a list of files.
+
+        get_file needs the keywords set on a file in order to collapse them,
+        which is a second request to the server for every file. This looks
+        up the keywords for all the files in a directory at a revision with
+        a single request, and caches the results for get_file. Files at HEAD
+        are skipped, since their properties may change.
+        """
+        dirs = {}
+
+        for path, revision in files:
+            if (not path or revision == HEAD or revision == PRE_CREATION or
+                revision == UNKNOWN):
+                continue
+
+            normpath = self.__normalize_url(path)
+            dirname = normpath.rsplit('/', 1)[0]
+            dirs.setdefault((dirname, str(revision)), []).append(normpath)
+
+        for (dirname, revision), normpaths in dirs.iteritems():
+            try:
+                props = self.client.propget("svn:keywords", dirname,
+                                            self.__normalize_revision(revision),
+                                            depth=depth.files)
+            except ClientError, e:
+                # get_file will look up the keywords itself.
+                logging.warning("Unable to look up svn:keywords in %s at "
+                                "revision %s: %s" % (dirname, revision, e))
+                continue
 
-        return re.sub(r"\$(%s):(:?)([^\$\n\r]+)\$" % '|'.join(keywords),
-                      repl, data)
+            for normpath in normpaths:
+                cache_memoize(self.__get_keywords_cache_key(normpath, revision),
+                              lambda: self.__find_keywords(props, normpath),
+                              force_overwrite=True)
 
 
     def parse_diff_revision(self, file_str, revision_str):
@@ -237,6 +286,56 @@ class SVNTool(SCMTool):
 
         return r
 
+    def __get_keywords(self, normpath, revision, normrev):
+        """
+        Returns the svn:keywords property of a file.
+
+        The properties of a file at a given revision never change, so they're
+        cached. Properties at HEAD are always looked up.
+        """
+        def fetch_keywords():
+            props = self.client.propget("svn:keywords", normpath, normrev,
+                                        recurse=False)
+            return self.__find_keywords(props, normpath)
+
+        if revision == HEAD:
+            return fetch_keywords()
+
+        return cache_memoize(self.__get_keywords_cache_key(normpath, revision),
+                             fetch_keywords)
+
+    def __get_keywords_cache_key(self, normpath, revision):
+        return "svn-keywords:%s:%s" % (urlquote(normpath), revision)
+
+    def __find_keywords(self, props, normpath):
+        """
+        Returns the keywords for a file from the results of a propget.
+
+        SVN may escape the paths it returns differently than we do, so
+        they're compared unescaped.
+        """
+        normpath = urllib.unquote(normpath)
+
+        for path, keywords in props.iteritems():
+            if urllib.unquote(path) == normpath:
+                return keywords
+
+        return ""
+
+    def __normalize_url(self, path):
+        normpath = self.__normalize_path(path)
+
+        # SVN expects to have URLs escaped. Take care to only
+        # escape the path part of the URL.
+        if self.client.is_url(normpath):
+            pathtuple = urlparse.urlsplit(normpath)
+            normpath = urlparse.urlunsplit((pathtuple[0],
+                                            pathtuple[1],
+                                            urllib.quote(pathtuple[2]),
+                                            '',''))
+
+        return normpath
+
     def __normalize_path(self, path):
         if path.startswith(self.repopath):
             return path
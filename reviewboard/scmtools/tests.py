@@ -1,5 +1,12 @@
+import BaseHTTPServer
 import imp
 import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import urllib2
+
 import nose
 
 from django.contrib.auth.models import AnonymousUser, User
@@ -13,9 +20,11 @@ except ImportError:
 from reviewboard.diffviewer.diffutils import patch
 from reviewboard.diffviewer.parser import DiffParserError
 from reviewboard.reviews.models import Group
+from reviewboard.scmtools import httputils, metrics
 from reviewboard.scmtools.core import HEAD, PRE_CREATION, ChangeSet, Revision
 from reviewboard.scmtools.errors import SCMError, FileNotFoundError
-from reviewboard.scmtools.git import ShortSHA1Error
+from reviewboard.scmtools.git import GitClient, ShortSHA1Error
+from reviewboard.scmtools.mirrors import GitMirror
 from reviewboard.scmtools.models import Repository, Tool
 
 
@@ -102,6 +111,18 @@ class CVSTests(DjangoTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file('hello', PRE_CREATION))
 
+    def testCatFiles(self):
+        """Testing CVSClient.cat_files"""
+        files = self.tool.client.cat_files(['test/testfile',
+                                            'test/testfile,v',
+                                            'test/testfile2'],
+                                           Revision('1.1'))
+
+        self.assertEqual(files, {
+            'test/testfile': "test content\n",
+            'test/testfile,v': "test content\n",
+        })
+
     def testRevisionParsing(self):
         """Testing revision number parsing"""
         self.assertEqual(self.tool.parse_diff_revision('', 'PRE-CREATION')[1],
@@ -329,6 +350,37 @@ class SubversionTests(DjangoTestCase):
         file = self.tool.get_file(filename, rev)
         patch(diff, file, filename)
 
+    def testPrefetchKeywords(self):
+        """Testing SVNTool.prefetch_files with keywords"""
+        diff = "Index: Makefile\n" \
+               "===========================================================" \
+               "========\n" \
+               "--- Makefile    (revision 4)\n" \
+               "+++ Makefile    (working copy)\n" \
+               "@@ -1,6 +1,7 @@\n" \
+               " # $Id$\n" \
+               " # $Rev$\n" \
+               " # $Revision::     $\n" \
+               "+# foo\n" \
+               " include ../tools/Makefile.base-vars\n" \
+               " NAME = misc-docs\n" \
+               " OUTNAME = svn-misc-docs\n"
+
+        filename = 'trunk/doc/misc-docs/Makefile'
+        rev = Revision('4')
+        self.tool.prefetch_files([(filename, rev),
+                                  ('trunk/doc/misc-docs/missing', rev)])
+        file = self.tool.get_file(filename, rev)
+        patch(diff, file, filename)
+
+    def testCollapseKeywords(self):
+        """Testing SVNTool.collapse_keywords"""
+        data = '$Id: Makefile 4 $\n$Rev:: 123  $\n$Author: user $\n'
+
+        self.assertEqual(self.tool.collapse_keywords(data, 'Id  Revision'),
+                         '$Id$\n$Rev::      $\n$Author: user $\n')
+        self.assertEqual(self.tool.collapse_keywords(data, 'Unknown'), data)
+
 
 class PerforceTests(DjangoTestCase):
     """Unit tests for perforce.
@@ -907,6 +959,27 @@ class GitTests(DjangoTestCase):
         self.assertRaises(FileNotFoundError,
                           lambda: self.tool.get_file("readme", "0000000"))
 
+    def testGetFileWithLocalMirror(self):
+        """Testing GitClient.get_file with a local mirror"""
+        tempdir = tempfile.mkdtemp()
+        local_repo_path = os.path.join(os.path.dirname(__file__),
+                                       'testdata', 'git_repo')
+
+        try:
+            client = GitClient('git@example.com:reviewboard.git')
+            client.mirror = GitMirror(os.path.join(tempdir, 'mirror'),
+                                      'file://' + local_repo_path)
+            self.assert_(not client.mirror.exists())
+
+            client.mirror.update()
+            self.assert_(client.mirror.exists())
+
+            self.assertEqual(client.get_file("readme", "e965047"), 'Hello\n')
+            self.assert_(client.get_file_exists("readme", "d6613f5"))
+            self.assert_(not client.get_file_exists("readme", "0000000"))
+        finally:
+            shutil.rmtree(tempdir)
+
     def testParseDiffRevisionWithRemoteAndShortSHA1Error(self):
         """Testing GitTool.parse_diff_revision with remote files and short SHA1 error"""
         self.assertRaises(
@@ -920,6 +993,140 @@ class GitTests(DjangoTestCase):
             lambda: self.remote_tool.get_file('README', 'd7e96b3'))
 
 
+class HTTPUtilsTests(DjangoTestCase):
+    """Unit tests for the scmtools.httputils module."""
+
+    def setUp(self):
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(handler):
+                self.clients.add(handler.client_address)
+
+                if handler.path == '/file':
+                    handler.send_response(200)
+                    handler.send_header('Content-Length', '4')
+                elif handler.path == '/redirect':
+                    handler.send_response(302)
+                    handler.send_header('Location', '/file')
+                    handler.send_header('Content-Length', '0')
+                else:
+                    handler.send_response(404)
+                    handler.send_header('Content-Length', '0')
+
+                handler.end_headers()
+
+            def do_GET(handler):
+                handler.do_HEAD()
+
+                if handler.path == '/file':
+                    handler.wfile.write('data')
+
+            def log_message(handler, *args):
+                pass
+
+        class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+            daemon_threads = True
+
+        self.clients = set()
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%s' % self.server.server_address[1]
+        self.pool = httputils.HTTPConnectionPool()
+
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.setDaemon(True)
+        thread.start()
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+
+    def testConnectionReuse(self):
+        """Testing HTTPConnectionPool reusing connections"""
+        for i in range(3):
+            response = self.pool.request(self.url + '/file')
+            self.assertEqual(response.read(), 'data')
+
+        self.assertEqual(len(self.clients), 1)
+
+    def testHead(self):
+        """Testing HTTPConnectionPool with HEAD requests"""
+        response = self.pool.request(self.url + '/file', method='HEAD')
+        self.assertEqual(response.read(), '')
+        self.assertEqual(response.status, 200)
+
+    def testRedirect(self):
+        """Testing HTTPConnectionPool following redirects"""
+        response = self.pool.request(self.url + '/redirect')
+        self.assertEqual(response.read(), 'data')
+        self.assertEqual(response.geturl(), self.url + '/file')
+
+    def testNotFound(self):
+        """Testing HTTPConnectionPool with a missing file"""
+        try:
+            self.pool.request(self.url + '/missing')
+            self.fail('Expected HTTPError')
+        except urllib2.HTTPError, e:
+            self.assertEqual(e.code, 404)
+
+        # The connection should still be reused after an error.
+        self.pool.request(self.url + '/file')
+        self.assertEqual(len(self.clients), 1)
+
+
+class MetricsTests(DjangoTestCase):
+    """Unit tests for the scmtools.metrics module."""
+    fixtures = ['test_scmtools']
+
+    def testInstrumentTool(self):
+        """Testing instrument_tool recording calls to an SCMTool"""
+        class FakeTool(object):
+            def __init__(self, repository):
+                self.repository = repository
+
+            def get_file(self, path, revision=HEAD):
+                if path == '/missing':
+                    raise FileNotFoundError(path, revision)
+
+                return 'data'
+
+            def file_exists(self, path, revision=HEAD):
+                try:
+                    self.get_file(path, revision)
+                    return True
+                except FileNotFoundError:
+                    return False
+
+            def get_changeset(self, changesetid):
+                raise SCMError('Unable to connect')
+
+        repository = Repository.objects.create(
+            name='Metrics test',
+            path='/metrics-test',
+            tool=Tool.objects.get(name='Subversion'))
+        tool = metrics.instrument_tool(FakeTool(repository))
+
+        self.assertEqual(tool.get_file('/foo'), 'data')
+        self.assertRaises(FileNotFoundError,
+                          lambda: tool.get_file('/missing'))
+        self.assert_(tool.file_exists('/foo'))
+        self.assertRaises(SCMError, lambda: tool.get_changeset(1))
+
+        scope = metrics.get_repository_scope(repository)
+        result = metrics.get_metrics([scope])[scope]
+
+        self.assertEqual(result['get_file']['calls'], 2)
+        self.assertEqual(result['get_file']['errors'], 0)
+        self.assertEqual(result['file_exists']['calls'], 1)
+        self.assertEqual(result['get_changeset']['calls'], 1)
+        self.assertEqual(result['get_changeset']['errors'], 1)
+        self.assertEqual(result['get_changeset']['error_rate'], 1)
+        self.assertEqual(sum([count for bound, count
+                              in result['get_file']['latency']]),
+                         2)
+        self.assertEqual(result['check_repository']['calls'], 0)
+
+
 class PolicyTests(DjangoTestCase):
     fixtures = ['test_scmtools']
 
@@ -13,6 +13,7 @@ from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext as _
 from django.views.decorators.http import require_POST
 
+from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.misc import get_object_or_none
 from djblets.webapi.core import WebAPIResponse, \
                                 WebAPIResponseError, \
@@ -27,12 +28,13 @@ from djblets.webapi.errors import PERMISSION_DENIED, DOES_NOT_EXIST, \
 from reviewboard import get_version_string, get_package_version, is_release
 from reviewboard.accounts.models import Profile
 from reviewboard.diffviewer.forms import EmptyDiffError
-from reviewboard.diffviewer.models import FileDiff, DiffSet
+from reviewboard.diffviewer.models import FileDiff
 from reviewboard.reviews.forms import UploadDiffForm, UploadScreenshotForm
 from reviewboard.reviews.errors import PermissionError
 from reviewboard.reviews.models import ReviewRequest, Review, Group, Comment, \
                                        ReviewRequestDraft, Screenshot, \
                                        ScreenshotComment
+from reviewboard.reviews.updates import wait_for_activity
 from reviewboard.scmtools.core import FileNotFoundError
 from reviewboard.scmtools.errors import ChangeNumberInUseError, \
                                         EmptyChangeSetError, \
@@ -368,36 +370,37 @@ def review_request_last_update(request, review_request_id, *args, **kwargs):
     This does not take into account changes to a draft review request, as
     that's generally not update information that the owner of the draft is
     interested in.
+
+    If long polling is enabled and a ``since`` timestamp is passed, this
+    waits for an update newer than that before returning.
     """
-    review_request = get_object_or_404(ReviewRequest, pk=review_request_id)
+    review_request = get_object_or_404(
+        ReviewRequest.objects.select_related('last_activity_user'),
+        pk=review_request_id)
 
     if not review_request.is_accessible_by(request.user):
         return WebAPIResponseError(request, PERMISSION_DENIED)
 
-    timestamp, updated_object = review_request.get_last_activity()
-    user = None
-    summary = None
-    update_type = None
+    siteconfig = SiteConfiguration.objects.get_current()
+
+    if 'since' in request.GET and siteconfig.get('updates_long_polling'):
+        review_request = wait_for_activity(review_request,
+                                           request.GET['since'])
 
-    if isinstance(updated_object, ReviewRequest):
-        user = updated_object.submitter
+    timestamp, update_type = review_request.get_last_activity()
+    user = review_request.last_activity_user
+
+    if update_type == ReviewRequest.ACTIVITY_REVIEW_REQUEST:
         summary = _("Review request updated")
-        update_type = "review-request"
-    elif isinstance(updated_object, DiffSet):
+    elif update_type == ReviewRequest.ACTIVITY_DIFF:
         summary = _("Diff updated")
-        update_type = "diff"
-    elif isinstance(updated_object, Review):
-        user = updated_object.user
-
-        if updated_object.is_reply():
-            summary = _("New reply")
-            update_type = "reply"
-        else:
-            summary = _("New review")
-            update_type = "review"
+    elif update_type == ReviewRequest.ACTIVITY_REPLY:
+        summary = _("New reply")
+    elif update_type == ReviewRequest.ACTIVITY_REVIEW:
+        summary = _("New review")
     else:
-        # Should never be able to happen. The object will always at least
-        # be a ReviewRequest.
+        # Should never be able to happen. The activity type is always
+        # recorded along with the activity.
         assert False
 
     return WebAPIResponse(request, {
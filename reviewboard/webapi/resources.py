@@ -9,13 +9,14 @@ from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.db.models import Q
-from django.http import HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, \
+                        HttpResponseNotModified
 from django.template.defaultfilters import timesince
 from django.utils.translation import ugettext as _
 from djblets.siteconfig.models import SiteConfiguration
 from djblets.util.decorators import augment_method_from
 from djblets.util.http import get_http_requested_mimetype, \
-                              set_last_modified
+                              get_modified_since, set_last_modified
 from djblets.webapi.core import WebAPIResponseFormError, \
                                 WebAPIResponsePaginated, \
                                 WebAPIResponse
@@ -34,12 +35,15 @@ from reviewboard import get_version_string, get_package_version, is_release
 from reviewboard.accounts.models import Profile
 from reviewboard.diffviewer.diffutils import get_diff_files
 from reviewboard.diffviewer.forms import EmptyDiffError
+from reviewboard.diffviewer.views import build_compressible_response
+from reviewboard.reviews.access import filter_accessible
 from reviewboard.reviews.errors import PermissionError
 from reviewboard.reviews.forms import UploadDiffForm, UploadScreenshotForm
 from reviewboard.reviews.models import Comment, DiffSet, FileDiff, Group, \
                                        Repository, ReviewRequest, \
                                        ReviewRequestDraft, Review, \
                                        ScreenshotComment, Screenshot
+from reviewboard.reviews.updates import wait_for_activity
 from reviewboard.scmtools.errors import ChangeNumberInUseError, \
                                         EmptyChangeSetError, \
                                         FileNotFoundError, \
@@ -1006,10 +1010,15 @@ class DiffResource(WebAPIResource):
         except ObjectDoesNotExist:
             return DOES_NOT_EXIST
 
-        tool = review_request.repository.get_scmtool()
-        data = tool.get_parser('').raw_diff(diffset)
+        # The diff is streamed, so ConditionalGetMiddleware won't handle this.
+        if get_modified_since(request, diffset.timestamp):
+            return HttpResponseNotModified()
 
-        resp = HttpResponse(data, mimetype='text/x-patch')
+        tool = review_request.repository.get_scmtool()
+        resp = build_compressible_response(
+            request, 'diffset-raw-diff-%s' % diffset.id,
+            lambda: tool.get_parser('').iter_raw_diff(diffset),
+            mimetype='text/x-patch', streaming=True)
 
         if diffset.name == 'diff':
             filename = 'bug%s.patch' % \
@@ -3538,6 +3547,16 @@ class ReviewRequestLastUpdateResource(WebAPIResource):
     }
 
     @webapi_check_login_required
+    @webapi_request_fields(optional={
+        'since': {
+            'type': str,
+            'description': 'The timestamp of the last update the client '
+                           'knows about (YYYY-MM-DD HH:MM:SS format). If '
+                           'long polling is enabled on the server, this '
+                           'waits for a newer update before returning, '
+                           'for up to a few minutes.',
+        },
+    })
     def get(self, request, *args, **kwargs):
         """Returns the last update made to the review request.
 
@@ -3550,9 +3569,13 @@ class ReviewRequestLastUpdateResource(WebAPIResource):
         that's generally not update information that the owner of the draft is
         interested in. Only public updates are represented.
         """
+        # The last activity's user is loaded along with the review request,
+        # since this is polled often.
         try:
-            review_request = \
-                review_request_resource.get_object(request, *args, **kwargs)
+            review_request = review_request_resource.get_queryset(
+                    request, *args, **kwargs) \
+                .select_related('last_activity_user') \
+                .get(pk=kwargs['review_request_id'])
         except ObjectDoesNotExist:
             return DOES_NOT_EXIST
 
@@ -3560,30 +3583,26 @@ class ReviewRequestLastUpdateResource(WebAPIResource):
                                                               review_request):
             return PERMISSION_DENIED
 
-        timestamp, updated_object = review_request.get_last_activity()
-        user = None
-        summary = None
-        update_type = None
+        siteconfig = SiteConfiguration.objects.get_current()
+
+        if 'since' in request.GET and siteconfig.get('updates_long_polling'):
+            review_request = wait_for_activity(review_request,
+                                               request.GET['since'])
+
+        timestamp, update_type = review_request.get_last_activity()
+        user = review_request.last_activity_user
 
-        if isinstance(updated_object, ReviewRequest):
-            user = updated_object.submitter
+        if update_type == ReviewRequest.ACTIVITY_REVIEW_REQUEST:
             summary = _("Review request updated")
-            update_type = "review-request"
-        elif isinstance(updated_object, DiffSet):
+        elif update_type == ReviewRequest.ACTIVITY_DIFF:
             summary = _("Diff updated")
-            update_type = "diff"
-        elif isinstance(updated_object, Review):
-            user = updated_object.user
-
-            if updated_object.is_reply():
-                summary = _("New reply")
-                update_type = "reply"
-            else:
-                summary = _("New review")
-                update_type = "review"
+        elif update_type == ReviewRequest.ACTIVITY_REPLY:
+            summary = _("New reply")
+        elif update_type == ReviewRequest.ACTIVITY_REVIEW:
+            summary = _("New review")
         else:
-            # Should never be able to happen. The object will always at least
-            # be a ReviewRequest.
+            # Should never be able to happen. The activity type is always
+            # recorded along with the activity.
             assert False
 
         return 200, {
@@ -3699,7 +3718,8 @@ class ReviewRequestResource(WebAPIResource):
         """Returns a queryset for ReviewRequest models.
 
         By default, this returns all published or formerly published
-        review requests.
+        review requests. Lists only include the review requests that the
+        user has access to.
 
         If the queryset is being used for a list of review request
         resources, then it can be further filtered by one or more of the
@@ -3777,6 +3797,8 @@ class ReviewRequestResource(WebAPIResource):
         q = Q()
 
         if is_list:
+            status = string_to_status(request.GET.get('status', 'pending'))
+
             if 'to-groups' in request.GET:
                 for group_name in request.GET.get('to-groups').split(','):
                     q = q & self.model.objects.get_to_group_query(group_name,
@@ -3784,17 +3806,18 @@ class ReviewRequestResource(WebAPIResource):
 
             if 'to-users' in request.GET:
                 for username in request.GET.get('to-users').split(','):
-                    q = q & self.model.objects.get_to_user_query(username)
+                    q = q & self.model.objects.get_to_user_query(username,
+                                                                 status)
 
             if 'to-users-directly' in request.GET:
                 for username in request.GET.get('to-users-directly').split(','):
                     q = q & self.model.objects.get_to_user_directly_query(
-                        username)
+                        username, status)
 
             if 'to-users-groups' in request.GET:
                 for username in request.GET.get('to-users-groups').split(','):
                     q = q & self.model.objects.get_to_user_groups_query(
-                        username)
+                        username, status)
 
             if 'from-user' in request.GET:
                 q = q & self.model.objects.get_from_user_query(
@@ -3830,10 +3853,10 @@ class ReviewRequestResource(WebAPIResource):
                 if date:
                     q = q & Q(last_updated__lt=date)
 
-            status = string_to_status(request.GET.get('status', 'pending'))
-
-            return self.model.objects.public(user=request.user, status=status,
-                                             extra_query=q)
+            return filter_accessible(
+                self.model.objects.public(user=request.user, status=status,
+                                          extra_query=q),
+                request.user)
         else:
             return self.model.objects.all()
 